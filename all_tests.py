@@ -1,6 +1,17 @@
-from lexer_test import LexerTest
+from lexer_test import LexerTest, SplitLinesTest
+from scanner_test import ScannerTest
 from parser_test import ParserTest
 from interpreter_test import InterpreterTest
+from frontend_test import FrontendTest
+from closure_compiler_test import ClosureEngineTest
+from vm_test import BytecodeEngineTest, BytecodeCompilerTest
+from resolver_test import ResolverTest
+from optimizer_test import OptimizerTest
+from ast_cache_test import AstCacheTest
+from lru_cache_test import LruCacheTest
+from profiler_test import ProfilerTest
+from limits_test import BudgetTest
+from builtin_types_test import IntListTest, InternedStrTest, ListSliceTest
 import unittest
 
 if __name__ == '__main__':
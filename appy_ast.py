@@ -1,117 +1,381 @@
 from collections import namedtuple
 
 
-class Seq(namedtuple('Seq', ['left', 'right'])):
+# Source positions are packed into a single int holding the line number
+# (starting at 1) above the column (starting at 0), so that every AST
+# node can carry one without allocating anything.
+COLUMN_BITS = 32
+COLUMN_MASK = (1 << COLUMN_BITS) - 1
+
+
+def pack_position(lineno, column):
+    return lineno << COLUMN_BITS | column
+
+
+def position_lineno(position):
+    return position >> COLUMN_BITS
+
+
+def position_column(position):
+    return position & COLUMN_MASK
+
+
+class Node(object):
+    """Base class of all AST nodes. Every node is a namedtuple whose last
+    field is its packed source position, or None if the node wasn't
+    parsed from source. Positions are ignored when comparing nodes.
+    """
+    __slots__ = ()
+
+    def __eq__(self, other):
+        if not isinstance(other, Node):
+            return NotImplemented
+        return (self.__class__ is other.__class__ and
+                self[:-1] == other[:-1])
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __hash__(self):
+        return hash(self[:-1])
+
+
+def node_type(name, fields):
+    """
+    Creates the namedtuple for an AST node with the given fields,
+    followed by a position field that defaults to None.
+    """
+    node_tuple = namedtuple(name, fields + ['position'])
+    node_tuple.__new__.__defaults__ = (None,)
+    return node_tuple
+
+
+class Block(Node, node_type('Block', ['statements'])):
+    """
+    statements is a tuple of two or more statements, run in order.
+    """
     def pretty_print(self):
-        return self.left.pretty_print() + '\n' + self.right.pretty_print()
+        return '\n'.join(statement.pretty_print()
+                         for statement in self.statements)
 
 
-class Assignment(namedtuple('Assignment', ['left', 'right'])):
+class Assignment(Node, node_type('Assignment', ['left', 'right'])):
     def pretty_print(self):
         return self.left.pretty_print() + ' = ' + self.right.pretty_print()
 
 
-class ExpressionStatement(namedtuple('ExpressionStatement', ['expr'])):
+class ExpressionStatement(Node, node_type('ExpressionStatement', ['expr'])):
     def pretty_print(self):
         return self.expr.pretty_print()
 
 
-class PassStatement(namedtuple('PassStatement', [])):
+class PassStatement(Node, node_type('PassStatement', [])):
     def pretty_print(self):
         return 'pass'
 
 
-class PrintStatement(namedtuple('PrintStatement', ['expr'])):
+class PrintStatement(Node, node_type('PrintStatement', ['expr'])):
     def pretty_print(self):
         return 'print ' + self.expr.pretty_print()
 
 
-class IfStatement(namedtuple('IfStatement', ['condition', 'statement'])):
+class ReturnStatement(Node, node_type('ReturnStatement', ['expr'])):
+    """
+    Ends the function call that it runs in with the value of expr, which
+    is the None literal for a bare return.
+    """
+    def pretty_print(self):
+        return 'return ' + self.expr.pretty_print()
+
+
+class IfStatement(Node, node_type('IfStatement',
+                                   ['condition', 'statement'])):
     def pretty_print(self):
         return ('if ' + self.condition.pretty_print() + ':\n\t' +
                 self.statement.pretty_print())
 
 
-class WhileStatement(namedtuple('WhileStatement', ['condition', 'statement'])):
+class WhileStatement(Node, node_type('WhileStatement',
+                                      ['condition', 'statement'])):
     def pretty_print(self):
         return ('while ' + self.condition.pretty_print() + ':\n\t' +
                 self.statement.pretty_print())
 
 
-class DefStatement(namedtuple('DefStatement',
-                              ['name', 'param_names', 'body'])):
+class ForStatement(Node, node_type('ForStatement',
+                                    ['target', 'iterable', 'statement'])):
+    """
+    Runs statement once for each value of iterable, after assigning the
+    value to target, which is any assignable expression.
+    """
+    def pretty_print(self):
+        return ('for ' + self.target.pretty_print() + ' in ' +
+                self.iterable.pretty_print() + ':\n\t' +
+                self.statement.pretty_print())
+
+
+class DefStatement(Node, node_type('DefStatement',
+                                    ['name', 'param_names', 'body',
+                                     'local_names', 'captures_scope'])):
     """
     param_names is a list of strings for the parameter names.
     body is any statement.
+    local_names is a tuple of the names of all local variables, starting
+        with the parameters, where each LocalVariable index refers to a
+        position in this tuple.
+    captures_scope is whether the body defines functions or classes,
+        which keep a reference to the scope of the call that created
+        them.
+    local_names and captures_scope are None until the AST has been
+    resolved (see resolver.py).
     """
+    def __new__(cls, name, param_names, body, local_names=None,
+                captures_scope=None, position=None):
+        return super(DefStatement, cls).__new__(
+            cls, name, param_names, body, local_names, captures_scope,
+            position)
+
     def pretty_print(self):
         return ('def ' + self.name + '(' + ','.join(self.param_names) +
                 '):\n\t' + self.body.pretty_print())
 
 
-class ClassStatement(namedtuple('ClassStatement',
-                                ['name', 'superclass', 'body'])):
+class ClassStatement(Node, node_type('ClassStatement',
+                                      ['name', 'superclass', 'body'])):
     def pretty_print(self):
         return ('class ' + self.name + '(' + self.superclass.pretty_print() +
             '):\n\t' + self.body.pretty_print())
 
 
-class BinaryOperator(namedtuple('BinaryOperator',
-                                ['operator', 'left', 'right'])):
+class BinaryOperator(Node, node_type('BinaryOperator',
+                                      ['operator', 'left', 'right'])):
     def pretty_print(self):
         return ('(' + self.left.pretty_print() + ' ' + self.operator + ' ' +
                 self.right.pretty_print() + ')')
 
 
 # value is of type Value
-class Literal(namedtuple('Literal', ['value'])):
+class Literal(Node, node_type('Literal', ['value'])):
     def pretty_print(self):
         return self.value.pretty_print()
 
 
-class ListLiteral(namedtuple('ListLiteral', ['expressions'])):
+class ListLiteral(Node, node_type('ListLiteral', ['expressions'])):
     def pretty_print(self):
         return ('[' +
                 ','.join(expr.pretty_print() for expr in self.expressions) +
                 ']')
 
 
-class Variable(namedtuple('Variable', ['name'])):
+class Variable(Node, node_type('Variable', ['name'])):
     def pretty_print(self):
         return self.name
 
 
-class FunctionCall(namedtuple('FunctionCall', ['function_expr', 'args'])):
+class LocalVariable(Node, node_type('LocalVariable',
+                                     ['name', 'depth', 'index'])):
+    """
+    A variable that has been statically resolved to a function local.
+    depth is the number of scopes to go up from the current scope, and
+    index is the variable's slot in that scope.
+    """
+    def pretty_print(self):
+        return self.name
+
+
+class FunctionCall(Node, node_type('FunctionCall',
+                                    ['function_expr', 'args'])):
     def pretty_print(self):
         return (self.function_expr.pretty_print() + '(' +
                 ','.join(arg.pretty_print() for arg in self.args) + ')')
 
 
-class AttributeAccess(namedtuple('AttributeAccess', ['expr', 'attr_name'])):
+class AttributeAccess(Node, node_type('AttributeAccess',
+                                       ['expr', 'attr_name'])):
     def pretty_print(self):
         return self.expr.pretty_print() + '.' + self.attr_name
 
 
-class GetItem(namedtuple('GetItem', ['expr', 'key'])):
+class GetItem(Node, node_type('GetItem', ['expr', 'key'])):
     def pretty_print(self):
         return self.expr.pretty_print() + '[' + self.key.pretty_print() + ']'
 
 
-class Value(namedtuple('Value', ['type', 'data', 'attributes'])):
+class Slice(Node, node_type('Slice', ['start', 'stop'])):
+    """
+    The key of a slice such as xs[start:stop]. Bounds that were left out
+    are the None literal.
+    """
+    def pretty_print(self):
+        return self.start.pretty_print() + ':' + self.stop.pretty_print()
+
+
+# The nodes that run as statements. A Block only groups other
+# statements, so it isn't one itself.
+STATEMENT_TYPES = (Assignment, ExpressionStatement, PassStatement,
+                   PrintStatement, ReturnStatement, IfStatement,
+                   WhileStatement, ForStatement, DefStatement,
+                   ClassStatement)
+
+
+class ImmutableAttributes(dict):
+    """An attribute dictionary that can't be modified. Primitive values
+    and builtin functions never have attributes of their own, so they all
+    share the single EMPTY_ATTRIBUTES instance rather than each
+    allocating a dict. Instances read as EMPTY_ATTRIBUTES too until an
+    attribute is stored on them.
+    """
+    def _read_only(self, *args, **kwargs):
+        raise AttributeError(
+            'Cannot set attributes on primitive values or builtins.')
+
+    __setitem__ = _read_only
+    __delitem__ = _read_only
+    clear = _read_only
+    pop = _read_only
+    popitem = _read_only
+    setdefault = _read_only
+    update = _read_only
+
+
+EMPTY_ATTRIBUTES = ImmutableAttributes()
+
+
+class Value(object):
     """
-    * type is a pointer to the type.
+    Base class of all runtime values.
+    * type is a pointer to the type, which is a TypeValue.
     * data refers to the "raw" data contained in this type:
       -primitives have a a Python primitive with their value
       -functions have either an AST of the function (for user-defined
         functions) or a Python function (for builtin functions).
       -types have a string with the name of the type
     * attributes is a dictionary of the direct attributes of the
-        object, each of which has type Value.
+        object, each of which has type Value. Each subclass decides how
+        to store it, so attributes are stored through set_attribute.
+
+    Values are compared by type identity, data and attributes.
     """
+    __slots__ = ['type', 'data']
+
+    def __eq__(self, other):
+        return (isinstance(other, Value) and self.type is other.type and
+                self.data == other.data and
+                self.attributes == other.attributes)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def set_attribute(self, name, value):
+        self.attributes[name] = value
+
+    def __repr__(self):
+        return '%s(%s, %r)' % (self.__class__.__name__, self.type.data,
+                               self.data)
+
     def pretty_print(self):
         return str(self.data)
 
 
+class PrimitiveValue(Value):
+    """
+    An int, str, bool, None or list, none of which can have attributes
+    of their own.
+    """
+    __slots__ = []
+
+    attributes = EMPTY_ATTRIBUTES
+
+    def __init__(self, type, data):
+        self.type = type
+        self.data = data
+
+
+class ListValue(PrimitiveValue):
+    """
+    A list. slice_source is the SliceSource that slices of the list
+    read their elements through, or None if it has no slices viewing
+    its current storage (see builtin_types.py).
+    """
+    __slots__ = ['slice_source']
+
+    def __init__(self, type, data):
+        self.type = type
+        self.data = data
+        self.slice_source = None
+
+
+class InstanceValue(Value):
+    """
+    An instance of a user-defined class. The attribute dictionary is
+    only created once an attribute is stored, since many objects never
+    get any attributes.
+    """
+    __slots__ = ['_attributes']
+
+    def __init__(self, type, data=None):
+        self.type = type
+        self.data = data
+        self._attributes = None
+
+    @property
+    def attributes(self):
+        attributes = self._attributes
+        if attributes is None:
+            return EMPTY_ATTRIBUTES
+        return attributes
+
+    def set_attribute(self, name, value):
+        if self._attributes is None:
+            self._attributes = {}
+        self._attributes[name] = value
+
+
+class FunctionValue(InstanceValue):
+    """
+    A user-defined or builtin function. Like instances, functions can be
+    given attributes.
+    """
+    __slots__ = []
+
+
+class BuiltinFunctionValue(FunctionValue):
+    """
+    A builtin function. Unlike user-defined functions, these are shared
+    by every program run with the same TypeContext, so as in Python they
+    can't be given attributes.
+    """
+    __slots__ = []
+
+    attributes = EMPTY_ATTRIBUTES
+
+    def set_attribute(self, name, value):
+        EMPTY_ATTRIBUTES[name] = value
+
+
+class TypeValue(Value):
+    """A type, whose attributes are shared by all its instances."""
+    __slots__ = ['attributes']
+
+    def __init__(self, type, name, attributes):
+        self.type = type
+        self.data = name
+        self.attributes = attributes
+
+
 class FunctionData(namedtuple('FunctionData',
-                              ['param_names', 'body', 'parent_scope'])):
-    pass
+                              ['name', 'param_names', 'local_names', 'body',
+                               'parent_scope', 'frame_pool', 'position'])):
+    """
+    name and position are those of the DefStatement that created the
+    function.
+
+    frame_pool is the FramePool that calls take their scope from, or None
+    if every call needs a new scope because the scope can outlive the
+    call.
+    """
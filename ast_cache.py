@@ -0,0 +1,284 @@
+import hashlib
+import marshal
+import mmap
+import os
+import tempfile
+import appy_ast
+import file_lexer
+import lexer
+import line_lexer
+import parser
+from appy_ast import Node, PrimitiveValue
+from array import array
+from file_lexer import MAP_WINDOW_SIZE, is_mappable
+from private_dir import ensure_private_dir
+
+
+# Bump this whenever the encoding below changes.
+FORMAT_VERSION = 1
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Opcodes of the encoding. Each one pushes a value onto a stack, with
+# nodes and sequences popping their fields or items off first.
+CONST = 0
+TUPLE = 1
+LIST = 2
+VALUE_BASE = 3
+VALUE_TYPES = ['int', 'str', 'bool', 'NoneType']
+NODE_BASE = VALUE_BASE + len(VALUE_TYPES)
+
+class AstCache(object):
+    """On-disk cache of parsed ASTs, keyed by a hash of the source.
+
+    Each AST is flattened in postorder into a string of opcodes and a
+    list of operands, which marshal writes compactly and which are
+    turned back into the tree with a single loop over a stack. Literal
+    Values are stored as their type and data, and are rebuilt through
+    the TypeContext, so that a loaded AST shares its canonical Values
+    (small ints, bools, None, interned strings) with the rest of the
+    program just like a freshly parsed one.
+
+    The key also covers the code of the lexer, parser and AST modules,
+    so changing the grammar never loads a stale AST. Entries are
+    evicted least recently used first, by file modification time, once
+    the cache grows beyond max_bytes.
+    """
+
+    def __init__(self, cache_dir, type_context,
+                 max_bytes=DEFAULT_MAX_BYTES):
+        """
+        @type cache_dir: str
+        @param cache_dir: The directory to store the ASTs in. It is
+        created if it does not exist, and must be private to the current
+        user, since the ASTs loaded from it are run.
+        @type type_context: TypeContext
+        @type max_bytes: int
+        """
+        if not ensure_private_dir(cache_dir):
+            raise ValueError(cache_dir + ' is not a directory private to '
+                             'the current user')
+        self.cache_dir = cache_dir
+        self.type_context = type_context
+        self.max_bytes = max_bytes
+        # A running total of the size of the cache, so that it's only
+        # listed once the total goes over max_bytes rather than on every
+        # store. None until the first store. It may fall behind what
+        # other processes write, which only delays their eviction until
+        # the next listing.
+        self.estimated_bytes = None
+        self.signature = frontend_signature()
+        # Sorted so that the opcodes only change when appy_ast does,
+        # which the signature covers.
+        self.node_classes = sorted(Node.__subclasses__(),
+                                   key=lambda node_class: node_class.__name__)
+        self.node_opcodes = dict(
+            (node_class, NODE_BASE + i)
+            for i, node_class in enumerate(self.node_classes))
+        self.value_constructors = [
+            type_context.int_value,
+            type_context.interned_str_value,
+            type_context.bool_value,
+            lambda data: type_context.none_value,
+        ]
+
+    def key(self, program):
+        """
+        @param program: The text of the program, or a file on disk. The
+        position of a file is left alone, as it is hashed through a
+        memory map.
+        @return: The cache key for the program, or None if the program
+        cannot be hashed without consuming it.
+        @rtype: str
+        """
+        digest = hashlib.md5(self.signature)
+        if isinstance(program, basestring):
+            digest.update(program)
+        elif is_mappable(program):
+            _update_from_file(digest, program)
+        else:
+            return None
+        return digest.hexdigest()
+
+    def load(self, key):
+        """
+        @type key: str
+        @return: The cached AST for the key, or None if there is none.
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as cache_file:
+                opcodes, operands = marshal.load(cache_file)
+        except (IOError, EOFError, ValueError, TypeError):
+            return None
+        try:
+            # Mark it as recently used.
+            os.utime(path, None)
+        except OSError:
+            pass
+        return self.decode(opcodes, operands)
+
+    def store(self, key, ast):
+        """Writes the AST to the cache, evicting old entries if the
+        cache is over its size limit.
+        @type key: str
+        @return: Whether the AST could be cached.
+        @rtype: bool
+        """
+        try:
+            data = marshal.dumps(self.encode(ast), 2)
+        except TypeError:
+            # Only Literals of the primitive types can be encoded.
+            return False
+        if len(data) > self.max_bytes:
+            return False
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                temp_file.write(data)
+            # Readers only ever see complete files.
+            os.rename(temp_path, self._path(key))
+        except (IOError, OSError):
+            _remove(temp_path)
+            return False
+        if self.estimated_bytes is None:
+            self.estimated_bytes = self.size()
+        else:
+            # Replacing an entry counts it twice, which only makes the
+            # next listing come sooner.
+            self.estimated_bytes += len(data)
+        if self.estimated_bytes > self.max_bytes:
+            self._evict()
+        return True
+
+    def encode(self, ast):
+        """
+        @return: The opcodes of the AST as a str, and a list of their
+        operands.
+        """
+        opcodes = array('B')
+        operands = []
+        self._encode(ast, opcodes, operands)
+        return opcodes.tostring(), operands
+
+    def _encode(self, value, opcodes, operands):
+        if isinstance(value, Node):
+            for field in value:
+                self._encode(field, opcodes, operands)
+            opcodes.append(self.node_opcodes[value.__class__])
+        elif isinstance(value, PrimitiveValue):
+            type_name = value.type.data
+            if type_name not in VALUE_TYPES:
+                raise TypeError('Cannot encode a literal of type ' +
+                                str(type_name))
+            opcodes.append(VALUE_BASE + VALUE_TYPES.index(type_name))
+            operands.append(value.data)
+        elif isinstance(value, (tuple, list)):
+            for item in value:
+                self._encode(item, opcodes, operands)
+            opcodes.append(TUPLE if isinstance(value, tuple) else LIST)
+            operands.append(len(value))
+        else:
+            opcodes.append(CONST)
+            operands.append(value)
+
+    def decode(self, opcodes, operands):
+        """The inverse of encode."""
+        node_classes = [(node_class, len(node_class._fields))
+                        for node_class in self.node_classes]
+        value_constructors = self.value_constructors
+        new_node = tuple.__new__
+        next_operand = iter(operands).next
+        stack = []
+        push = stack.append
+        for opcode in array('B', opcodes):
+            if opcode >= NODE_BASE:
+                node_class, field_count = node_classes[opcode - NODE_BASE]
+                # Every field is on the stack, so the tuple can be built
+                # directly without going through the namedtuple __new__.
+                fields = stack[-field_count:]
+                del stack[-field_count:]
+                push(new_node(node_class, fields))
+            elif opcode == CONST:
+                push(next_operand())
+            elif opcode >= VALUE_BASE:
+                push(value_constructors[opcode - VALUE_BASE](next_operand()))
+            else:
+                count = next_operand()
+                if count:
+                    items = stack[-count:]
+                    del stack[-count:]
+                else:
+                    items = []
+                push(tuple(items) if opcode == TUPLE else items)
+        return stack.pop()
+
+    def size(self):
+        """
+        @return: The total size in bytes of the cached ASTs.
+        @rtype: int
+        """
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            _remove(path)
+            total -= size
+        self.estimated_bytes = total
+
+    def _entries(self):
+        """
+        @return: (modification time, size, path) for each cached AST.
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.ast'):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    # Evicted by another process.
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.ast')
+
+
+def frontend_signature():
+    """
+    @return: A hash of the code that turns source into ASTs, so that
+    ASTs cached by a different lexer, parser or AST format are never
+    loaded.
+    @rtype: str
+    """
+    digest = hashlib.md5(str(FORMAT_VERSION))
+    for module in [appy_ast, file_lexer, line_lexer, lexer, parser]:
+        path = os.path.splitext(module.__file__)[0] + '.py'
+        with open(path, 'rb') as source_file:
+            digest.update(source_file.read())
+    return digest.hexdigest()
+
+
+def _update_from_file(digest, source_file):
+    fileno = source_file.fileno()
+    size = os.fstat(fileno).st_size
+    for offset in xrange(0, size, MAP_WINDOW_SIZE):
+        window = mmap.mmap(fileno, min(MAP_WINDOW_SIZE, size - offset),
+                           access=mmap.ACCESS_READ, offset=offset)
+        try:
+            digest.update(window)
+        finally:
+            window.close()
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
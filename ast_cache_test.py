@@ -0,0 +1,155 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from appy_ast import Node, PrimitiveValue, Literal, ExpressionStatement
+from ast_cache import AstCache
+from builtin_types import TypeContext
+from frontend import Frontend
+
+
+PROGRAM = '''
+class Foo(object):
+    def bar(self, x):
+        if x > 1:
+            print 'big'
+        return_value = [x, None, True, "s" * 2]
+foo = Foo()
+while foo.bar(3) is None:
+    foo.bar(0)[0] = 5
+'''
+
+
+class AstCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.type_context = TypeContext()
+        self.cache_dir = tempfile.mkdtemp()
+        self.frontend = Frontend(self.type_context, self.cache_dir,
+                                 ast_cache_size=0)
+        self.cache = AstCache(os.path.join(self.cache_dir, 'asts'),
+                              self.type_context)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_shared_dir_refused(self):
+        os.chmod(self.cache_dir, 0o777)
+        self.assertRaises(ValueError, AstCache, self.cache_dir,
+                          self.type_context)
+
+    def test_round_trip(self):
+        ast = self.frontend.parse(PROGRAM)
+        key = self.cache.key(PROGRAM)
+        self.assertTrue(self.cache.store(key, ast))
+        loaded = self.cache.load(key)
+        self.assertEqual(ast, loaded)
+        self.assertEqual(self.positions(ast), self.positions(loaded))
+
+    def test_literals_are_canonical(self):
+        program = 'print [1, "s", True, None, 1000000]'
+        key = self.cache.key(program)
+        self.cache.store(key, self.frontend.parse(program))
+        elements = self.cache.load(key).expr.expressions
+        type_context = self.type_context
+        self.assertIs(type_context.int_value(1), elements[0].value)
+        self.assertIs(type_context.interned_str_value('s'),
+                      elements[1].value)
+        self.assertIs(type_context.true_value, elements[2].value)
+        self.assertIs(type_context.none_value, elements[3].value)
+        self.assertEqual(type_context.int_value(1000000), elements[4].value)
+
+    def test_uncacheable_literal(self):
+        function_literal = ExpressionStatement(Literal(
+            PrimitiveValue(self.type_context.function_type, len)))
+        self.assertFalse(self.cache.store('key', function_literal))
+        self.assertIsNone(self.cache.load('key'))
+
+    def test_missing_key(self):
+        self.assertIsNone(self.cache.load(self.cache.key('print 1')))
+
+    def test_key_depends_on_source(self):
+        self.assertEqual(self.cache.key('print 1'),
+                         self.cache.key('print 1'))
+        self.assertNotEqual(self.cache.key('print 1'),
+                            self.cache.key('print 2'))
+
+    def test_file_key(self):
+        path = os.path.join(self.cache_dir, 'program.py')
+        with open(path, 'w') as program_file:
+            program_file.write(PROGRAM)
+        with open(path) as program_file:
+            self.assertEqual(self.cache.key(PROGRAM),
+                             self.cache.key(program_file))
+            # Hashing does not move the file.
+            self.assertEqual(0, program_file.tell())
+        self.assertIsNone(self.cache.key(iter([PROGRAM])))
+
+    def test_evicts_least_recently_used(self):
+        keys = [self.cache.key('print %d' % i) for i in range(3)]
+        for i, key in enumerate(keys):
+            self.cache.store(key, self.frontend.parse('print %d' % i))
+            self.set_mtime(key, i)
+        entry_size = self.cache.size() / 3
+        self.cache.load(keys[0])
+        self.cache.max_bytes = entry_size * 3
+        new_key = self.cache.key('print 3')
+        self.cache.store(new_key, self.frontend.parse('print 3'))
+        self.assertIsNotNone(self.cache.load(keys[0]))
+        self.assertIsNone(self.cache.load(keys[1]))
+        self.assertIsNotNone(self.cache.load(keys[2]))
+        self.assertIsNotNone(self.cache.load(new_key))
+
+    def test_lists_cache_only_when_over_limit(self):
+        listings = []
+        entries = self.cache._entries
+        self.cache._entries = lambda: listings.append(1) or entries()
+        for i in range(10):
+            self.cache.store(self.cache.key('print %d' % i),
+                             self.frontend.parse('print %d' % i))
+        # Only the first store lists the cache, to find its size.
+        self.assertEqual(1, len(listings))
+        self.cache.max_bytes = self.cache.size() - 1
+        del listings[:]
+        self.cache.store(self.cache.key('print 10'),
+                         self.frontend.parse('print 10'))
+        self.assertEqual(1, len(listings))
+        self.assertLessEqual(self.cache.size(), self.cache.max_bytes)
+
+    def test_frontend_uses_cache(self):
+        frontend = Frontend(self.type_context, self.cache_dir)
+        ast = frontend.parse(PROGRAM)
+        parses = []
+        parse = frontend.parser.parse
+        frontend.parser.parse = lambda *args: parses.append(args) or parse(
+            *args)
+        self.assertEqual(ast, frontend.parse(PROGRAM))
+        self.assertEqual([], parses)
+        frontend.parse(PROGRAM + 'print 1\n')
+        self.assertEqual(1, len(parses))
+
+    def test_frontend_cache_disabled(self):
+        self.frontend.parse(PROGRAM)
+        self.assertIsNone(self.frontend.ast_cache)
+        self.assertIsNone(self.cache.load(self.cache.key(PROGRAM)))
+
+    def positions(self, node):
+        positions = []
+        self.collect_positions(node, positions)
+        return positions
+
+    def collect_positions(self, value, positions):
+        if isinstance(value, Node):
+            positions.append((type(value).__name__, value.position))
+        if isinstance(value, (tuple, list)):
+            for item in value:
+                self.collect_positions(item, positions)
+
+    def set_mtime(self, key, age):
+        mtime = time.time() - 1000 + age
+        os.utime(self.cache._path(key), (mtime, mtime))
+
+
+if __name__ == '__main__':
+    unittest.main()
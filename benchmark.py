@@ -0,0 +1,803 @@
+"""Benchmarks for the APPy interpreter.
+
+Run all of them with `python benchmark.py`, or pass benchmark names to
+run a subset, e.g. `python benchmark.py parse_latency`.
+"""
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from collections import namedtuple
+
+try:
+    import tracemalloc
+except ImportError:
+    # Only available in Python 3.4 and later.
+    tracemalloc = None
+
+from appy_ast import PrimitiveValue, ListValue, InstanceValue, TypeValue
+import builtin_types
+from builtin_types import IntList, TypeContext
+from frontend import Frontend
+from interpreter import Interpreter
+from file_lexer import FileLexer, split_lines, mapped_lines
+from lexer import create_lexer
+from limits import ExecutionLimits
+from parser import Parser
+from profiler import Profiler
+from scanner import Scanner
+from scope import ScopeChain, SlotScope
+
+
+BENCHMARKS = []
+
+
+def benchmark(func):
+    BENCHMARKS.append(func)
+    return func
+
+
+def time_per_call(func, iterations):
+    """Returns the average wall time in seconds of calling func()."""
+    start = time.time()
+    for _ in range(iterations):
+        func()
+    return (time.time() - start) / iterations
+
+
+def report(label, seconds):
+    print('  %-40s %10.3f ms' % (label, seconds * 1000))
+
+
+def report_amount(label, amount, unit):
+    print('  %-40s %10d %s' % (label, amount, unit))
+
+
+SNIPPETS = [
+    '5 + 3',
+    'x * (y - 1)',
+    'foo(bar, 7, x + 5)',
+    '"hello" + name',
+    'a < b and b < c',
+]
+
+
+@benchmark
+def parse_latency():
+    """Per-snippet parse latency with and without a shared Frontend."""
+    type_context = TypeContext()
+
+    def parse_fresh():
+        for snippet in SNIPPETS:
+            Parser(type_context).parse(snippet, create_lexer())
+
+    frontend = Frontend(type_context, ast_cache_size=0)
+
+    def parse_shared():
+        for snippet in SNIPPETS:
+            frontend.parse(snippet)
+
+    report('fresh Parser and lexer per snippet',
+           time_per_call(parse_fresh, 20) / len(SNIPPETS))
+    report('shared Frontend',
+           time_per_call(parse_shared, 2000) / len(SNIPPETS))
+
+
+EXPRESSIONS = [
+    '5 + 3',
+    '(2 * 21) == 42',
+    '"hello" + "world"',
+    '1 < 2 and 3 < 4',
+    '[1, 2, 3][1] * 7',
+]
+
+
+@benchmark
+def repeated_expressions():
+    """Evaluating a few expressions repeatedly with and without caching."""
+    for label, expression_cache_size in [('without cache', 0),
+                                         ('with cache', 256)]:
+        interpreter = Interpreter(
+            lambda s: None, expression_cache_size=expression_cache_size,
+            ast_cache_size=0)
+
+        def evaluate():
+            for expression in EXPRESSIONS:
+                interpreter.evaluate_expression(expression)
+        report(label, time_per_call(evaluate, 2000) / len(EXPRESSIONS))
+
+
+SYNTHETIC_BLOCK = '''
+class Point(object):
+    def move(self, dx, dy):
+        self.x = self.x + dx
+        self.y = self.y - dy * 2
+def norm(p):
+    if p.x >= 0 and p.y >= 0:
+        print "positive: " + 'quadrant'
+    return_value = [p.x, p.y,
+                    p.x * p.y, p.x / 1]
+    return_value[0] = return_value[1] + \\
+        return_value[2]
+'''
+
+
+def synthetic_program(min_bytes):
+    """A program of at least min_bytes made of repeated copies of
+    SYNTHETIC_BLOCK."""
+    copies = min_bytes // len(SYNTHETIC_BLOCK) + 1
+    return SYNTHETIC_BLOCK * copies
+
+
+@benchmark
+def tokenize_large_file():
+    """Tokenizing a 1 MB program with PLY per line vs the Scanner."""
+    program = synthetic_program(1024 * 1024)
+    for label, tokenizer in [('FileLexer + LineLexer', FileLexer()),
+                             ('Scanner', Scanner())]:
+        def tokenize():
+            for _ in tokenizer.tokenize(program):
+                pass
+        report(label, time_per_call(tokenize, 3))
+
+
+@benchmark
+def source_positions():
+    """Parsing 64 KB with packed node positions vs PLY's tracking=True."""
+    program = synthetic_program(64 * 1024)
+    parser = Parser(TypeContext())
+    for label, parse_options in [('packed node positions', {}),
+                                 ('PLY tracking=True', {'tracking': True})]:
+        for tokenizer in ['ply', 'scanner']:
+            def parse():
+                parser.parse(program, create_lexer(tokenizer=tokenizer),
+                             **parse_options)
+            report('%s (%s)' % (label, tokenizer), time_per_call(parse, 3))
+
+
+@benchmark
+def streaming_tokenize():
+    """Tokenizing an 8 MB file read whole, streamed and memory-mapped."""
+    fd, path = tempfile.mkstemp(suffix='.py')
+    try:
+        with os.fdopen(fd, 'w') as program_file:
+            program_file.write(synthetic_program(8 * 1024 * 1024))
+
+        def tokenize_whole():
+            with open(path) as program_file:
+                program = program_file.read()
+            for _ in FileLexer().tokenize(program):
+                pass
+
+        def tokenize_streamed():
+            with open(path) as program_file:
+                chunks = (line for line in program_file)
+                for _ in FileLexer().tokenize(chunks):
+                    pass
+
+        def tokenize_mapped():
+            with open(path) as program_file:
+                for _ in FileLexer().tokenize(program_file):
+                    pass
+        for label, tokenize in [('read whole', tokenize_whole),
+                                ('streamed', tokenize_streamed),
+                                ('mapped', tokenize_mapped)]:
+            report_amount(label + ' peak resident growth',
+                          resident_size(tokenize, peak=True) // 1024, 'KB')
+            report(label + ' time', time_per_call(tokenize, 1))
+    finally:
+        os.remove(path)
+
+
+@benchmark
+def load_large_file():
+    """Peak memory and time to split a 64 MB file into lines."""
+    fd, path = tempfile.mkstemp(suffix='.py')
+    try:
+        with os.fdopen(fd, 'w') as program_file:
+            program_file.write(synthetic_program(64 * 1024 * 1024))
+
+        def read_and_split():
+            with open(path) as program_file:
+                for _ in program_file.read().split('\n'):
+                    pass
+
+        def split_file_chunks():
+            with open(path) as program_file:
+                for _ in split_lines(program_file):
+                    pass
+
+        def map_file():
+            with open(path) as program_file:
+                for _ in mapped_lines(program_file):
+                    pass
+        for label, load in [('read and split', read_and_split),
+                            ('split_lines', split_file_chunks),
+                            ('mapped_lines', map_file)]:
+            report_amount(label + ' peak resident growth',
+                          resident_size(load, peak=True) // 1024, 'KB')
+            report(label + ' time', time_per_call(load, 1))
+    finally:
+        os.remove(path)
+
+
+@benchmark
+def cached_startup():
+    """Parsing a 1 MB file on startup with and without the AST cache."""
+    cache_dir = tempfile.mkdtemp()
+    fd, path = tempfile.mkstemp(suffix='.py')
+    try:
+        with os.fdopen(fd, 'w') as program_file:
+            program_file.write(synthetic_program(1024 * 1024))
+        for label, ast_cache_size in [('without cache', 0),
+                                      ('with cache', 64 * 1024 * 1024)]:
+            interpreter = Interpreter(lambda s: None, cache_dir=cache_dir,
+                                      ast_cache_size=ast_cache_size)
+
+            def parse():
+                with open(path) as program_file:
+                    interpreter.frontend.parse(program_file)
+
+            def parse_and_resolve():
+                with open(path) as program_file:
+                    interpreter.parse(program_file)
+            # Fills the cache, so that only hits are timed.
+            parse()
+            report(label, time_per_call(parse, 3))
+            report(label + ' and resolving',
+                   time_per_call(parse_and_resolve, 3))
+    finally:
+        os.remove(path)
+        shutil.rmtree(cache_dir)
+
+
+def run_program(engine, program, iterations=1, interpreter=None):
+    """Returns the average time to execute program, excluding parsing."""
+    if interpreter is None:
+        interpreter = Interpreter(lambda s: None, engine=engine,
+                                  ast_cache_size=0)
+    ast = interpreter.parse(program)
+
+    def execute():
+        interpreter.create_executor().execute_statement(ast)
+    return time_per_call(execute, iterations)
+
+
+def run_with_globals(interpreter, program, global_values, iterations=1):
+    """Like run_program, with the given globals assigned beforehand."""
+    ast = interpreter.parse(program)
+
+    def execute():
+        executor = interpreter.create_executor()
+        for name, value in global_values.items():
+            executor.scope_chain.assign_name(name, value)
+        executor.execute_statement(ast)
+    return time_per_call(execute, iterations)
+
+
+ENGINES = ['tree', 'closure', 'bytecode']
+
+COUNTING_LOOP = '''
+total = 0
+i = 0
+while i < 20000:
+    total = total + i
+    i = i + 1
+'''
+
+
+@benchmark
+def while_loop():
+    """A tight counting while loop on each engine."""
+    for engine in ENGINES:
+        report(engine, run_program(engine, COUNTING_LOOP, 5))
+
+
+@benchmark
+def primitive_operators():
+    """The counting loop with and without the primitive operator table."""
+    for engine in ENGINES:
+        interpreter = Interpreter(lambda s: None, engine=engine,
+                                  ast_cache_size=0)
+        interpreter.type_context.primitive_operators.clear()
+        report(engine + ' method dispatch',
+               run_program(engine, COUNTING_LOOP, 5, interpreter))
+        report(engine + ' fast path', run_program(engine, COUNTING_LOOP, 5))
+
+
+WHILE_SUM = '''
+total = 0
+i = 0
+n = len_xs
+while i < n:
+    x = xs[i]
+    total = total + x
+    i = i + 1
+'''
+
+FOR_SUM = '''
+total = 0
+for x in xs:
+    total = total + x
+'''
+
+
+@benchmark
+def for_loop():
+    """Summing a 1M-element list with a for loop vs a while loop."""
+    length = 1000000
+    for engine in ENGINES:
+        interpreter = Interpreter(lambda s: None, engine=engine,
+                                  ast_cache_size=0)
+        type_context = interpreter.type_context
+        global_values = {
+            'xs': ListValue(type_context.list_type,
+                            [type_context.int_value(i % 100)
+                             for i in range(length)]),
+            'len_xs': type_context.int_value(length),
+        }
+        for label, program in [('while', WHILE_SUM), ('for', FOR_SUM)]:
+            report(engine + ' ' + label,
+                   run_with_globals(interpreter, program, global_values))
+
+
+def list_bytes(list_value):
+    """Returns roughly how many bytes the list and its elements take."""
+    data = list_value.data
+    if isinstance(data, IntList):
+        return sys.getsizeof(data) + sys.getsizeof(data.ints)
+    elements = dict((id(value), value) for value in data).values()
+    return sys.getsizeof(data) + sum(
+        sys.getsizeof(value) + sys.getsizeof(value.data)
+        for value in elements)
+
+
+@benchmark
+def int_lists():
+    """Memory and loop throughput of 1M-int lists, boxed vs unboxed."""
+    length = 1000000
+    for engine in ENGINES:
+        interpreter = Interpreter(lambda s: None, engine=engine,
+                                  ast_cache_size=0)
+        type_context = interpreter.type_context
+        ints = [type_context.int_value(i) for i in range(length)]
+        lists = [('boxed', ListValue(type_context.list_type, ints)),
+                 ('unboxed', type_context.list_value(list(ints)))]
+        del ints
+        for label, xs in lists:
+            if engine == ENGINES[0]:
+                report_amount(label + ' size', list_bytes(xs) / 1024, 'KB')
+            global_values = {'xs': xs,
+                             'len_xs': type_context.int_value(length)}
+            for loop, program in [('while', WHILE_SUM), ('for', FOR_SUM)]:
+                report('%s %s %s' % (engine, label, loop),
+                       run_with_globals(interpreter, program, global_values))
+
+
+APPEND_LOOP = '''
+xs = []
+for i in range(n):
+    xs.append(i)
+'''
+
+SLICE_LOOP = '''
+total = 0
+for i in range(1000):
+    tail = xs[i:]
+    first = tail[0]
+    total = total + first
+'''
+
+
+@benchmark
+def list_growth_and_slices():
+    """Appending 10k vs 100k ints, and slicing 100k ints as views vs copies."""
+    for engine in ENGINES:
+        interpreter = Interpreter(lambda s: None, engine=engine,
+                                  ast_cache_size=0)
+        type_context = interpreter.type_context
+        for n in [10000, 100000]:
+            seconds = run_with_globals(interpreter, APPEND_LOOP,
+                                       {'n': type_context.int_value(n)})
+            report('%s append %d (per 1k)' % (engine, n),
+                   seconds * 1000 / n)
+        global_values = {'xs': type_context.list_value(
+            [type_context.int_value(i) for i in range(100000)])}
+        report(engine + ' slice views',
+               run_with_globals(interpreter, SLICE_LOOP, global_values))
+        view_min_length = builtin_types.SLICE_VIEW_MIN_LENGTH
+        builtin_types.SLICE_VIEW_MIN_LENGTH = sys.maxint
+        try:
+            report(engine + ' slice copies',
+                   run_with_globals(interpreter, SLICE_LOOP, global_values))
+        finally:
+            builtin_types.SLICE_VIEW_MIN_LENGTH = view_min_length
+
+
+RANGE_LOOP = '''
+total = 0
+for i in range(20000):
+    total = total + i
+'''
+
+
+@benchmark
+def range_loop():
+    """The counting loop as a while loop vs a for loop over range."""
+    for engine in ENGINES:
+        report(engine + ' while', run_program(engine, COUNTING_LOOP, 5))
+        report(engine + ' range', run_program(engine, RANGE_LOOP, 5))
+
+
+CONSTANT_EXPRESSIONS = '''
+total = 0
+i = 0
+while i < 20000:
+    if 1 > 2:
+        print 'debugging'
+    total = total + (60 * 60 * 24) / (2 + 2) - 7 * 3
+    i = i + 1
+'''
+
+
+@benchmark
+def constant_folding():
+    """Literal arithmetic and dead branches with and without the optimizer."""
+    for engine in ENGINES:
+        for label, optimize in [('unoptimized', False), ('optimized', True)]:
+            interpreter = Interpreter(lambda s: None, engine=engine,
+                                      optimize=optimize, ast_cache_size=0)
+            report(engine + ' ' + label,
+                   run_program(engine, CONSTANT_EXPRESSIONS, 5, interpreter))
+
+
+GUARDED_CALLS = '''
+def expensive(n):
+    i = 0
+    while i < 20:
+        i = i + 1
+ready = False
+i = 0
+while i < 2000:
+    if %s:
+        print i
+    i = i + 1
+'''
+
+
+@benchmark
+def short_circuit():
+    """A false guard that skips a costly call vs the call before the guard."""
+    for engine in ENGINES:
+        report(engine + ' call skipped',
+               run_program(engine, GUARDED_CALLS % 'ready and expensive(i)',
+                           5))
+        report(engine + ' call evaluated',
+               run_program(engine, GUARDED_CALLS % 'expensive(i) and ready',
+                           5))
+
+
+FUNCTION_CALLS = '''
+def add_to(counter, n):
+    counter[0] = counter[0] + n
+counter = [0]
+i = 0
+while i < 5000:
+    add_to(counter, i)
+    i = i + 1
+'''
+
+
+METHOD_DISPATCH = '''
+class Counter(object):
+    def bump(self, n):
+        return n + 1
+counter = Counter()
+xs = [1, 2, 3]
+total = 0
+i = 0
+while i < 20000:
+    total = counter.bump(total)
+    x = xs[1]
+    xs[0] = x
+    i = i + 1
+'''
+
+
+@benchmark
+def method_dispatch():
+    """Method calls and item access, bound vs unbound and on each engine."""
+    interpreter = Interpreter(lambda s: None, ast_cache_size=0)
+    executor = interpreter.create_executor()
+    type_context = interpreter.type_context
+    xs = type_context.list_value([type_context.int_value(1)])
+    index = type_context.int_value(0)
+
+    def bound():
+        executor._evaluate_function(
+            executor._evaluate_attr(xs, '__getitem__'), index)
+
+    def unbound():
+        executor._call_method(xs, '__getitem__', index)
+    report('bound method call', time_per_call(bound, 100000))
+    report('unbound method call', time_per_call(unbound, 100000))
+    for engine in ENGINES:
+        report(engine, run_program(engine, METHOD_DISPATCH, 5))
+
+
+@benchmark
+def function_calls():
+    """Repeated calls to a small user-defined function on each engine."""
+    for engine in ENGINES:
+        report(engine, run_program(engine, FUNCTION_CALLS, 5))
+
+
+@benchmark
+def profiling():
+    """The function call loop with and without a profiler on each engine."""
+    for engine in ENGINES:
+        report(engine, run_program(engine, FUNCTION_CALLS, 5))
+        interpreter = Interpreter(lambda s: None, engine=engine,
+                                  profiler=Profiler(), ast_cache_size=0)
+        report(engine + ' profiled',
+               run_program(engine, FUNCTION_CALLS, 5, interpreter))
+
+
+@benchmark
+def execution_limits():
+    """The function call loop with and without limits on each engine."""
+    limits = ExecutionLimits(max_steps=10 ** 9, timeout=3600,
+                             max_list_elements=10 ** 9)
+    for engine in ENGINES:
+        report(engine, run_program(engine, FUNCTION_CALLS, 5))
+        interpreter = Interpreter(lambda s: None, engine=engine,
+                                  limits=limits, ast_cache_size=0)
+        report(engine + ' limited',
+               run_program(engine, FUNCTION_CALLS, 5, interpreter))
+
+
+RECURSIVE_CALLS = '''
+def count_down(n):
+    if n > 0:
+        count_down(n - 1)
+i = 0
+while i < 100:
+    count_down(50)
+    i = i + 1
+'''
+
+
+@benchmark
+def recursive_calls():
+    """Repeated recursion 50 calls deep on each engine."""
+    for engine in ENGINES:
+        report(engine, run_program(engine, RECURSIVE_CALLS, 5))
+
+
+RETURNED_FIBONACCI = '''
+def fib(n):
+    if n < 2:
+        return n
+    return fib(n - 1) + fib(n - 2)
+fib(18)
+'''
+
+# How fib had to be written before functions could return values.
+LIST_RESULT_FIBONACCI = '''
+def fib(n, result):
+    if n < 2:
+        result[0] = n
+    if n >= 2:
+        fib(n - 1, result)
+        a = result[0]
+        fib(n - 2, result)
+        b = result[0]
+        result[0] = a + b
+fib(18, [0])
+'''
+
+
+@benchmark
+def fibonacci():
+    """Recursive fib(18) returning results vs storing them in a list."""
+    for engine in ENGINES:
+        report(engine + ' list result',
+               run_program(engine, LIST_RESULT_FIBONACCI, 3))
+        report(engine + ' return', run_program(engine, RETURNED_FIBONACCI, 3))
+
+
+LOCAL_VARIABLES = '''
+def outer(n):
+    step = 1
+    def count(limit):
+        total = 0
+        i = 0
+        while i < limit:
+            total = total + step
+            i = i + step
+        print total
+    count(n)
+outer(10000)
+'''
+
+GLOBAL_VARIABLES = '''
+step = 1
+limit = 10000
+total = 0
+i = 0
+while i < limit:
+    total = total + step
+    i = i + step
+print total
+'''
+
+
+@benchmark
+def variable_access():
+    """Loop over slot-resolved function locals vs dict-based globals."""
+    globals_scope = ScopeChain(None, {'step': 1})
+    outer_scope = SlotScope(globals_scope, ('n', 'step', 'count'), [1, 1, 1])
+    inner_scope = SlotScope(outer_scope, ('limit', 'total', 'i'), [1, 1, 1])
+    dict_scope = globals_scope.with_pushed_mappings(
+        {'n': 1, 'step': 1, 'count': 1}).with_pushed_mappings(
+        {'limit': 1, 'total': 1, 'i': 1})
+    for label, by_name, by_slot in [
+            ('local', lambda: dict_scope.resolve_name('i'),
+             lambda: inner_scope.load_slot(2)),
+            ('enclosing local', lambda: dict_scope.resolve_name('step'),
+             lambda: inner_scope.load_local(1, 1))]:
+        report(label + ' by name (x100k)',
+               time_per_call(by_name, 100000) * 100000)
+        report(label + ' by slot (x100k)',
+               time_per_call(by_slot, 100000) * 100000)
+    for engine in ENGINES:
+        report(engine + ' globals', run_program(engine, GLOBAL_VARIABLES, 5))
+        report(engine + ' nested locals',
+               run_program(engine, LOCAL_VARIABLES, 5))
+
+
+LOOP_HEAVY = '''
+total = 0
+i = 0
+while i < 2000:
+    j = 0
+    while j < 10:
+        j = j + 1
+    total = total + j * 2
+    i = i + 1
+print total
+'''
+
+
+VALUE_CLASSES = [PrimitiveValue, InstanceValue, TypeValue]
+
+
+def measure_allocations(func):
+    """Runs func() and returns the number of Values it allocated and its
+    peak traced memory in bytes, or None if tracemalloc is unavailable.
+    """
+    counter = [0]
+    original_inits = [(cls, cls.__dict__['__init__'])
+                      for cls in VALUE_CLASSES]
+
+    def counting_init(original_init):
+        def init(self, *args):
+            counter[0] += 1
+            original_init(self, *args)
+        return init
+    for cls, original_init in original_inits:
+        cls.__init__ = counting_init(original_init)
+    if tracemalloc is not None:
+        tracemalloc.start()
+    try:
+        func()
+        peak_bytes = None
+        if tracemalloc is not None:
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        if tracemalloc is not None:
+            tracemalloc.stop()
+        for cls, original_init in original_inits:
+            cls.__init__ = original_init
+    return counter[0], peak_bytes
+
+
+@benchmark
+def value_allocations():
+    """Value allocations in a loop, with and without the small int cache."""
+    if tracemalloc is None:
+        print('  (no tracemalloc, estimating bytes from the Value count)')
+    for engine in ENGINES:
+        for label, cache_small_ints in [('uncached', False),
+                                        ('cached', True)]:
+            interpreter = Interpreter(lambda s: None, engine=engine,
+                                      ast_cache_size=0)
+            value_size = sys.getsizeof(PrimitiveValue(None, 0))
+            if not cache_small_ints:
+                # An empty small int range gives every int its own
+                # Value, which also had its own attribute dict before
+                # EMPTY_ATTRIBUTES.
+                type_context = interpreter.type_context
+                type_context.SMALL_INT_MAX = type_context.SMALL_INT_MIN - 1
+                value_size += sys.getsizeof({})
+            ast = interpreter.parse(LOOP_HEAVY)
+            count, peak_bytes = measure_allocations(
+                lambda: interpreter.create_executor().execute_statement(ast))
+            report_amount('%s %s Values' % (engine, label), count, '')
+            if peak_bytes is None:
+                report_amount('%s %s estimated bytes' % (engine, label),
+                              count * value_size, 'B')
+            else:
+                report_amount('%s %s peak traced memory' % (engine, label),
+                              peak_bytes, 'B')
+
+
+# The namedtuple that Values used to be, for comparison.
+NamedTupleValue = namedtuple('NamedTupleValue', ['type', 'data', 'attributes'])
+
+
+def resident_size(build, peak=False):
+    """Returns how much calling build() grows the resident set size, in
+    bytes, or how far above its starting size it peaks if peak is true.
+    build() runs in a forked child so that memory freed by one
+    measurement can't be reused by the next. Needs Linux's /proc.
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        before = current_resident_size()
+        result = build()
+        if peak:
+            # ru_maxrss is in KB on Linux, and starts from the resident
+            # size at the fork. It's updated less precisely than statm.
+            after = max(before, resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss * 1024)
+        else:
+            after = current_resident_size()
+        os.write(write_fd, str(after - before).encode())
+        del result
+        os._exit(0)
+    os.close(write_fd)
+    output = os.read(read_fd, 64)
+    os.close(read_fd)
+    os.waitpid(pid, 0)
+    return int(output)
+
+
+def current_resident_size():
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * resource.getpagesize()
+
+
+@benchmark
+def value_memory():
+    """Memory of a million ints and instances, as namedtuples and Values."""
+    type_context = TypeContext()
+    int_type = type_context.int_type
+    foo_type = TypeValue(type_context.type_type, 'Foo', {})
+    # Shared by every build so that only the Values are measured.
+    numbers = range(1000, 1001000)
+    for label, build in [
+            ('namedtuple ints',
+             lambda: [NamedTupleValue(int_type, n, {}) for n in numbers]),
+            ('PrimitiveValue ints',
+             lambda: [type_context.int_value(n) for n in numbers]),
+            ('namedtuple instances',
+             lambda: [NamedTupleValue(foo_type, None, {}) for n in numbers]),
+            ('InstanceValue instances',
+             lambda: [InstanceValue(foo_type) for n in numbers])]:
+        report_amount(label, resident_size(build) // 1024, 'KB')
+
+
+def main(names):
+    for func in BENCHMARKS:
+        if not names or func.__name__ in names:
+            print(func.__name__ + ': ' + func.__doc__)
+            func()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,21 +1,252 @@
-from appy_ast import Value
+from array import array
+from itertools import imap, islice
+from appy_ast import (PrimitiveValue, ListValue, InstanceValue,
+                      BuiltinFunctionValue, TypeValue)
+from lru_cache import LruCache
+
+
+# The array typecode of unboxed int list storage, which holds 64-bit
+# ints on LP64 platforms. Lists with ints that don't fit use generic
+# storage.
+INT_LIST_TYPECODE = 'l'
+
+# Slices shorter than this are copied, since a copy that small costs
+# less than a view's bookkeeping and slower reads.
+SLICE_VIEW_MIN_LENGTH = 64
+
+# How many elements list.extend reads from an iterator between charging
+# them to the budget.
+EXTEND_CHUNK_LENGTH = 1024
+
+
+def lookup_type_attribute(type_value, attribute_name):
+    """
+    Finds an attribute directly on a type, without binding it.
+    @type type_value: Value
+    @rtype: Value
+    """
+    try:
+        return type_value.attributes[attribute_name]
+    except KeyError:
+        raise TypeError('Attribute ' + attribute_name +
+                        ' does not exist on this type.')
+
+
+class BudgetedBuiltin(object):
+    """The data of a builtin function that allocates list elements, in
+    place of a host function. The engines call func with the Budget of
+    the execution making the call, or None, before the arguments, so
+    that every execution is charged for exactly what it allocates.
+    """
+    __slots__ = ['func']
+
+    def __init__(self, func):
+        self.func = func
+
+
+class ListStorage(object):
+    """Base class of the storages a list can have in place of a host list
+    of Values. Each supports the read-only operations of a host list.
+    """
+    __slots__ = []
+
+    def __eq__(self, other):
+        if not isinstance(other, (ListStorage, list)):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class IntList(ListStorage):
+    """Unboxed storage for an APPy list whose elements are all ints, used
+    as the data of the list's ListValue in place of a host list of
+    Values, boxing each int as it's read.
+
+    Only the Value of each int is kept, not the Value itself. So an int
+    outside the canonical small int range gets a new Value every time
+    it's read. For example, after x = 1000 and xs = [x], xs[0] == x but
+    xs[0] is not x, although it would be in Python. Small ints are
+    shared, so they are still identical.
+
+    Storing anything else in the list replaces its data with a host list
+    for good (see TypeContext.list_value), so code that modifies a list
+    must get its storage from TypeContext.writable_list_data and check
+    which storage it is. Code that only reads it needn't.
+    """
+    __slots__ = ['ints', 'int_value']
+
+    def __init__(self, ints, int_value):
+        """
+        @type ints: array
+        @param int_value: The TypeContext's int_value, for boxing.
+        """
+        self.ints = ints
+        self.int_value = int_value
+
+    def __len__(self):
+        return len(self.ints)
+
+    def __getitem__(self, index):
+        try:
+            return self.int_value(self.ints[index])
+        except IndexError:
+            raise IndexError('list index out of range')
+
+    def __iter__(self):
+        return imap(self.int_value, self.ints)
+
+    def to_values(self):
+        """
+        @return: A host list of the boxed elements.
+        @rtype: list
+        """
+        return map(self.int_value, self.ints)
+
+
+class SliceSource(object):
+    """The elements that the ListSlice views of one list read through.
+
+    data starts out as the list's own storage, a host list or IntList,
+    and covers the list's indexes from offset on. Before the list is
+    modified, detach gives the views a copy of the part of it that they
+    cover, so that they keep the elements they had when the slices were
+    taken. The list keeps its storage, which is modified in place as
+    before, so that anything iterating over it sees the change.
+    """
+    __slots__ = ['data', 'offset', 'start', 'stop']
+
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+        # The range of the list's indexes that the views cover.
+        self.start = len(data)
+        self.stop = 0
+
+    def include(self, start, stop):
+        self.start = min(self.start, start)
+        self.stop = max(self.stop, stop)
+
+    def detach(self):
+        self.data = copy_storage(self.data, self.start - self.offset,
+                                 self.stop - self.offset)
+        self.offset = self.start
+
+
+class ListSlice(ListStorage):
+    """A zero-copy view of the elements start to stop of a list, used as
+    the data of the slice's ListValue. The view is replaced with a copy
+    of its elements before the slice itself is modified.
+    """
+    __slots__ = ['source', 'start', 'stop']
+
+    def __init__(self, source, start, stop):
+        """
+        @type source: SliceSource
+        """
+        self.source = source
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, index):
+        length = self.stop - self.start
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError('list index out of range')
+        source = self.source
+        return source.data[self.start + index - source.offset]
+
+    def __iter__(self):
+        # The source is read afresh for each element, since it may be
+        # detached from the list in between.
+        source = self.source
+        for index in xrange(self.start, self.stop):
+            yield source.data[index - source.offset]
+
+    def copy(self):
+        """
+        @return: The elements in storage of their own, a host list or
+        IntList like that of the list the slice was taken from.
+        """
+        return copy_storage(self, 0, len(self))
+
+
+def copy_storage(data, start, stop):
+    """
+    @param data: The storage of a list: a host list, IntList or
+    ListSlice.
+    @return: A copy of the elements start to stop of the storage, which
+    must be within its bounds, in a host list or IntList.
+    """
+    if type(data) is ListSlice:
+        source = data.source
+        offset = data.start - source.offset
+        return copy_storage(source.data, offset + start, offset + stop)
+    elif type(data) is IntList:
+        return IntList(data.ints[start:stop], data.int_value)
+    return data[start:stop]
 
 
 class TypeContext(object):
 
+    # Range of ints that have a canonical Value, as in CPython.
+    SMALL_INT_MIN = -5
+    SMALL_INT_MAX = 256
+
+    # String literals are interned if they are at most this long, and
+    # the most recently used this many of them are kept, so that a
+    # long-lived TypeContext parsing many distinct literals stays small.
+    MAX_INTERNED_STR_LENGTH = 64
+    INTERNED_STRS_CAPACITY = 10000
+
     def __init__(self):
         self.type_type = create_type_type_value()
-        self.function_type = Value(self.type_type, "function", {})
-        self.int_type = Value(self.type_type, "int", {})
-        self.none_type = Value(self.type_type, 'NoneType', {})
-        self.str_type = Value(self.type_type, "str", {})
-        self.bool_type = Value(self.type_type, "bool", {})
-        self.list_type = Value(self.type_type, 'list', {})
+        self.function_type = self._make_type("function")
+        self.int_type = self._make_type("int")
+        self.none_type = self._make_type('NoneType')
+        self.str_type = self._make_type("str")
+        self.bool_type = self._make_type("bool")
+        self.list_type = self._make_type('list')
+        self.list_iterator_type = self._make_type('listiterator')
+        self.range_type = self._make_type('xrange')
+        self.range_iterator_type = self._make_type('rangeiterator')
+        self.slice_type = self._make_type('slice')
 
         # We need these to be canonical
-        self.none_value = Value(self.none_type, None, {})
-        self.true_value = Value(self.bool_type, True, {})
-        self.false_value = Value(self.bool_type, False, {})
+        self.none_value = PrimitiveValue(self.none_type, None)
+        self.true_value = PrimitiveValue(self.bool_type, True)
+        self.false_value = PrimitiveValue(self.bool_type, False)
+
+        # Small ints are shared rather than allocated for every result,
+        # since loop counters and indices are almost always small.
+        self.small_ints = [
+            PrimitiveValue(self.int_type, n)
+            for n in range(self.SMALL_INT_MIN, self.SMALL_INT_MAX + 1)]
+        # Maps the contents of recently used short string literals to
+        # their Values.
+        self.interned_strs = LruCache(self.INTERNED_STRS_CAPACITY)
+
+        # Fast paths for binary operators on primitives, keyed on
+        # (method name, id(left type), id(right type)). Each entry takes
+        # the raw data of both operands and returns the result Value,
+        # skipping the method lookup and argument type checks. Operand
+        # types without an entry go through the regular method call.
+        # Builtin types can't be modified by APPy code, so these never
+        # need to be invalidated.
+        self.primitive_operators = {}
 
         # We build empty types up front, then populate them, so that we
         # can refer to the types within builtin functions.
@@ -40,13 +271,17 @@ class TypeContext(object):
         # argument on the right could be either a string or an int.
         def dynamic_multiply(arg1, arg2):
             if arg2.type is self.int_type:
-                return Value(self.int_type, arg1.data * arg2.data, {})
+                return self.int_value(arg1.data * arg2.data)
             elif arg2.type is self.str_type:
-                return Value(self.str_type, arg1.data * arg2.data, {})
+                return PrimitiveValue(self.str_type, arg1.data * arg2.data)
             else:
                 raise "Unexpected second arg type: " + str(arg2.type)
         self.int_type.attributes['__mul__'] = \
             self._make_function(dynamic_multiply)
+        self._define_primitive_operator(
+            lambda a, b: a * b, 'int', 'int', '__mul__', 'int')
+        self._define_primitive_operator(
+            lambda a, b: a * b, 'str', 'int', '__mul__', 'str')
 
         for name, func in [('__eq__', lambda a, b: a == b),
                            ('__ne__', lambda a, b: a != b),
@@ -57,26 +292,297 @@ class TypeContext(object):
             self._define_primitive_func(func, 'bool', 'int', name, 'int')
 
         def type_constructor(class_value):
-            return self._make_value(class_value, None, {})
+            return InstanceValue(class_value)
         self.type_type.attributes['__call__'] = self._make_function(
             type_constructor)
 
-        def list_getitem(list_value, index):
-            if index.type is not self.int_type:
-                raise TypeError('list indices must be integers, not ' +
-                                index.type.data)
-            return list_value.data[index.data]
-        self.list_type.attributes['__getitem__'] = self._make_function(
-            list_getitem)
+        def list_getitem(budget, list_value, index):
+            if index.type is self.int_type:
+                return list_value.data[index.data]
+            elif index.type is self.slice_type:
+                return self._slice_list(budget, list_value, index.data)
+            raise TypeError('list indices must be integers, not ' +
+                            index.type.data)
+        self.list_type.attributes['__getitem__'] = \
+            self._make_budgeted_function(list_getitem)
 
         def list_setitem(list_value, index, value):
             if index.type is not self.int_type:
                 raise TypeError('list indices must be integers, not ' +
                                 index.type.data)
-            list_value.data[index.data] = value
+            data = self.writable_list_data(list_value)
+            if type(data) is IntList:
+                if value.type is self.int_type:
+                    try:
+                        data.ints[index.data] = value.data
+                        return
+                    except OverflowError:
+                        pass
+                    except IndexError:
+                        raise IndexError(
+                            'list assignment index out of range')
+                data = list_value.data = data.to_values()
+            data[index.data] = value
         self.list_type.attributes['__setitem__'] = self._make_function(
             list_setitem)
 
+        def list_iter(list_value):
+            return PrimitiveValue(self.list_iterator_type,
+                                  iter(self.iterate_list(list_value)))
+        self.list_type.attributes['__iter__'] = self._make_function(
+            list_iter)
+        self._define_iterator_methods(self.list_iterator_type)
+
+        # Lists grow in place, in amortized constant time per element for
+        # both storages, as host lists and arrays over-allocate.
+        def list_append(budget, list_value, value):
+            if budget is not None:
+                budget.allocate_lists(1)
+            data = self.writable_list_data(list_value)
+            if type(data) is IntList:
+                if value.type is self.int_type:
+                    try:
+                        data.ints.append(value.data)
+                        return self.none_value
+                    except OverflowError:
+                        pass
+                data = list_value.data = data.to_values()
+            data.append(value)
+            return self.none_value
+        self.list_type.attributes['append'] = self._make_budgeted_function(
+            list_append)
+
+        builtin_iterator_types = (self.list_iterator_type,
+                                  self.range_iterator_type)
+
+        def list_extend(budget, list_value, iterable):
+            # The elements are read before any are added, so that a list
+            # can be extended with itself. They are charged to the budget
+            # before they are stored anywhere, so that a huge range
+            # raises rather than filling memory first.
+            if iterable.type is self.list_type:
+                if budget is not None:
+                    budget.allocate_lists(len(iterable.data))
+                elements = iterable.data
+                if type(elements) is ListSlice:
+                    elements = elements.copy()
+            elif iterable.type is self.range_type:
+                if budget is not None:
+                    budget.allocate_lists(len(iterable.data))
+                elements = IntList(array(INT_LIST_TYPECODE, iterable.data),
+                                   self.int_value)
+            elif iterable.type in builtin_iterator_types:
+                # An iterator's length isn't known up front, so it's read
+                # and charged a chunk at a time.
+                elements = []
+                while True:
+                    chunk = list(islice(iterable.data, EXTEND_CHUNK_LENGTH))
+                    if budget is not None:
+                        budget.allocate_lists(len(chunk))
+                    elements.extend(chunk)
+                    if len(chunk) < EXTEND_CHUNK_LENGTH:
+                        break
+            else:
+                raise TypeError(
+                    "extend() argument must be a list, range or builtin "
+                    "iterator, not '%s'" % iterable.type.data)
+            data = self.writable_list_data(list_value)
+            if type(data) is IntList:
+                if type(elements) is IntList:
+                    data.ints.extend(elements.ints)
+                    return self.none_value
+                if all(element.type is self.int_type
+                       for element in elements):
+                    try:
+                        data.ints.extend(
+                            [element.data for element in elements])
+                        return self.none_value
+                    except OverflowError:
+                        pass
+                data = list_value.data = data.to_values()
+            data.extend(elements)
+            return self.none_value
+        self.list_type.attributes['extend'] = self._make_budgeted_function(
+            list_extend)
+
+        def list_pop(list_value, *args):
+            if len(args) > 1:
+                raise TypeError('pop expected at most 1 arguments, got %d' %
+                                len(args))
+            if args and args[0].type is not self.int_type:
+                raise TypeError('an integer is required')
+            index = args[0].data if args else -1
+            data = self.writable_list_data(list_value)
+            if not data:
+                raise IndexError('pop from empty list')
+            if type(data) is IntList:
+                return self.int_value(data.ints.pop(index))
+            return data.pop(index)
+        self.list_type.attributes['pop'] = self._make_function(list_pop)
+
+        # A range holds a host xrange, so it takes the same constant
+        # memory however many ints it covers, and its ints are only
+        # boxed as they are used.
+        def range_getitem(range_value, index):
+            if index.type is not self.int_type:
+                raise TypeError('sequence index must be integer, not ' +
+                                index.type.data)
+            return self.int_value(range_value.data[index.data])
+        self.range_type.attributes['__getitem__'] = self._make_function(
+            range_getitem)
+        self._define_primitive_func(
+            lambda data: imap(self.int_value, data), 'range_iterator',
+            'range', '__iter__')
+        self._define_iterator_methods(self.range_iterator_type)
+
+        # The builtin functions that every program can use, unless it
+        # assigns something else to their names.
+        self.builtins = {}
+
+        def builtin_range(*args):
+            if not 1 <= len(args) <= 3:
+                raise TypeError('range expected 1 to 3 arguments, got %d' %
+                                len(args))
+            for arg in args:
+                if arg.type is not self.int_type:
+                    raise TypeError('range() integer argument expected, '
+                                    'got ' + arg.type.data)
+            return PrimitiveValue(self.range_type,
+                                  xrange(*[arg.data for arg in args]))
+        self.builtins['range'] = self._make_function(builtin_range)
+        self.builtins['xrange'] = self.builtins['range']
+
+        sized_types = (self.str_type, self.list_type, self.range_type)
+
+        def builtin_len(value):
+            if value.type not in sized_types:
+                raise TypeError("object of type '%s' has no len()" %
+                                value.type.data)
+            return self.int_value(len(value.data))
+        self.builtins['len'] = self._make_function(builtin_len)
+
+    def _define_iterator_methods(self, iterator_type):
+        """Makes iterator_type an iterator over the host iterator in the
+        data of its values, which must produce Values.
+        """
+        def iterator_next(iterator):
+            if iterator.type is not iterator_type:
+                raise TypeError('Unexpected type: ' + str(iterator.type))
+            # As in Python, this raises StopIteration once it's exhausted.
+            return next(iterator.data)
+        iterator_type.attributes['__iter__'] = self._make_function(
+            lambda iterator: iterator)
+        iterator_type.attributes['next'] = self._make_function(
+            iterator_next)
+
+    def list_value(self, elements):
+        """
+        Creates a list, which stores its elements unboxed in an IntList
+        if they are all ints that fit.
+        @type elements: list
+        @param elements: The Values of the elements, which the new list
+        may take ownership of.
+        @rtype: Value
+        """
+        int_type = self.int_type
+        for element in elements:
+            if element.type is not int_type:
+                return ListValue(self.list_type, elements)
+        try:
+            ints = array(INT_LIST_TYPECODE,
+                         [element.data for element in elements])
+        except OverflowError:
+            return ListValue(self.list_type, elements)
+        return ListValue(self.list_type, IntList(ints, self.int_value))
+
+    def iterate_list(self, list_value):
+        """
+        @return: A host iterable of the elements of the list, which sees
+        changes made to the list while iterating, like a host list
+        iterator does.
+        """
+        data = list_value.data
+        if type(data) is list:
+            # A list never swaps a host list for another storage.
+            return data
+        return self._iterate_storage(list_value, data)
+
+    def _iterate_storage(self, list_value, storage):
+        for index, value in enumerate(storage):
+            yield value
+            if list_value.data is not storage:
+                # The list was given new storage, such as a host list
+                # once something other than an int was stored in it, so
+                # the rest of it is there.
+                for value in islice(self.iterate_list(list_value),
+                                    index + 1, None):
+                    yield value
+                return
+
+    def writable_list_data(self, list_value):
+        """
+        Prepares the list to be modified in place, which gives any slices
+        viewing its storage a copy of their elements, and gives the list
+        storage of its own if it's a slice.
+        @return: The storage of the list, a host list or IntList.
+        """
+        source = list_value.slice_source
+        if source is not None:
+            source.detach()
+            list_value.slice_source = None
+        data = list_value.data
+        if type(data) is ListSlice:
+            data = list_value.data = data.copy()
+        return data
+
+    def _slice_list(self, budget, list_value, bounds):
+        """
+        @type budget: Budget
+        @type bounds: slice
+        @param bounds: The data of a slice Value.
+        @return: A new list of the elements of list_value within bounds,
+        which views the elements rather than copying them if there are
+        enough.
+        """
+        data = list_value.data
+        start, stop, _ = slice(self._slice_index(bounds.start),
+                               self._slice_index(bounds.stop)).indices(
+                                   len(data))
+        stop = max(start, stop)
+        if budget is not None:
+            # Views are charged like copies, so that the limits don't
+            # depend on how a slice is stored.
+            budget.allocate_lists(stop - start)
+        if stop - start < SLICE_VIEW_MIN_LENGTH:
+            return ListValue(self.list_type, copy_storage(data, start, stop))
+        if type(data) is ListSlice:
+            # Slices of slices view the original elements.
+            return ListValue(self.list_type,
+                             ListSlice(data.source, data.start + start,
+                                       data.start + stop))
+        source = list_value.slice_source
+        if source is None:
+            source = list_value.slice_source = SliceSource(data)
+        source.include(start, stop)
+        return ListValue(self.list_type, ListSlice(source, start, stop))
+
+    def _slice_index(self, value):
+        if value.type is self.int_type:
+            return value.data
+        elif value is self.none_value:
+            return None
+        raise TypeError('slice indices must be integers or None')
+
+    def slice_value(self, start, stop):
+        """
+        @type start: Value
+        @type stop: Value
+        @return: The key of the slice xs[start:stop], whose data is a host
+        slice of the two Values.
+        @rtype: Value
+        """
+        return PrimitiveValue(self.slice_type, slice(start, stop))
+
     def bool_value(self, b):
         assert isinstance(b, bool)
         if b:
@@ -84,6 +590,31 @@ class TypeContext(object):
         else:
             return self.false_value
 
+    def int_value(self, n):
+        """
+        @return: A Value for the int n, which is canonical if n is small.
+        @rtype: Value
+        """
+        if self.SMALL_INT_MIN <= n <= self.SMALL_INT_MAX:
+            return self.small_ints[n - self.SMALL_INT_MIN]
+        return PrimitiveValue(self.int_type, n)
+
+    def interned_str_value(self, s):
+        """Used for string literals, so that occurrences of the same short
+        literal share one Value, as long as it's among the
+        INTERNED_STRS_CAPACITY most recently used. Longer literals get a
+        Value of their own, as non-identifier constants often do in
+        CPython.
+        @rtype: Value
+        """
+        if len(s) > self.MAX_INTERNED_STR_LENGTH:
+            return PrimitiveValue(self.str_type, s)
+        value = self.interned_strs.get(s)
+        if value is None:
+            value = PrimitiveValue(self.str_type, s)
+            self.interned_strs.put(s, value)
+        return value
+
     def _define_primitive_func(self, func, return_type_name, base_type_name,
                                func_name, *arg_type_names):
         base_type = self._resolve_primitive(base_type_name)
@@ -91,6 +622,32 @@ class TypeContext(object):
         arg_types = tuple(self._resolve_primitive(t) for t in arg_type_names)
         base_type.attributes[func_name] = self._make_primitive_function(
             return_type, func, *((base_type,) + arg_types))
+        if len(arg_types) == 1:
+            self._define_primitive_operator(
+                func, return_type_name, base_type_name, func_name,
+                arg_type_names[0])
+
+    def _define_primitive_operator(self, func, return_type_name,
+                                   left_type_name, func_name,
+                                   right_type_name):
+        return_type = self._resolve_primitive(return_type_name)
+        key = (func_name,
+               id(self._resolve_primitive(left_type_name)),
+               id(self._resolve_primitive(right_type_name)))
+        if return_type is self.bool_type:
+            bool_value = self.bool_value
+            self.primitive_operators[key] = \
+                lambda a, b: bool_value(func(a, b))
+        elif return_type is self.int_type:
+            int_value = self.int_value
+            self.primitive_operators[key] = \
+                lambda a, b: int_value(func(a, b))
+        else:
+            self.primitive_operators[key] = \
+                lambda a, b: PrimitiveValue(return_type, func(a, b))
+
+    def _make_type(self, name):
+        return TypeValue(self.type_type, name, {})
 
     def _resolve_primitive(self, primitive_name):
         return getattr(self, primitive_name + '_type')
@@ -104,19 +661,21 @@ class TypeContext(object):
 
             result_data = primitive_function(
                 *(arg.data for arg in result_args))
-            return self._make_value(return_type, result_data, {})
+            return self._make_value(return_type, result_data)
         return self._make_function(result_fun)
 
-    def _make_value(self, type, data, attributes):
-        """This must be called whenever a value is created that could
-        be a bool or None.
+    def _make_value(self, type, data):
+        """This must be called whenever a primitive value is created that could
+        be a bool, None or an int.
         """
         if type is self.bool_type:
             return self.bool_value(data)
         elif type is self.none_type:
             return self.none_value
+        elif type is self.int_type:
+            return self.int_value(data)
         else:
-            return Value(type, data, attributes)
+            return PrimitiveValue(type, data)
 
     # Note that this method should not be called in __init__ until the
     # function_type attribute has been set.
@@ -126,19 +685,21 @@ class TypeContext(object):
         number of Value types and returns a Value type.
         @rtype : Value
         """
-        return Value(self.function_type, func, {})
+        return BuiltinFunctionValue(self.function_type, func)
+
+    def _make_budgeted_function(self, func):
+        """
+        @param func: Like the func of _make_function, but taking the
+        Budget of the calling execution, or None, as its first argument.
+        See BudgetedBuiltin.
+        @rtype: Value
+        """
+        return BuiltinFunctionValue(self.function_type,
+                                    BudgetedBuiltin(func))
 
 
 def create_type_type_value():
-    class TypeTypeValue(Value):
-        """This is a hack so that we can make a namedtuple that
-        contains itself. This should be the one case in the Python
-        language where an object's type is itself, and in all other
-        cases the attributes on a value are immutable.
-        """
-        def __getattribute__(self, name):
-            if name == 'type':
-                return self
-            else:
-                return Value.__getattribute__(self, name)
-    return TypeTypeValue(None, 'type', {})
+    """The one value whose type is itself."""
+    type_type = TypeValue(None, 'type', {})
+    type_type.type = type_type
+    return type_type
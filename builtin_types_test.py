@@ -0,0 +1,179 @@
+import unittest
+
+from appy_ast import ListValue
+from builtin_types import (IntList, ListSlice, TypeContext,
+                           SLICE_VIEW_MIN_LENGTH)
+
+
+class IntListTest(unittest.TestCase):
+    def setUp(self):
+        self.type_context = TypeContext()
+
+    def test_int_lists_are_unboxed(self):
+        list_value = self.int_list([1, 2, 1000])
+        self.assertIsInstance(list_value.data, IntList)
+        self.assertEqual([1, 2, 1000], list(list_value.data.ints))
+        self.assertIsInstance(self.type_context.list_value([]).data,
+                              IntList)
+
+    def test_other_lists_are_generic(self):
+        for elements in [[self.int_value(1), self.type_context.none_value],
+                         [self.int_value(1), self.int_value(2 ** 70)]]:
+            list_value = self.type_context.list_value(elements)
+            self.assertIs(elements, list_value.data)
+
+    def test_reads_box_ints(self):
+        int_list = self.int_list([3, 1000]).data
+        self.assertEqual(2, len(int_list))
+        self.assertIs(self.int_value(3), int_list[0])
+        self.assertEqual(self.int_value(1000), int_list[-1])
+        self.assertEqual([self.int_value(3), self.int_value(1000)],
+                         list(int_list))
+        self.assertRaises(IndexError, int_list.__getitem__, 2)
+
+    def test_reads_of_big_ints_are_new_values(self):
+        big = self.int_value(1000)
+        int_list = self.type_context.list_value([big]).data
+        self.assertEqual(big, int_list[0])
+        self.assertIsNot(big, int_list[0])
+        self.assertIsNot(int_list[0], int_list[0])
+
+    def test_same_as_generic_list(self):
+        elements = [self.int_value(5), self.int_value(6)]
+        int_list_value = self.int_list([5, 6])
+        generic_value = ListValue(self.type_context.list_type, elements)
+        self.assertEqual(generic_value, int_list_value)
+        self.assertEqual(int_list_value, generic_value)
+        self.assertNotEqual(self.int_list([5]), generic_value)
+        self.assertEqual(str(elements), str(int_list_value.data))
+
+    def test_setitem(self):
+        list_value = self.int_list([1, 2])
+        self.setitem(list_value, 0, self.int_value(7))
+        self.assertIsInstance(list_value.data, IntList)
+        self.assertEqual([7, 2], list(list_value.data.ints))
+
+    def test_setitem_falls_back_to_generic(self):
+        for value in [self.type_context.none_value,
+                      self.int_value(2 ** 70)]:
+            list_value = self.int_list([1, 2])
+            self.setitem(list_value, 1, value)
+            self.assertEqual([self.int_value(1), value], list_value.data)
+            self.assertIs(list, type(list_value.data))
+
+    def test_setitem_out_of_range(self):
+        self.assertRaises(IndexError, self.setitem, self.int_list([1]), 1,
+                          self.int_value(2))
+
+    def test_iteration_sees_fallback(self):
+        list_value = self.int_list([1, 2, 3])
+        seen = []
+        for value in self.type_context.iterate_list(list_value):
+            seen.append(value)
+            if len(seen) == 1:
+                self.setitem(list_value, 1, self.type_context.none_value)
+        self.assertEqual([self.int_value(1), self.type_context.none_value,
+                          self.int_value(3)], seen)
+
+    def int_list(self, ints):
+        return self.type_context.list_value(
+            [self.int_value(n) for n in ints])
+
+    def int_value(self, n):
+        return self.type_context.int_value(n)
+
+    def setitem(self, list_value, index, value):
+        setitem = self.type_context.list_type.attributes['__setitem__']
+        setitem.data(list_value, self.int_value(index), value)
+
+
+class InternedStrTest(unittest.TestCase):
+    def setUp(self):
+        self.type_context = TypeContext()
+
+    def test_short_literals_are_shared(self):
+        value = self.type_context.interned_str_value('hello')
+        self.assertIs(value, self.type_context.interned_str_value('hello'))
+        self.assertEqual('hello', value.data)
+
+    def test_long_literals_are_not_interned(self):
+        s = 'x' * (TypeContext.MAX_INTERNED_STR_LENGTH + 1)
+        value = self.type_context.interned_str_value(s)
+        self.assertEqual(s, value.data)
+        self.assertIsNot(value, self.type_context.interned_str_value(s))
+        self.assertEqual(0, self.type_context.interned_strs.stats().size)
+
+    def test_interned_strs_are_bounded(self):
+        for i in range(TypeContext.INTERNED_STRS_CAPACITY + 10):
+            self.type_context.interned_str_value(str(i))
+        self.assertEqual(TypeContext.INTERNED_STRS_CAPACITY,
+                         self.type_context.interned_strs.stats().size)
+
+
+class ListSliceTest(unittest.TestCase):
+    def setUp(self):
+        self.type_context = TypeContext()
+        self.length = SLICE_VIEW_MIN_LENGTH * 4
+        self.list_value = self.type_context.list_value(
+            [self.int_value(n) for n in range(self.length)])
+
+    def test_long_slices_are_views(self):
+        view = self.slice(self.list_value, 1, self.length)
+        self.assertIsInstance(view.data, ListSlice)
+        self.assertIs(self.list_value.data, view.data.source.data)
+        self.assertEqual(range(1, self.length),
+                         [value.data for value in view.data])
+        self.assertEqual(self.int_value(2), view.data[1])
+        self.assertEqual(self.int_value(self.length - 1), view.data[-1])
+        self.assertRaises(IndexError, view.data.__getitem__,
+                          self.length - 1)
+
+    def test_short_slices_are_copies(self):
+        copy = self.slice(self.list_value, 0, SLICE_VIEW_MIN_LENGTH - 1)
+        self.assertIsInstance(copy.data, IntList)
+        self.assertIsNone(self.list_value.slice_source)
+
+    def test_slices_of_views_view_the_list(self):
+        view = self.slice(self.list_value, 10, self.length)
+        inner = self.slice(view, 10, self.length - 10)
+        self.assertIs(view.data.source, inner.data.source)
+        self.assertEqual(20, inner.data.start)
+        self.assertEqual(self.int_value(20), inner.data[0])
+
+    def test_modifying_list_copies_viewed_range(self):
+        int_list = self.list_value.data
+        view = self.slice(self.list_value, 10, 100)
+        self.setitem(self.list_value, 50, self.int_value(7))
+        # The list keeps modifying its storage in place, while the view
+        # gets a copy of just the elements it covers.
+        self.assertIs(int_list, self.list_value.data)
+        self.assertEqual(7, int_list.ints[50])
+        self.assertIsNone(self.list_value.slice_source)
+        self.assertEqual(90, len(view.data.source.data))
+        self.assertEqual(self.int_value(50), view.data[40])
+        self.assertEqual(range(10, 100), [value.data for value in view.data])
+
+    def test_modifying_view_copies_it(self):
+        view = self.slice(self.list_value, 0, 100)
+        self.setitem(view, 0, self.int_value(7))
+        self.assertIsInstance(view.data, IntList)
+        self.assertEqual(100, len(view.data))
+        self.assertEqual(self.int_value(0), self.list_value.data[0])
+
+    def int_value(self, n):
+        return self.type_context.int_value(n)
+
+    def slice(self, list_value, start, stop):
+        getitem = self.type_context.list_type.attributes['__getitem__']
+        bounds = self.type_context.slice_value(self.int_value(start),
+                                               self.int_value(stop))
+        # No budget, as when running without limits.
+        return getitem.data.func(None, list_value, bounds)
+
+    def setitem(self, list_value, index, value):
+        setitem = self.type_context.list_type.attributes['__setitem__']
+        setitem.data(list_value, self.int_value(index), value)
+
+
+if __name__ == '__main__':
+    unittest.main()
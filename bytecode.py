@@ -0,0 +1,391 @@
+from collections import namedtuple
+from appy_ast import (ExpressionStatement, PrintStatement, Block, Assignment,
+                      Variable, IfStatement, WhileStatement, ForStatement,
+                      DefStatement, FunctionCall, ClassStatement,
+                      AttributeAccess, ListLiteral, GetItem, Slice,
+                      BinaryOperator, Literal, LocalVariable, ReturnStatement,
+                      STATEMENT_TYPES, position_lineno)
+from interpreter import ExecutionEnvironment
+
+
+# Every instruction is an opcode followed by a single integer argument,
+# which is an index into the constant or name pool, a count, or a jump
+# target depending on the opcode. Opcodes that don't need an argument
+# are given 0. TOS refers to the top of the value stack.
+
+# Push constants[arg].
+LOAD_CONST = 0
+# Push the value of the variable names[arg].
+LOAD_NAME = 1
+# Pop a value and assign it to the variable names[arg].
+STORE_NAME = 2
+# Replace TOS with its attribute names[arg].
+LOAD_ATTR = 3
+# Pop obj, then value, and set the attribute names[arg] on obj.
+STORE_ATTR = 4
+# Pop key, then obj, and push obj[key].
+GET_ITEM = 5
+# Pop key, obj, then value, and set obj[key] = value.
+SET_ITEM = 6
+# Pop right, then left, and push the result of calling the method
+# names[arg] on left.
+BINARY_OP = 7
+# Pop right, then left, and push (left is right).
+IS = 8
+# Replace the top arg values with a list containing them.
+BUILD_LIST = 9
+# Pop arg arguments, then the function, and push the result of the call.
+CALL = 10
+# Push a function for the DefStatement constants[arg], closing over the
+# current scope.
+MAKE_FUNCTION = 11
+# Run the class body Code constants[arg] in a new scope and push the
+# type it returns.
+ENTER_CLASS = 12
+# Push a type named names[arg] whose attributes are the current scope's
+# mappings.
+BUILD_TYPE = 13
+# Pop a value and print it.
+PRINT = 14
+# Discard TOS.
+POP = 15
+# Continue at instruction offset arg.
+JUMP = 16
+# Pop a value and continue at instruction offset arg if it is false.
+JUMP_IF_FALSE = 17
+# Pop a value and return it to the caller.
+RETURN_VALUE = 18
+# Push the value of slot arg in the current function scope.
+LOAD_FAST = 19
+# Pop a value and store it in slot arg of the current function scope.
+STORE_FAST = 20
+# Push the value of the local at the (depth, index) address in
+# constants[arg].
+LOAD_DEREF = 21
+# Pop obj and look up the method names[arg] on it. If it is a function
+# on the type, push the function and obj, otherwise push the attribute
+# and None.
+LOAD_METHOD = 22
+# Pop arg arguments, then the two values pushed by LOAD_METHOD, and push
+# the result of the call.
+CALL_METHOD = 23
+# If TOS is false, continue at instruction offset arg and leave it on
+# the stack, otherwise pop it.
+JUMP_IF_FALSE_OR_POP = 24
+# If TOS is true, continue at instruction offset arg and leave it on
+# the stack, otherwise pop it.
+JUMP_IF_TRUE_OR_POP = 25
+# Tell the profiler that a statement on line arg is starting. Only
+# emitted when compiling for a profiler.
+LINE = 26
+# Replace TOS with a host iterator over the Values that a for loop over
+# it runs with.
+GET_ITER = 27
+# Push the next value of the iterator at TOS, or pop the iterator and
+# continue at instruction offset arg if it is exhausted.
+FOR_ITER = 28
+# Pop stop, then start, and push the slice key start:stop.
+BUILD_SLICE = 29
+
+OPCODE_NAMES = dict((opcode, name) for (name, opcode) in globals().items()
+                    if name.isupper() and isinstance(opcode, int))
+
+
+class Code(namedtuple('Code',
+                        ['instructions', 'constants', 'names'])):
+    """
+    * instructions is a flat list of ints, alternating between opcodes
+      and their arguments.
+    * constants is a list of Values and other compile-time objects
+      referred to by the instructions.
+    * names is a list of strings referred to by the instructions.
+    """
+    def disassemble(self):
+        lines = []
+        for offset in range(0, len(self.instructions), 2):
+            opcode = self.instructions[offset]
+            arg = self.instructions[offset + 1]
+            lines.append('%4d %-15s %d' % (offset, OPCODE_NAMES[opcode], arg))
+        return '\n'.join(lines)
+
+
+class BytecodeCompiler(object):
+    """Compiles AST nodes into Code objects.
+
+    Function bodies are compiled along with the code that defines them
+    and recorded in function_codes, since a FunctionData only refers to
+    the AST of its body.
+    """
+
+    BINARY_OPERATORS = ExecutionEnvironment.BINARY_OPERATORS
+
+    SHORT_CIRCUIT_JUMPS = {
+        'and': JUMP_IF_FALSE_OR_POP,
+        'or': JUMP_IF_TRUE_OR_POP,
+    }
+
+    def __init__(self, type_context, trace_lines=False):
+        """
+        @type type_context: TypeContext
+        @type trace_lines: bool
+        @param trace_lines: Whether to emit a LINE instruction before
+        each statement, for the profiler.
+        """
+        self.type_context = type_context
+        self.trace_lines = trace_lines
+        # Maps id(body) to (body, Code) for every function body, keeping
+        # the body alive so that the id stays unique.
+        self.function_codes = {}
+
+    def compile_statement(self, statement):
+        """
+        @return: A Code object that runs the statement and returns the
+        None value.
+        """
+        code_builder = CodeBuilder()
+        self._compile(code_builder, statement)
+        code_builder.emit(LOAD_CONST,
+                          code_builder.constant(self.type_context.none_value))
+        code_builder.emit(RETURN_VALUE)
+        return code_builder.build()
+
+    def compile_expression(self, expression):
+        """
+        @return: A Code object that returns the value of the expression.
+        """
+        code_builder = CodeBuilder()
+        self._compile(code_builder, expression)
+        code_builder.emit(RETURN_VALUE)
+        return code_builder.build()
+
+    def get_function_code(self, body):
+        return self.function_codes[id(body)][1]
+
+    def _compile(self, code_builder, node):
+        try:
+            method = getattr(self, '_compile_' + node.__class__.__name__)
+        except AttributeError:
+            raise NotImplementedError(
+                'Missing handler for node ' + str(node))
+        if (self.trace_lines and isinstance(node, STATEMENT_TYPES) and
+                node.position is not None):
+            code_builder.emit(LINE, position_lineno(node.position))
+        method(code_builder, node)
+
+    def _compile_store(self, code_builder, assignable):
+        """Emits code that pops a value and assigns it to assignable."""
+        try:
+            method = getattr(
+                self, '_compile_store_' + assignable.__class__.__name__)
+        except AttributeError:
+            raise NotImplementedError(
+                'Missing handler for assignable ' + str(assignable))
+        method(code_builder, assignable)
+
+    def _compile_Block(self, code_builder, statement):
+        assert isinstance(statement, Block)
+        for sub_statement in statement.statements:
+            self._compile(code_builder, sub_statement)
+
+    def _compile_Assignment(self, code_builder, statement):
+        assert isinstance(statement, Assignment)
+        self._compile(code_builder, statement.right)
+        self._compile_store(code_builder, statement.left)
+
+    def _compile_ExpressionStatement(self, code_builder, statement):
+        assert isinstance(statement, ExpressionStatement)
+        self._compile(code_builder, statement.expr)
+        code_builder.emit(POP)
+
+    def _compile_PassStatement(self, code_builder, statement):
+        pass
+
+    def _compile_PrintStatement(self, code_builder, statement):
+        assert isinstance(statement, PrintStatement)
+        self._compile(code_builder, statement.expr)
+        code_builder.emit(PRINT)
+
+    def _compile_ReturnStatement(self, code_builder, statement):
+        assert isinstance(statement, ReturnStatement)
+        self._compile(code_builder, statement.expr)
+        code_builder.emit(RETURN_VALUE)
+
+    def _compile_IfStatement(self, code_builder, statement):
+        assert isinstance(statement, IfStatement)
+        self._compile(code_builder, statement.condition)
+        jump = code_builder.emit(JUMP_IF_FALSE)
+        self._compile(code_builder, statement.statement)
+        code_builder.patch_jump(jump)
+
+    def _compile_WhileStatement(self, code_builder, statement):
+        assert isinstance(statement, WhileStatement)
+        loop_start = code_builder.offset()
+        self._compile(code_builder, statement.condition)
+        exit_jump = code_builder.emit(JUMP_IF_FALSE)
+        self._compile(code_builder, statement.statement)
+        code_builder.emit(JUMP, loop_start)
+        code_builder.patch_jump(exit_jump)
+
+    def _compile_ForStatement(self, code_builder, statement):
+        assert isinstance(statement, ForStatement)
+        self._compile(code_builder, statement.iterable)
+        code_builder.emit(GET_ITER)
+        loop_start = code_builder.emit(FOR_ITER)
+        self._compile_store(code_builder, statement.target)
+        self._compile(code_builder, statement.statement)
+        code_builder.emit(JUMP, loop_start)
+        code_builder.patch_jump(loop_start)
+
+    def _compile_DefStatement(self, code_builder, statement):
+        assert isinstance(statement, DefStatement)
+        body = statement.body
+        self.function_codes[id(body)] = (body,
+                                         self.compile_statement(body))
+        code_builder.emit(MAKE_FUNCTION, code_builder.constant(statement))
+        code_builder.emit(STORE_NAME, code_builder.name(statement.name))
+
+    def _compile_ClassStatement(self, code_builder, statement):
+        assert isinstance(statement, ClassStatement)
+        # TODO: Use the superclass.
+        body_builder = CodeBuilder()
+        self._compile(body_builder, statement.body)
+        body_builder.emit(BUILD_TYPE, body_builder.name(statement.name))
+        body_builder.emit(RETURN_VALUE)
+        code_builder.emit(ENTER_CLASS,
+                          code_builder.constant(body_builder.build()))
+        code_builder.emit(STORE_NAME, code_builder.name(statement.name))
+
+    def _compile_BinaryOperator(self, code_builder, expression):
+        assert isinstance(expression, BinaryOperator)
+        self._compile(code_builder, expression.left)
+        if expression.operator in self.SHORT_CIRCUIT_JUMPS:
+            jump = code_builder.emit(
+                self.SHORT_CIRCUIT_JUMPS[expression.operator])
+            self._compile(code_builder, expression.right)
+            code_builder.patch_jump(jump)
+            return
+        self._compile(code_builder, expression.right)
+        if expression.operator == 'is':
+            code_builder.emit(IS)
+        else:
+            code_builder.emit(BINARY_OP, code_builder.name(
+                self.BINARY_OPERATORS[expression.operator]))
+
+    def _compile_Literal(self, code_builder, expression):
+        assert isinstance(expression, Literal)
+        code_builder.emit(LOAD_CONST, code_builder.constant(expression.value))
+
+    def _compile_ListLiteral(self, code_builder, expression):
+        assert isinstance(expression, ListLiteral)
+        for expr in expression.expressions:
+            self._compile(code_builder, expr)
+        code_builder.emit(BUILD_LIST, len(expression.expressions))
+
+    def _compile_Variable(self, code_builder, expression):
+        assert isinstance(expression, Variable)
+        code_builder.emit(LOAD_NAME, code_builder.name(expression.name))
+
+    def _compile_LocalVariable(self, code_builder, expression):
+        assert isinstance(expression, LocalVariable)
+        if expression.depth == 0:
+            code_builder.emit(LOAD_FAST, expression.index)
+        else:
+            code_builder.emit(LOAD_DEREF, code_builder.constant(
+                (expression.depth, expression.index)))
+
+    def _compile_FunctionCall(self, code_builder, expression):
+        assert isinstance(expression, FunctionCall)
+        function_expr = expression.function_expr
+        if isinstance(function_expr, AttributeAccess):
+            self._compile(code_builder, function_expr.expr)
+            code_builder.emit(LOAD_METHOD,
+                              code_builder.name(function_expr.attr_name))
+            call_opcode = CALL_METHOD
+        else:
+            self._compile(code_builder, function_expr)
+            call_opcode = CALL
+        for arg in expression.args:
+            self._compile(code_builder, arg)
+        code_builder.emit(call_opcode, len(expression.args))
+
+    def _compile_AttributeAccess(self, code_builder, expression):
+        assert isinstance(expression, AttributeAccess)
+        self._compile(code_builder, expression.expr)
+        code_builder.emit(LOAD_ATTR, code_builder.name(expression.attr_name))
+
+    def _compile_GetItem(self, code_builder, expression):
+        assert isinstance(expression, GetItem)
+        self._compile(code_builder, expression.expr)
+        self._compile(code_builder, expression.key)
+        code_builder.emit(GET_ITEM)
+
+    def _compile_Slice(self, code_builder, expression):
+        assert isinstance(expression, Slice)
+        self._compile(code_builder, expression.start)
+        self._compile(code_builder, expression.stop)
+        code_builder.emit(BUILD_SLICE)
+
+    def _compile_store_Variable(self, code_builder, assignable):
+        assert isinstance(assignable, Variable)
+        code_builder.emit(STORE_NAME, code_builder.name(assignable.name))
+
+    def _compile_store_LocalVariable(self, code_builder, assignable):
+        assert isinstance(assignable, LocalVariable)
+        assert assignable.depth == 0
+        code_builder.emit(STORE_FAST, assignable.index)
+
+    def _compile_store_AttributeAccess(self, code_builder, assignable):
+        assert isinstance(assignable, AttributeAccess)
+        self._compile(code_builder, assignable.expr)
+        code_builder.emit(STORE_ATTR, code_builder.name(assignable.attr_name))
+
+    def _compile_store_GetItem(self, code_builder, assignable):
+        assert isinstance(assignable, GetItem)
+        self._compile(code_builder, assignable.expr)
+        self._compile(code_builder, assignable.key)
+        code_builder.emit(SET_ITEM)
+
+
+class CodeBuilder(object):
+    """Accumulates the instructions and pools for a single Code object."""
+
+    def __init__(self):
+        self.instructions = []
+        self.constants = []
+        self.names = []
+        # Constants can be unhashable, so they are deduplicated by
+        # identity.
+        self.constant_indices = {}
+        self.name_indices = {}
+
+    def emit(self, opcode, arg=0):
+        """
+        @return: The offset of the emitted instruction.
+        """
+        offset = len(self.instructions)
+        self.instructions.append(opcode)
+        self.instructions.append(arg)
+        return offset
+
+    def offset(self):
+        return len(self.instructions)
+
+    def patch_jump(self, jump_offset):
+        """Points the jump at jump_offset to the current offset."""
+        self.instructions[jump_offset + 1] = self.offset()
+
+    def constant(self, value):
+        key = id(value)
+        if key not in self.constant_indices:
+            self.constant_indices[key] = len(self.constants)
+            self.constants.append(value)
+        return self.constant_indices[key]
+
+    def name(self, name):
+        if name not in self.name_indices:
+            self.name_indices[name] = len(self.names)
+            self.names.append(name)
+        return self.name_indices[name]
+
+    def build(self):
+        return Code(self.instructions, self.constants, self.names)
@@ -0,0 +1,443 @@
+import gc
+from appy_ast import (TypeValue, ExpressionStatement, PrintStatement, Block,
+                      Assignment, Variable, IfStatement, WhileStatement,
+                      ForStatement, DefStatement, FunctionCall,
+                      ClassStatement, AttributeAccess, ListLiteral, GetItem,
+                      Slice, BinaryOperator, Literal, LocalVariable,
+                      ReturnStatement, STATEMENT_TYPES, position_lineno)
+from builtin_types import lookup_type_attribute
+from interpreter import ExecutionEnvironment
+from resolver import may_return
+
+
+class ClosureEnvironment(ExecutionEnvironment):
+    """Execution engine that compiles each AST node into a Python
+    closure with its children already compiled, so that running the
+    program does no per-node dispatch.
+
+    Every compiled node is a function that takes the ScopeChain to run
+    in. Compiled expressions return a Value. Compiled statements return
+    None, or the Value of a return statement that ended them, as in
+    ExecutionEnvironment.execute_statement. Only blocks and loops that
+    may_return check the results of their statements. The object model
+    helpers (attribute lookup, function calls, etc.) are shared with the
+    tree-walking ExecutionEnvironment.
+
+    Statements only report to the profiler, and loops and lists to the
+    budget, if the environment has them when the code is compiled, so
+    code without them runs exactly as it would otherwise.
+    """
+
+    def __init__(self, stdout_handler, type_context, scope_chain=None,
+                 **kwargs):
+        ExecutionEnvironment.__init__(
+            self, stdout_handler, type_context, scope_chain, **kwargs)
+        # Maps id(body) to (body, compiled body) for every function
+        # body, keeping the body alive so that the id stays unique.
+        self.compiled_bodies = {}
+
+    def execute_statement(self, statement):
+        self.compile(statement)(self.scope_chain)
+
+    def evaluate_expression(self, expression):
+        '''
+        @rtype: Value
+        '''
+        return self.compile(expression)(self.scope_chain)
+
+    def compile(self, node):
+        """
+        @param node: A statement or expression AST node.
+        @return: A function from ScopeChain to the result of the node.
+        """
+        # Compiling allocates lots of closures and no garbage, so the
+        # cyclic GC would just repeatedly rescan the growing tree.
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self._compile(node)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    def _compile(self, node):
+        try:
+            method = getattr(self, '_compile_' + node.__class__.__name__)
+        except AttributeError:
+            raise NotImplementedError(
+                'Missing handler for node ' + str(node))
+        compiled = method(node)
+        if (self.profiler is not None and
+                isinstance(node, STATEMENT_TYPES) and
+                node.position is not None):
+            compiled = self._profile_statement(compiled, node)
+        return compiled
+
+    def _profile_statement(self, compiled, statement):
+        line = self.profiler.line
+        lineno = position_lineno(statement.position)
+
+        def execute_profiled(scope):
+            line(lineno)
+            return compiled(scope)
+        return execute_profiled
+
+    def _compile_assign(self, assignable):
+        """
+        @param assignable: An assignable expression.
+        @return: A function taking a ScopeChain and a Value that
+        assigns the value to the appropriate place.
+        """
+        try:
+            method = getattr(
+                self, '_compile_assign_' + assignable.__class__.__name__)
+        except AttributeError:
+            raise NotImplementedError(
+                'Missing handler for assignable ' + str(assignable))
+        return method(assignable)
+
+    def _run_function_body(self, body, scope):
+        return self.compiled_bodies[id(body)][1](scope)
+
+    def _compile_Block(self, statement):
+        assert isinstance(statement, Block)
+        statements = tuple(self._compile(sub_statement)
+                           for sub_statement in statement.statements)
+        if may_return(statement):
+            def execute_returning_block(scope):
+                for sub_statement in statements:
+                    result = sub_statement(scope)
+                    if result is not None:
+                        return result
+            return execute_returning_block
+
+        def execute_block(scope):
+            for sub_statement in statements:
+                sub_statement(scope)
+        return execute_block
+
+    def _compile_Assignment(self, statement):
+        assert isinstance(statement, Assignment)
+        right = self._compile(statement.right)
+        assign = self._compile_assign(statement.left)
+
+        def execute_assignment(scope):
+            assign(scope, right(scope))
+        return execute_assignment
+
+    def _compile_ExpressionStatement(self, statement):
+        assert isinstance(statement, ExpressionStatement)
+        expr = self._compile(statement.expr)
+
+        def execute_expression_statement(scope):
+            expr(scope)
+        return execute_expression_statement
+
+    def _compile_PassStatement(self, statement):
+        def execute_pass(scope):
+            pass
+        return execute_pass
+
+    def _compile_PrintStatement(self, statement):
+        assert isinstance(statement, PrintStatement)
+        expr = self._compile(statement.expr)
+        stdout_handler = self.stdout_handler
+
+        def execute_print(scope):
+            stdout_handler(str(expr(scope).data))
+        return execute_print
+
+    def _compile_ReturnStatement(self, statement):
+        assert isinstance(statement, ReturnStatement)
+        expr = self._compile(statement.expr)
+
+        def execute_return(scope):
+            return expr(scope)
+        return execute_return
+
+    def _compile_IfStatement(self, statement):
+        assert isinstance(statement, IfStatement)
+        condition = self._compile(statement.condition)
+        body = self._compile(statement.statement)
+
+        def execute_if(scope):
+            if condition(scope).data:
+                return body(scope)
+        return execute_if
+
+    def _compile_WhileStatement(self, statement):
+        assert isinstance(statement, WhileStatement)
+        condition = self._compile(statement.condition)
+        body = self._compile(statement.statement)
+        if may_return(statement.statement):
+            tick = self.budget.tick if self.budget is not None else None
+
+            def execute_returning_while(scope):
+                while condition(scope).data:
+                    result = body(scope)
+                    if result is not None:
+                        return result
+                    if tick is not None:
+                        tick()
+            return execute_returning_while
+        if self.budget is not None:
+            tick = self.budget.tick
+
+            def execute_limited_while(scope):
+                while condition(scope).data:
+                    body(scope)
+                    tick()
+            return execute_limited_while
+
+        def execute_while(scope):
+            while condition(scope).data:
+                body(scope)
+        return execute_while
+
+    def _compile_ForStatement(self, statement):
+        assert isinstance(statement, ForStatement)
+        iterable = self._compile(statement.iterable)
+        assign = self._compile_assign(statement.target)
+        body = self._compile(statement.statement)
+        iterate = self._iterate
+        if may_return(statement.statement) or self.budget is not None:
+            tick = self.budget.tick if self.budget is not None else None
+
+            def execute_checked_for(scope):
+                for value in iterate(iterable(scope)):
+                    assign(scope, value)
+                    result = body(scope)
+                    if result is not None:
+                        return result
+                    if tick is not None:
+                        tick()
+            return execute_checked_for
+
+        def execute_for(scope):
+            for value in iterate(iterable(scope)):
+                assign(scope, value)
+                body(scope)
+        return execute_for
+
+    def _compile_DefStatement(self, statement):
+        assert isinstance(statement, DefStatement)
+        name = statement.name
+        body = statement.body
+        self.compiled_bodies[id(body)] = (body, self._compile(body))
+        create_function = self._create_function
+
+        def execute_def(scope):
+            scope.assign_name(name, create_function(statement, scope))
+        return execute_def
+
+    def _compile_ClassStatement(self, statement):
+        assert isinstance(statement, ClassStatement)
+        # TODO: Use the superclass.
+        name = statement.name
+        body = self._compile(statement.body)
+        type_type = self.type_context.type_type
+
+        def execute_class(scope):
+            class_scope = scope.with_pushed_mappings({})
+            body(class_scope)
+            scope.assign_name(
+                name, TypeValue(type_type, name, class_scope.mappings))
+        return execute_class
+
+    def _compile_BinaryOperator(self, expression):
+        assert isinstance(expression, BinaryOperator)
+        left = self._compile(expression.left)
+        right = self._compile(expression.right)
+        if expression.operator == 'is':
+            bool_value = self.type_context.bool_value
+
+            def evaluate_is(scope):
+                return bool_value(left(scope) is right(scope))
+            return evaluate_is
+        elif expression.operator == 'and':
+            def evaluate_and(scope):
+                left_value = left(scope)
+                if not left_value.data:
+                    return left_value
+                return right(scope)
+            return evaluate_and
+        elif expression.operator == 'or':
+            def evaluate_or(scope):
+                left_value = left(scope)
+                if left_value.data:
+                    return left_value
+                return right(scope)
+            return evaluate_or
+
+        op_name = self.BINARY_OPERATORS[expression.operator]
+        call_type_attribute = self._call_type_attribute
+        get_primitive_operator = self.type_context.primitive_operators.get
+
+        def evaluate_binary_operator(scope):
+            left_value = left(scope)
+            right_value = right(scope)
+            primitive_operator = get_primitive_operator(
+                (op_name, id(left_value.type), id(right_value.type)))
+            if primitive_operator is not None:
+                return primitive_operator(left_value.data, right_value.data)
+            return call_type_attribute(
+                left_value, lookup_type_attribute(left_value.type, op_name),
+                right_value)
+        return evaluate_binary_operator
+
+    def _compile_Literal(self, expression):
+        assert isinstance(expression, Literal)
+        value = expression.value
+
+        def evaluate_literal(scope):
+            return value
+        return evaluate_literal
+
+    def _compile_ListLiteral(self, expression):
+        assert isinstance(expression, ListLiteral)
+        exprs = [self._compile(expr) for expr in expression.expressions]
+        list_value = self.type_context.list_value
+        if self.budget is not None:
+            allocate_lists = self.budget.allocate_lists
+            count = len(exprs)
+
+            def evaluate_limited_list_literal(scope):
+                elements = [expr(scope) for expr in exprs]
+                allocate_lists(count)
+                return list_value(elements)
+            return evaluate_limited_list_literal
+
+        def evaluate_list_literal(scope):
+            return list_value([expr(scope) for expr in exprs])
+        return evaluate_list_literal
+
+    def _compile_Variable(self, expression):
+        assert isinstance(expression, Variable)
+        name = expression.name
+
+        def evaluate_variable(scope):
+            return scope.resolve_name(name)
+        return evaluate_variable
+
+    def _compile_LocalVariable(self, expression):
+        assert isinstance(expression, LocalVariable)
+        depth = expression.depth
+        index = expression.index
+        if depth > 0:
+            def evaluate_outer_local(scope):
+                return scope.load_local(depth, index)
+            return evaluate_outer_local
+
+        def evaluate_local(scope):
+            value = scope.slots[index]
+            if value is None:
+                return scope.load_slot(index)
+            return value
+        return evaluate_local
+
+    def _compile_FunctionCall(self, expression):
+        assert isinstance(expression, FunctionCall)
+        if isinstance(expression.function_expr, AttributeAccess):
+            return self._compile_method_call(expression)
+        function_expr = self._compile(expression.function_expr)
+        args = [self._compile(arg) for arg in expression.args]
+        evaluate_function = self._evaluate_function
+
+        def evaluate_function_call(scope):
+            function_value = function_expr(scope)
+            return evaluate_function(
+                function_value, *[arg(scope) for arg in args])
+        return evaluate_function_call
+
+    def _compile_method_call(self, expression):
+        """Compiles obj.name(args) so that a method found on the type is
+        called directly rather than through a bound method.
+        """
+        expr = self._compile(expression.function_expr.expr)
+        attr_name = expression.function_expr.attr_name
+        args = [self._compile(arg) for arg in expression.args]
+        evaluate_function = self._evaluate_function
+        call_type_attribute = self._call_type_attribute
+
+        def evaluate_method_call(scope):
+            obj = expr(scope)
+            attributes = obj.attributes
+            if attr_name in attributes:
+                return evaluate_function(
+                    attributes[attr_name], *[arg(scope) for arg in args])
+            return call_type_attribute(
+                obj, lookup_type_attribute(obj.type, attr_name),
+                *[arg(scope) for arg in args])
+        return evaluate_method_call
+
+    def _compile_AttributeAccess(self, expression):
+        assert isinstance(expression, AttributeAccess)
+        expr = self._compile(expression.expr)
+        attr_name = expression.attr_name
+        evaluate_attr = self._evaluate_attr
+
+        def evaluate_attribute_access(scope):
+            return evaluate_attr(expr(scope), attr_name)
+        return evaluate_attribute_access
+
+    def _compile_GetItem(self, expression):
+        assert isinstance(expression, GetItem)
+        expr = self._compile(expression.expr)
+        key = self._compile(expression.key)
+        call_type_attribute = self._call_type_attribute
+
+        def evaluate_getitem(scope):
+            obj = expr(scope)
+            return call_type_attribute(
+                obj, lookup_type_attribute(obj.type, '__getitem__'),
+                key(scope))
+        return evaluate_getitem
+
+    def _compile_Slice(self, expression):
+        assert isinstance(expression, Slice)
+        start = self._compile(expression.start)
+        stop = self._compile(expression.stop)
+        slice_value = self.type_context.slice_value
+
+        def evaluate_slice(scope):
+            return slice_value(start(scope), stop(scope))
+        return evaluate_slice
+
+    def _compile_assign_Variable(self, assignable):
+        assert isinstance(assignable, Variable)
+        name = assignable.name
+
+        def assign_variable(scope, value):
+            scope.assign_name(name, value)
+        return assign_variable
+
+    def _compile_assign_LocalVariable(self, assignable):
+        assert isinstance(assignable, LocalVariable)
+        assert assignable.depth == 0
+        index = assignable.index
+
+        def assign_local(scope, value):
+            scope.slots[index] = value
+        return assign_local
+
+    def _compile_assign_AttributeAccess(self, assignable):
+        assert isinstance(assignable, AttributeAccess)
+        expr = self._compile(assignable.expr)
+        attr_name = assignable.attr_name
+
+        def assign_attribute(scope, value):
+            expr(scope).set_attribute(attr_name, value)
+        return assign_attribute
+
+    def _compile_assign_GetItem(self, assignable):
+        assert isinstance(assignable, GetItem)
+        expr = self._compile(assignable.expr)
+        key = self._compile(assignable.key)
+        call_type_attribute = self._call_type_attribute
+
+        def assign_item(scope, value):
+            obj = expr(scope)
+            call_type_attribute(
+                obj, lookup_type_attribute(obj.type, '__setitem__'),
+                key(scope), value)
+        return assign_item
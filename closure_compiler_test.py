@@ -0,0 +1,25 @@
+import unittest
+
+import interpreter_test
+
+
+class ClosureEngineTest(interpreter_test.InterpreterTest):
+    """Runs the full interpreter test suite on the closure engine."""
+    engine = 'closure'
+
+    def test_function_called_in_loop(self):
+        self.assert_execute(
+            '''
+def count_down(n):
+    while n > 0:
+        n = n - 1
+    print n
+i = 0
+while i < 3:
+    count_down(i)
+    i = i + 1''',
+            '0\n0\n0\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
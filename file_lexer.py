@@ -1,8 +1,19 @@
 from ply.lex import LexToken
+import mmap
+import os
 import re
+import stat
 from line_lexer import LineLexer
 
 
+BLANK_LINE_PATTERN = re.compile(r'^[ \t]*$')
+
+# Files are memory-mapped this many bytes at a time, so that only one
+# window of a large file is resident at once. This must be a multiple of
+# mmap.ALLOCATIONGRANULARITY.
+MAP_WINDOW_SIZE = 4 * 1024 * 1024
+
+
 class FileLexer(object):
     """Wrapper lexer that has two responsibilities:
     -Define the logical lines of a python file
@@ -21,42 +32,96 @@ class FileLexer(object):
         'NEWLINE',
     ]
 
-    def __init__(self):
-        self.delegate_lexer = LineLexer()
+    def __init__(self, delegate_lexer=None):
+        """
+        @type delegate_lexer: LineLexer
+        """
+        if delegate_lexer is None:
+            delegate_lexer = LineLexer()
+        self.delegate_lexer = delegate_lexer
 
     # Handle indentation as described by
     # http://docs.python.org/2/reference/lexical_analysis.html#indentation
-    def tokenize(self, program):
+    def tokenize(self, program, line_starts=None):
+        """
+        @param program: The text of the program, or any iterable of
+        chunks of it, such as a file object. Chunks are only read as
+        tokens are needed, so the whole program is never in memory. The
+        whole of a file on disk is tokenized, through a memory map.
+        @param line_starts: If given, a list or array that the offset of
+        each physical line is appended to as the line is read.
+        """
+        if isinstance(program, basestring):
+            lines = program.split('\n')
+        elif is_mappable(program):
+            lines = mapped_lines(program)
+        else:
+            lines = split_lines(program)
         indentation_levels = [0]
-        for logical_line in self._get_logical_lines(program):
-            indentation_level = self._get_indentation_level(logical_line)
+        for logical_line, parts in self._get_logical_lines(lines,
+                                                           line_starts):
+            offset, lineno, line_start = parts[0]
+            indentation_length = len(logical_line) - len(
+                logical_line.lstrip(' \t'))
+            if '\t' in logical_line[:indentation_length]:
+                indentation_level = self._get_indentation_level(logical_line)
+            else:
+                indentation_level = indentation_length
+            # The position of the line's first token.
+            lexpos = line_start + indentation_length
             if indentation_level > indentation_levels[-1]:
-                yield self._create_token('INDENT')
+                yield self._create_token('INDENT', lineno, lexpos)
                 indentation_levels.append(indentation_level)
             elif indentation_level < indentation_levels[-1]:
                 while indentation_level < indentation_levels[-1]:
-                    yield self._create_token('DEDENT')
+                    yield self._create_token('DEDENT', lineno, lexpos)
                     indentation_levels.pop()
                 if indentation_level != indentation_levels[-1]:
                     raise SyntaxError(
                         'Cannot dedent to a level not previously given.')
+            if not logical_line:
+                # The end of the program, which only closes blocks.
+                break
 
-            for token in self.delegate_lexer.tokenize(logical_line):
-                yield token
-            yield self._create_token('NEWLINE')
-        while indentation_levels[-1] > 0:
-            yield self._create_token('DEDENT')
-            indentation_levels.pop()
+            tokens = self.delegate_lexer.tokenize(logical_line, lineno)
+            if len(parts) == 1:
+                # The common case of a single physical line, where
+                # positions only need to be offset by the line start.
+                for token in tokens:
+                    token.lexpos += line_start
+                    yield token
+            else:
+                # Tokens come in order, so the physical line that each
+                # one is on is found by walking through the parts.
+                next_part = 1
+                next_offset = parts[1][0]
+                lexpos_change = line_start
+                for token in tokens:
+                    while token.lexpos >= next_offset:
+                        offset, lineno, line_start = parts[next_part]
+                        lexpos_change = line_start - offset
+                        next_part += 1
+                        if next_part < len(parts):
+                            next_offset = parts[next_part][0]
+                        else:
+                            next_offset = len(logical_line)
+                    token.lineno = lineno
+                    token.lexpos += lexpos_change
+                    yield token
+                offset, lineno, line_start = parts[-1]
+            # The last physical line is the end of the logical line.
+            yield self._create_token(
+                'NEWLINE', lineno, line_start + len(logical_line) - offset)
 
-    # Gets the number of "spaces" at the start of the given line, accounting
-    # for tab characters.
+    # Gets the number of "spaces" at the start of the given line, where a
+    # tab advances to the next multiple of 8, as in Python.
     def _get_indentation_level(self, logical_line):
         current_level = 0
         for char in logical_line:
             if char == ' ':
                 current_level += 1
             elif char == '\t':
-                current_level = self._round_up(current_level, 8)
+                current_level = self._round_up(current_level + 1, 8)
             else:
                 break
         return current_level
@@ -64,29 +129,51 @@ class FileLexer(object):
     def _round_up(self, number, mod):
         return number + (-number % mod)
 
-    def _get_logical_lines(self, program):
+    def _get_logical_lines(self, lines, line_starts=None):
+        """
+        Generates each logical line of the program along with a list of
+        the physical lines that it was joined from. Each of those is a
+        tuple of its offset within the logical line, its line number and
+        its offset within the program. Finally, generates an empty
+        logical line at the end of the program.
+        @param lines: The physical lines of the program.
+        """
         nesting_level = 0
         current_lines = []
-        for line in program.split('\n'):
+        parts = []
+        # The offset within the logical line of the next physical line.
+        offset = 0
+        next_line_start = 0
+        for lineno, line in enumerate(lines, 1):
+            line_start = next_line_start
+            next_line_start += len(line) + 1
+            if line_starts is not None:
+                line_starts.append(line_start)
             if self._is_line_blank(line):
                 continue
+            parts.append((offset, lineno, line_start))
             nesting_level += self._get_nesting_difference(line)
             if nesting_level > 0:
                 current_lines.append(line)
+                offset += len(line) + 1
                 continue
             if line[-1] == '\\':
                 current_lines.append(line[:-1])
+                offset += len(line)
                 continue
             current_lines.append(line)
             # No reason to continue, so this is the end of the logical line.
             # Make sure there's at least some whitespace between lines.
-            yield ' '.join(current_lines)
+            yield ' '.join(current_lines), parts
             del current_lines[:]
+            parts = []
+            offset = 0
         if nesting_level != 0 or len(current_lines) > 0:
             raise SyntaxError('Unexpected end of file.')
+        yield '', [(0, lineno, next_line_start - 1)]
 
     def _is_line_blank(self, line):
-        return re.match(r'^[ \t]*$', line)
+        return BLANK_LINE_PATTERN.match(line)
 
     def _get_nesting_difference(self, line):
         """Determines the net number of nesting levels introduced by
@@ -95,11 +182,71 @@ class FileLexer(object):
         return (line.count('(') + line.count('[') + line.count('{') -
                 line.count(')') - line.count(']') - line.count('}'))
 
-    # Creates a token with the given type and no value.
-    def _create_token(self, type):
+    # Creates a token with the given type and position and no value.
+    def _create_token(self, type, lineno, lexpos):
         token = LexToken()
         token.type = type
         token.value = ''
-        token.lineno = 0
-        token.lexpos = 0
+        token.lineno = lineno
+        token.lexpos = lexpos
         return token
+
+
+def split_lines(chunks):
+    """
+    Generates the lines of the text given as an iterable of chunks,
+    without their newlines, in the same way as str.split('\n'). Only
+    the line being read is kept in memory.
+    """
+    pending = []
+    for chunk in chunks:
+        lines = chunk.split('\n')
+        if len(lines) == 1:
+            pending.append(chunk)
+            continue
+        pending.append(lines[0])
+        yield ''.join(pending)
+        for line in lines[1:-1]:
+            yield line
+        pending = [lines[-1]]
+    yield ''.join(pending)
+
+
+def is_mappable(source):
+    """
+    Returns whether source is an open, non-empty file on disk, which can
+    be memory-mapped.
+    """
+    if not isinstance(source, file):
+        return False
+    status = os.fstat(source.fileno())
+    return stat.S_ISREG(status.st_mode) and status.st_size > 0
+
+
+def mapped_lines(source_file, window_size=MAP_WINDOW_SIZE):
+    """
+    Generates the lines of an open file without their newlines, in the
+    same way as str.split('\n'), by mapping the file into memory one
+    window at a time. Each line is copied out of the map as it's reached
+    and each window is unmapped when done, so memory use doesn't grow
+    with the size of the file.
+    """
+    size = os.fstat(source_file.fileno()).st_size
+    # The start of a line continuing from the previous window.
+    pending = ''
+    for offset in xrange(0, size, window_size):
+        window = mmap.mmap(source_file.fileno(),
+                           min(window_size, size - offset),
+                           access=mmap.ACCESS_READ, offset=offset)
+        try:
+            start = 0
+            end = window.find('\n')
+            while end != -1:
+                yield pending + window[start:end]
+                pending = ''
+                start = end + 1
+                end = window.find('\n', start)
+            pending += window[start:]
+        finally:
+            window.close()
+    yield pending
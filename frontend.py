@@ -0,0 +1,147 @@
+import hashlib
+import imp
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import warnings
+from ply import yacc
+from ast_cache import AstCache, DEFAULT_MAX_BYTES
+from file_lexer import FileLexer
+from lexer import create_lexer
+from line_lexer import LineLexer
+from parser import Parser
+from private_dir import ensure_private_dir
+
+
+def default_cache_dir():
+    """
+    @return: The current user's own cache directory for APPy, following
+    the XDG base directory convention.
+    @rtype: str
+    """
+    cache_home = (os.environ.get('XDG_CACHE_HOME') or
+                  os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(cache_home, 'appy')
+
+
+class Frontend(object):
+    """Long-lived lexer and parser pair for a single TypeContext.
+
+    Building the PLY tables is far more expensive than actually lexing
+    and parsing a small program, so the tables are built once here and
+    reused for every parse. The tables are also written to a cache
+    directory so that later processes can load them instead of
+    recomputing them.
+
+    Parsed ASTs are also cached on disk, keyed by a hash of the source,
+    so that running the same program again skips lexing and parsing.
+
+    The cached tables are loaded as code, so the cache directory must
+    be private to the current user (see ensure_private_dir). If it
+    isn't, nothing is read from or written to it, with a warning.
+
+    PLY lexers and parsers keep their state on the object being used,
+    so parses are serialized with a lock to make the frontend safe to
+    share between threads.
+    """
+
+    def __init__(self, type_context, cache_dir=None,
+                 ast_cache_size=DEFAULT_MAX_BYTES):
+        """
+        @type type_context: TypeContext
+        @type cache_dir: str
+        @param cache_dir: Directory for the generated lextab and
+        parsetab files and the cached ASTs. Defaults to
+        default_cache_dir(). It is created with access for the current
+        user only if it does not exist.
+        @type ast_cache_size: int
+        @param ast_cache_size: How many bytes of ASTs to keep cached on
+        disk. 0 disables the AST cache.
+        """
+        if cache_dir is None:
+            cache_dir = default_cache_dir()
+        if not ensure_private_dir(cache_dir):
+            warnings.warn('Not caching in %s, since it is not a directory '
+                          'private to the current user' % cache_dir)
+            cache_dir = None
+        self.cache_dir = cache_dir
+        self.type_context = type_context
+        self.lexer = create_lexer(FileLexer(self._create_line_lexer()))
+        if cache_dir is not None:
+            self.parser = self._create_parser(cache_dir)
+        else:
+            # Without a picklefile, PLY imports a parsetab module from
+            # sys.path, where anyone who can write to the working
+            # directory could have planted one. The tables are pickled
+            # to a fresh private directory instead and thrown away.
+            table_dir = tempfile.mkdtemp()
+            try:
+                self.parser = self._create_parser(table_dir)
+            finally:
+                shutil.rmtree(table_dir)
+        self.lock = threading.Lock()
+        if ast_cache_size and cache_dir is not None:
+            self.ast_cache = AstCache(os.path.join(cache_dir, 'asts'),
+                                      type_context, ast_cache_size)
+        else:
+            self.ast_cache = None
+
+    def parse(self, program):
+        """
+        @param program: The text of the program, or an iterable of chunks
+        of it such as a file object.
+        @return: The AST for the program.
+        """
+        key = None
+        if self.ast_cache is not None:
+            key = self.ast_cache.key(program)
+            if key is not None:
+                ast = self.ast_cache.load(key)
+                if ast is not None:
+                    return ast
+        with self.lock:
+            ast = self.parser.parse(program, self.lexer)
+        if key is not None:
+            self.ast_cache.store(key, ast)
+        return ast
+
+    def _create_parser(self, table_dir):
+        return Parser(
+            self.type_context,
+            debug=False,
+            write_tables=False,
+            errorlog=yacc.NullLogger(),
+            picklefile=os.path.join(table_dir, 'appy_parsetab.pickle'))
+
+    def _create_line_lexer(self):
+        if self.cache_dir is None:
+            return LineLexer()
+        # PLY does not validate a lextab against the lexer rules, so the
+        # rules are hashed into the file name to avoid loading a stale
+        # table.
+        lextab_name = 'appy_lextab_' + lexer_signature()
+        lextab_path = os.path.join(self.cache_dir, lextab_name + '.py')
+        if os.path.exists(lextab_path):
+            try:
+                lextab = imp.load_source(lextab_name, lextab_path)
+                return LineLexer(optimize=True, lextab=lextab)
+            except (ImportError, SyntaxError):
+                pass
+            finally:
+                sys.modules.pop(lextab_name, None)
+        return LineLexer(optimize=True, lextab=lextab_name,
+                         outputdir=self.cache_dir)
+
+
+def lexer_signature():
+    rules = []
+    for name in sorted(dir(LineLexer)):
+        if name.startswith('t_'):
+            rule = getattr(LineLexer, name)
+            if callable(rule):
+                rule = getattr(rule, 'regex', None) or rule.__doc__
+            rules.append(name + ':' + str(rule))
+    rules.extend(LineLexer.tokens)
+    return hashlib.md5('\n'.join(rules).encode('utf-8')).hexdigest()[:16]
@@ -0,0 +1,127 @@
+import os
+import shutil
+import tempfile
+import stat
+import sys
+import threading
+import unittest
+import warnings
+
+from appy_ast import (BinaryOperator, Literal, PrimitiveValue,
+                      ExpressionStatement, PrintStatement)
+from builtin_types import TypeContext
+from frontend import Frontend, default_cache_dir, lexer_signature
+
+
+class FrontendTest(unittest.TestCase):
+    def setUp(self):
+        self.type_context = TypeContext()
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_parse(self):
+        frontend = Frontend(self.type_context, self.cache_dir)
+        self.assertEqual(
+            ExpressionStatement(BinaryOperator(
+                '+', self.int_literal(5), self.int_literal(3))),
+            frontend.parse('5 + 3'))
+
+    def test_reused_across_parses(self):
+        frontend = Frontend(self.type_context, self.cache_dir)
+        frontend.parse('5 + 3')
+        self.assertEqual(PrintStatement(self.int_literal(2)),
+                         frontend.parse('print 2'))
+
+    def test_recovers_after_syntax_error(self):
+        frontend = Frontend(self.type_context, self.cache_dir)
+        self.assertRaises(SyntaxError, frontend.parse, '5 +')
+        self.assertEqual(PrintStatement(self.int_literal(2)),
+                         frontend.parse('print 2'))
+
+    def test_writes_tables_to_cache_dir(self):
+        Frontend(self.type_context, self.cache_dir)
+        files = os.listdir(self.cache_dir)
+        self.assertIn('appy_parsetab.pickle', files)
+        self.assertIn('appy_lextab_' + lexer_signature() + '.py', files)
+
+    def test_loads_cached_tables(self):
+        Frontend(self.type_context, self.cache_dir)
+        frontend = Frontend(self.type_context, self.cache_dir)
+        self.assertEqual(PrintStatement(self.int_literal(2)),
+                         frontend.parse('print 2'))
+
+    def test_default_cache_dir_is_per_user(self):
+        self.assertTrue(default_cache_dir().startswith(
+            os.path.expanduser('~') + os.sep) or
+            'XDG_CACHE_HOME' in os.environ)
+
+    def test_creates_private_cache_dir(self):
+        cache_dir = os.path.join(self.cache_dir, 'new', 'cache')
+        Frontend(self.type_context, cache_dir)
+        self.assertEqual(0o700, stat.S_IMODE(os.stat(cache_dir).st_mode))
+
+    def test_shared_cache_dir_not_used(self):
+        os.chmod(self.cache_dir, 0o777)
+        lextab_path = os.path.join(
+            self.cache_dir, 'appy_lextab_' + lexer_signature() + '.py')
+        with open(lextab_path, 'w') as lextab:
+            lextab.write('raise AssertionError("planted lextab ran")\n')
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            frontend = Frontend(self.type_context, self.cache_dir)
+        self.assertEqual(1, len(caught))
+        self.assertIsNone(frontend.ast_cache)
+        self.assertEqual(PrintStatement(self.int_literal(2)),
+                         frontend.parse('print 2'))
+        self.assertEqual([os.path.basename(lextab_path)],
+                         os.listdir(self.cache_dir))
+
+    def test_shared_cache_dir_ignores_planted_parsetab(self):
+        os.chmod(self.cache_dir, 0o777)
+        planted_dir = tempfile.mkdtemp()
+        with open(os.path.join(planted_dir, 'parsetab.py'), 'w') as parsetab:
+            parsetab.write('raise AssertionError("planted parsetab ran")\n')
+        sys.path.insert(0, planted_dir)
+        saved_parsetab = sys.modules.pop('parsetab', None)
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                frontend = Frontend(self.type_context, self.cache_dir)
+            self.assertNotIn('parsetab', sys.modules)
+        finally:
+            sys.path.remove(planted_dir)
+            shutil.rmtree(planted_dir)
+            if saved_parsetab is not None:
+                sys.modules['parsetab'] = saved_parsetab
+        self.assertEqual(PrintStatement(self.int_literal(2)),
+                         frontend.parse('print 2'))
+        self.assertEqual([], os.listdir(self.cache_dir))
+
+    def test_thread_safety(self):
+        frontend = Frontend(self.type_context, self.cache_dir)
+        results = []
+
+        def parse_many(n):
+            for i in range(50):
+                results.append(
+                    (n + i, frontend.parse('print ' + str(n + i))))
+        threads = [threading.Thread(target=parse_many, args=(n * 100,))
+                   for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(200, len(results))
+        for n, ast in results:
+            self.assertEqual(PrintStatement(self.int_literal(n)), ast)
+
+    def int_literal(self, int_value):
+        return Literal(
+            PrimitiveValue(self.type_context.int_type, int_value))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,46 +1,192 @@
-from appy_ast import (Value, ExpressionStatement, PrintStatement, Seq,
-                      Assignment, Variable, IfStatement, WhileStatement,
-                      DefStatement, FunctionData, FunctionCall, ClassStatement,
-                      AttributeAccess, ListLiteral, GetItem)
-from builtin_types import TypeContext
-from lexer import create_lexer
-from parser import Parser
-from scope import ScopeChain
+from appy_ast import (FunctionValue, TypeValue,
+                      ExpressionStatement, PrintStatement, Block, Assignment,
+                      ReturnStatement, Variable, IfStatement,
+                      WhileStatement, ForStatement, DefStatement,
+                      FunctionData,
+                      FunctionCall, ClassStatement, AttributeAccess,
+                      ListLiteral, GetItem, Slice, LocalVariable,
+                      STATEMENT_TYPES, position_lineno)
+from builtin_types import (TypeContext, BudgetedBuiltin,
+                           lookup_type_attribute)
+from ast_cache import DEFAULT_MAX_BYTES
+from itertools import imap
+from frontend import Frontend
+from limits import Budget
+from lru_cache import LruCache
+from profiler import function_label
+from resolver import resolve
+from scope import ScopeChain, SlotScope, FramePool
+
+
+try:
+    RecursionError = RecursionError
+except NameError:
+    # Python 2 reports running out of stack as a plain RuntimeError.
+    class RecursionError(RuntimeError):
+        pass
+
+
+DEFAULT_MAX_CALL_DEPTH = 1000
+
+DEFAULT_EXPRESSION_CACHE_SIZE = 256
 
 
 class Interpreter(object):
-    def __init__(self, stdout_handler):
+    def __init__(self, stdout_handler, cache_dir=None, engine='tree',
+                 max_call_depth=DEFAULT_MAX_CALL_DEPTH,
+                 ast_cache_size=DEFAULT_MAX_BYTES,
+                 expression_cache_size=DEFAULT_EXPRESSION_CACHE_SIZE,
+                 optimize=True, profiler=None, limits=None):
+        '''
+        @param cache_dir: Directory used to cache the generated lexer
+        and parser tables and parsed ASTs. See Frontend.
+        @type engine: str
+        @param engine: Which execution engine to use:
+          -'tree' walks the AST directly.
+          -'closure' compiles the AST into Python closures up front.
+          -'bytecode' compiles the AST into bytecode for a stack VM.
+        @type max_call_depth: int
+        @param max_call_depth: How many user-defined function calls can
+        be active at once before a RecursionError is raised. The tree and
+        closure engines use the host stack for calls, so they can raise
+        RecursionError earlier.
+        @type ast_cache_size: int
+        @param ast_cache_size: How many bytes of parsed ASTs to cache on
+        disk, or 0 to always parse. See Frontend.
+        @type expression_cache_size: int
+        @param expression_cache_size: How many expressions passed to
+        evaluate_expression to keep parsed in memory, or 0 to always
+        parse them.
+        @type optimize: bool
+        @param optimize: Whether to fold constant expressions and remove
+        unreachable branches before running programs. See Optimizer.
+        @type profiler: Profiler
+        @param profiler: If given, every statement and function call that
+        runs is recorded in it. It is stopped after each program.
+        @type limits: ExecutionLimits
+        @param limits: The resources that each program or expression
+        may use, unless it is given its own limits. Exceeding them
+        raises ResourceLimitExceeded.
+        '''
         self.stdout_handler = stdout_handler
         self.type_context = TypeContext()
+        self.frontend = Frontend(self.type_context, cache_dir,
+                                 ast_cache_size)
+        self.environment_class = _get_environment_class(engine)
+        self.max_call_depth = max_call_depth
+        if optimize:
+            # Imported here since the optimizer builds on this module.
+            from optimizer import Optimizer
+            self.optimizer = Optimizer(self.type_context)
+        else:
+            self.optimizer = None
+        # Maps the text of an expression to its resolved AST.
+        self.expression_cache = LruCache(expression_cache_size)
+        self.profiler = profiler
+        self.limits = limits
 
-    def execute_program(self, program):
+    def execute_program(self, program, limits=None):
         '''
         Executes a program from the top level. Use the stdout_handler
         to capture the output.
         @type program: str
         @param program: Text of program to execute.
+        @type limits: ExecutionLimits
+        @param limits: Overrides the Interpreter's limits.
         '''
-        executor = ExecutionEnvironment(self.stdout_handler, self.type_context)
-        ast = self._parse(program, self.type_context)
-        executor.execute_statement(ast)
+        self._execute(self.parse(program), limits)
 
-    def evaluate_expression(self, expression):
+    def execute_file(self, path, limits=None):
+        '''
+        Executes the program in the file at the given path. The file is
+        memory-mapped and tokenized as it is read rather than being
+        loaded into a string.
+        @type path: str
+        @type limits: ExecutionLimits
+        @param limits: Overrides the Interpreter's limits.
+        '''
+        with open(path) as program_file:
+            ast = self.parse(program_file)
+        self._execute(ast, limits)
+
+    def evaluate_expression(self, expression, limits=None):
         '''
         @type expression: str
         @param expression:
+        @type limits: ExecutionLimits
+        @param limits: Overrides the Interpreter's limits.
         @return: A native Python value corresponding to the evaluated
         value of the expression, which must be a native Python type.
+        Expressions that were evaluated recently are not parsed again.
         '''
-        executor = ExecutionEnvironment(self.stdout_handler, self.type_context)
-        ast = self._parse(expression, self.type_context)
-        assert isinstance(ast, ExpressionStatement)
-        expr_ast = ast.expr
-        return executor.evaluate_expression(expr_ast)
+        expr_ast = self.expression_cache.get(expression)
+        if expr_ast is None:
+            ast = self.parse(expression)
+            assert isinstance(ast, ExpressionStatement)
+            expr_ast = ast.expr
+            self.expression_cache.put(expression, expr_ast)
+        try:
+            return self.create_executor(limits).evaluate_expression(
+                expr_ast)
+        finally:
+            if self.profiler is not None:
+                self.profiler.stop()
 
-    def _parse(self, program, type_context):
-        parser = Parser(type_context)
-        lexer = create_lexer()
-        return parser.parse(program, lexer)
+    def expression_cache_stats(self):
+        '''
+        @return: The hits, misses, size and capacity of the cache used
+        by evaluate_expression.
+        @rtype: CacheStats
+        '''
+        return self.expression_cache.stats()
+
+    def parse(self, program):
+        '''
+        @param program: The text of the program, or an iterable of chunks
+        of it such as a file object.
+        @return: The resolved AST for the program, ready to execute.
+        '''
+        ast = resolve(self.frontend.parse(program))
+        if self.optimizer is not None:
+            ast = self.optimizer.optimize(ast)
+        return ast
+
+    def create_executor(self, limits=None):
+        '''
+        @type limits: ExecutionLimits
+        @param limits: The limits on everything the environment runs,
+        which are the Interpreter's limits by default. They are measured
+        from when the environment is created.
+        @return: A fresh top-level environment for the configured engine.
+        '''
+        if limits is None:
+            limits = self.limits
+        budget = Budget(limits) if limits is not None else None
+        return self.environment_class(
+            self.stdout_handler, self.type_context,
+            max_call_depth=self.max_call_depth, profiler=self.profiler,
+            budget=budget)
+
+    def _execute(self, ast, limits):
+        try:
+            self.create_executor(limits).execute_statement(ast)
+        finally:
+            if self.profiler is not None:
+                self.profiler.stop()
+
+
+def _get_environment_class(engine):
+    if engine == 'tree':
+        return ExecutionEnvironment
+    elif engine == 'closure':
+        # Imported here since the closure compiler builds on this module.
+        from closure_compiler import ClosureEnvironment
+        return ClosureEnvironment
+    elif engine == 'bytecode':
+        from vm import BytecodeEnvironment
+        return BytecodeEnvironment
+    else:
+        raise ValueError('Unknown engine: ' + str(engine))
 
 
 class ExecutionEnvironment(object):
@@ -49,17 +195,46 @@ class ExecutionEnvironment(object):
     various types of expressions and statements.
     """
 
-    def __init__(self, stdout_handler, type_context, scope_chain=None):
+    def __init__(self, stdout_handler, type_context, scope_chain=None,
+                 max_call_depth=DEFAULT_MAX_CALL_DEPTH, profiler=None,
+                 budget=None):
         """
         @type type_context: TypeContext
+        @type profiler: Profiler
+        @param profiler: Records the statements and calls that run, if
+        given.
+        @type budget: Budget
+        @param budget: Limits the loop iterations, calls and list
+        elements that run, if given.
+        @type scope_chain: ScopeChain
+        @param scope_chain: The scope to run in. By default, a new
+        global scope within the builtins of the type_context.
         """
         if scope_chain is None:
-            scope_chain = ScopeChain()
+            # Globals are looked up before builtins, as in Python.
+            scope_chain = ScopeChain(
+                ScopeChain(None, type_context.builtins))
         self.stdout_handler = stdout_handler
         self.type_context = type_context
         self.scope_chain = scope_chain
+        self.max_call_depth = max_call_depth
+        self.profiler = profiler
+        self.budget = budget
+        # The scopes of the user-defined function calls that are running,
+        # innermost last.
+        self.call_stack = []
 
     def execute_statement(self, statement):
+        '''
+        @return: None, or the Value of the return statement that ended
+        the statement. Every statement passes the Value of a return
+        within it up to the enclosing function call this way, rather
+        than unwinding the host stack with an exception.
+        '''
+        if (self.profiler is not None and
+                isinstance(statement, STATEMENT_TYPES) and
+                statement.position is not None):
+            self.profiler.line(position_lineno(statement.position))
         try:
             method = getattr(self, '_execute_' + statement.__class__.__name__)
         except AttributeError:
@@ -97,10 +272,12 @@ class ExecutionEnvironment(object):
         return method(expression)
 
 
-    def _execute_Seq(self, statement):
-        assert isinstance(statement, Seq)
-        self.execute_statement(statement.left)
-        self.execute_statement(statement.right)
+    def _execute_Block(self, statement):
+        assert isinstance(statement, Block)
+        for sub_statement in statement.statements:
+            result = self.execute_statement(sub_statement)
+            if result is not None:
+                return result
 
 
     def _execute_Assignment(self, statement):
@@ -121,39 +298,93 @@ class ExecutionEnvironment(object):
         value = self.evaluate_expression(statement.expr)
         self.stdout_handler(str(value.data))
 
+    def _execute_ReturnStatement(self, statement):
+        assert isinstance(statement, ReturnStatement)
+        return self.evaluate_expression(statement.expr)
+
     def _execute_IfStatement(self, statement):
         assert isinstance(statement, IfStatement)
         condition_value = self.evaluate_expression(statement.condition)
         # TODO: This is lame and hides the interesting stuff.
         if condition_value.data:
-            self.execute_statement(statement.statement)
+            return self.execute_statement(statement.statement)
 
     def _execute_WhileStatement(self, statement):
         assert isinstance(statement, WhileStatement)
+        budget = self.budget
         while True:
             condition_value = self.evaluate_expression(statement.condition)
             if not condition_value.data:
                 break
-            self.execute_statement(statement.statement)
+            result = self.execute_statement(statement.statement)
+            if result is not None:
+                return result
+            if budget is not None:
+                budget.tick()
+
+    def _execute_ForStatement(self, statement):
+        assert isinstance(statement, ForStatement)
+        iterable_value = self.evaluate_expression(statement.iterable)
+        assign_function = self._resolve_assign_function(statement.target)
+        budget = self.budget
+        for value in self._iterate(iterable_value):
+            assign_function(value)
+            result = self.execute_statement(statement.statement)
+            if result is not None:
+                return result
+            if budget is not None:
+                budget.tick()
+
+    def _iterate(self, iterable_value):
+        """
+        @type iterable_value: Value
+        @return: A host iterable of the Values that a for loop over
+        iterable_value runs with. Builtin lists and ranges are iterated
+        directly, which is what their __iter__ would do, and anything
+        else goes through the __iter__ and next methods of its type.
+        """
+        type_context = self.type_context
+        if iterable_value.type is type_context.list_type:
+            return type_context.iterate_list(iterable_value)
+        elif iterable_value.type is type_context.range_type:
+            return imap(type_context.int_value, iterable_value.data)
+        try:
+            iter_method = lookup_type_attribute(iterable_value.type,
+                                                '__iter__')
+        except TypeError:
+            raise TypeError("'%s' object is not iterable" %
+                            str(iterable_value.type.data))
+        return self._iterate_protocol(
+            self._call_type_attribute(iterable_value, iter_method))
+
+    def _iterate_protocol(self, iterator):
+        next_method = lookup_type_attribute(iterator.type, 'next')
+        while True:
+            try:
+                value = self._call_type_attribute(iterator, next_method)
+            except StopIteration:
+                return
+            yield value
 
     def _execute_DefStatement(self, statement):
         assert isinstance(statement, DefStatement)
-        self.scope_chain.assign_name(statement.name, Value(
-            self.type_context.function_type,
-            FunctionData(
-                statement.param_names, statement.body, self.scope_chain),
-            {}))
+        self.scope_chain.assign_name(
+            statement.name,
+            self._create_function(statement, self.scope_chain))
 
     def _execute_ClassStatement(self, statement):
         assert isinstance(statement, ClassStatement)
         # TODO: Use the superclass.
-        class_scope = self.scope_chain.with_pushed_mappings({})
-        new_environment = ExecutionEnvironment(
-            self.stdout_handler, self.type_context, class_scope)
-        new_environment.execute_statement(statement.body)
-        new_type = Value(self.type_context.type_type, statement.name,
-                         class_scope.mappings)
-        self.scope_chain.assign_name(statement.name, new_type)
+        outer_scope = self.scope_chain
+        class_scope = outer_scope.with_pushed_mappings({})
+        self.scope_chain = class_scope
+        try:
+            self.execute_statement(statement.body)
+        finally:
+            self.scope_chain = outer_scope
+        new_type = TypeValue(self.type_context.type_type, statement.name,
+                             class_scope.mappings)
+        outer_scope.assign_name(statement.name, new_type)
 
     BINARY_OPERATORS = {
         '+': '__add__',
@@ -166,26 +397,45 @@ class ExecutionEnvironment(object):
         '>': '__gt__',
         '<=': '__le__',
         '>=': '__ge__',
-        # TODO: short circuit
-        'and': '__and__',
-        'or': '__or__',
     }
 
     def _evaluate_BinaryOperator(self, expression):
-        if expression.operator == 'is':
+        operator = expression.operator
+        if operator == 'is':
             return self._evaluate_is(expression.left, expression.right)
+        elif operator == 'and':
+            return self._evaluate_and(expression.left, expression.right)
+        elif operator == 'or':
+            return self._evaluate_or(expression.left, expression.right)
 
         op_name = self.BINARY_OPERATORS[expression.operator]
         left_value = self.evaluate_expression(expression.left)
         right_value = self.evaluate_expression(expression.right)
-        op_function_value = self._evaluate_attr_on_type(left_value, op_name)
-        return self._evaluate_function(op_function_value, right_value)
+        primitive_operator = self.type_context.primitive_operators.get(
+            (op_name, id(left_value.type), id(right_value.type)))
+        if primitive_operator is not None:
+            return primitive_operator(left_value.data, right_value.data)
+        return self._call_method(left_value, op_name, right_value)
 
     def _evaluate_is(self, left, right):
         left_value = self.evaluate_expression(left)
         right_value = self.evaluate_expression(right)
         return self.type_context.bool_value(left_value is right_value)
 
+    def _evaluate_and(self, left, right):
+        # As in Python, the result is whichever operand decided it, and
+        # the right one is only evaluated if the left one is true.
+        left_value = self.evaluate_expression(left)
+        if not left_value.data:
+            return left_value
+        return self.evaluate_expression(right)
+
+    def _evaluate_or(self, left, right):
+        left_value = self.evaluate_expression(left)
+        if left_value.data:
+            return left_value
+        return self.evaluate_expression(right)
+
     def _evaluate_Literal(self, expression):
         return expression.value
 
@@ -193,12 +443,18 @@ class ExecutionEnvironment(object):
         assert isinstance(expression, ListLiteral)
         result_values = [
             self.evaluate_expression(expr) for expr in expression.expressions]
-        return Value(self.type_context.list_type, result_values, {})
+        if self.budget is not None:
+            self.budget.allocate_lists(len(result_values))
+        return self.type_context.list_value(result_values)
 
     def _evaluate_Variable(self, expression):
         assert isinstance(expression, Variable)
         return self.scope_chain.resolve_name(expression.name)
 
+    def _evaluate_LocalVariable(self, expression):
+        assert isinstance(expression, LocalVariable)
+        return self.scope_chain.load_local(expression.depth, expression.index)
+
     def _evaluate_FunctionCall(self, expression):
         assert isinstance(expression, FunctionCall)
         function_value = self.evaluate_expression(expression.function_expr)
@@ -213,9 +469,14 @@ class ExecutionEnvironment(object):
     def _evaluate_GetItem(self, expression):
         assert isinstance(expression, GetItem)
         obj_value = self.evaluate_expression(expression.expr)
-        method_value = self._evaluate_attr_on_type(obj_value, '__getitem__')
         key_value = self.evaluate_expression(expression.key)
-        return self._evaluate_function(method_value, key_value)
+        return self._call_method(obj_value, '__getitem__', key_value)
+
+    def _evaluate_Slice(self, expression):
+        assert isinstance(expression, Slice)
+        return self.type_context.slice_value(
+            self.evaluate_expression(expression.start),
+            self.evaluate_expression(expression.stop))
 
     def _evaluate_attr(self, object_value, attribute_name):
         """
@@ -230,24 +491,40 @@ class ExecutionEnvironment(object):
             return self._evaluate_attr_on_type(object_value, attribute_name)
 
     def _evaluate_attr_on_type(self, object_value, attribute_name):
-        try:
-            # Functions seem to automatically have __get__, so hard-code
-            # that for now.
-            # TODO: Full descriptor support
-            attr = object_value.type.attributes[attribute_name]
-            if attr.type is self.type_context.function_type:
-                return self._bind_instance_to_method(object_value, attr)
-            else:
-                return attr
-        except KeyError:
-            raise TypeError('Attribute ' + attribute_name +
-                            ' does not exist on this type.')
+        attr = lookup_type_attribute(object_value.type, attribute_name)
+        # Functions seem to automatically have __get__, so hard-code
+        # that for now.
+        # TODO: Full descriptor support
+        if attr.type is self.type_context.function_type:
+            return self._bind_instance_to_method(object_value, attr)
+        else:
+            return attr
+
+    def _call_method(self, object_value, method_name, *args):
+        """
+        Calls the method with the given name on the object's type. This
+        is equivalent to evaluating the attribute and calling it, but
+        doesn't allocate a bound method.
+        """
+        return self._call_type_attribute(
+            object_value,
+            lookup_type_attribute(object_value.type, method_name),
+            *args)
+
+    def _call_type_attribute(self, object_value, attr, *args):
+        """
+        Calls an attribute that was found on the object's type, binding
+        the object as the first argument if the attribute is a function.
+        """
+        if attr.type is self.type_context.function_type:
+            return self._evaluate_function(attr, object_value, *args)
+        else:
+            return self._evaluate_function(attr, *args)
 
     def _bind_instance_to_method(self, obj, method):
-        return Value(
+        return FunctionValue(
             self.type_context.function_type,
-            lambda *args: self._evaluate_function(method, obj, *args),
-            {})
+            lambda *args: self._evaluate_function(method, obj, *args))
 
     def _evaluate_function(self, func, *args):
         """
@@ -263,29 +540,132 @@ class ExecutionEnvironment(object):
                 raise TypeError("'%s' object is not callable" %
                                 str(func.type.data))
 
-        # Built-in functions use a regular python function.
+        # Built-in functions use a regular python function, or a
+        # BudgetedBuiltin if they allocate list elements.
         # User-defined functions use a FunctionData structure.
         data = func.data
         if isinstance(data, FunctionData):
-            new_scope = data.parent_scope.with_pushed_mappings(
-                {name: value for (name, value) in zip(data.param_names, args)})
-            new_environment = ExecutionEnvironment(
-                self.stdout_handler, self.type_context, new_scope)
-            # TODO: Return values
-            new_environment.execute_statement(data.body)
+            return self._call_function_data(data, args)
+        elif type(data) is BudgetedBuiltin:
+            return data.func(self.budget, *args)
         else:
             return data(*args)
 
+    def _call_function_data(self, data, args):
+        """
+        Runs the body of a user-defined function.
+        @type data: FunctionData
+        """
+        scope = self._enter_call(data, args)
+        try:
+            result = self._run_function_body(data.body, scope)
+        except RuntimeError as e:
+            if (isinstance(e, RecursionError) or
+                    'maximum recursion depth' not in str(e)):
+                raise
+            # The host stack ran out before max_call_depth was reached.
+            raise RecursionError('maximum recursion depth exceeded')
+        finally:
+            self._exit_call(data, scope)
+        if result is None:
+            # Falling off the end of the body returns None, which is a
+            # Value like any other so that it can be used as an operand.
+            return self.type_context.none_value
+        return result
+
+    def _run_function_body(self, body, scope):
+        """
+        @return: The Value returned by the body, or None if it didn't
+        run a return statement.
+        """
+        caller_scope = self.scope_chain
+        self.scope_chain = scope
+        try:
+            return self.execute_statement(body)
+        finally:
+            self.scope_chain = caller_scope
+
+    def _create_function(self, statement, scope):
+        """
+        Creates the function defined by a DefStatement run in scope.
+        @type statement: DefStatement
+        @rtype: FunctionValue
+        """
+        if statement.captures_scope is False:
+            frame_pool = FramePool(scope, statement.local_names,
+                                   len(statement.param_names))
+        else:
+            frame_pool = None
+        return FunctionValue(
+            self.type_context.function_type,
+            FunctionData(statement.name, statement.param_names,
+                         statement.local_names, statement.body, scope,
+                         frame_pool, statement.position))
+
+    def _enter_call(self, data, args):
+        """
+        Pushes a call of a user-defined function onto the call stack.
+        Every call must be matched by a call to _exit_call.
+        @type data: FunctionData
+        @rtype: SlotScope
+        @return: The scope to run the function body in.
+        """
+        if len(self.call_stack) >= self.max_call_depth:
+            raise RecursionError('maximum recursion depth exceeded')
+        if self.budget is not None:
+            self.budget.tick()
+        scope = self._create_call_scope(data, args)
+        self.call_stack.append(scope)
+        if self.profiler is not None:
+            self.profiler.enter_function(function_label(data))
+        return scope
+
+    def _exit_call(self, data, scope):
+        """
+        Pops the call from the call stack, after which its scope may be
+        reused.
+        @type data: FunctionData
+        @type scope: SlotScope
+        """
+        self.call_stack.pop()
+        if self.profiler is not None:
+            self.profiler.exit_function()
+        if data.frame_pool is not None:
+            data.frame_pool.release(scope)
+
+    def _create_call_scope(self, data, args):
+        """
+        @type data: FunctionData
+        @rtype: SlotScope
+        """
+        if len(args) != len(data.param_names):
+            raise TypeError('function takes exactly %d arguments (%d given)' %
+                            (len(data.param_names), len(args)))
+        if data.frame_pool is not None:
+            return data.frame_pool.acquire(args)
+        slots = list(args)
+        slots.extend([None] * (len(data.local_names) - len(args)))
+        return SlotScope(data.parent_scope, data.local_names, slots)
+
     def _resolve_Variable(self, assignable):
         assert isinstance(assignable, Variable)
         return lambda val: self.scope_chain.assign_name(assignable.name, val)
 
+    def _resolve_LocalVariable(self, assignable):
+        assert isinstance(assignable, LocalVariable)
+        # Assignments always go to the current function's scope.
+        assert assignable.depth == 0
+
+        def assign(val):
+            self.scope_chain.slots[assignable.index] = val
+        return assign
+
     def _resolve_AttributeAccess(self, assignable):
         assert isinstance(assignable, AttributeAccess)
 
         def assign(val):
             obj = self.evaluate_expression(assignable.expr)
-            obj.attributes[assignable.attr_name] = val
+            obj.set_attribute(assignable.attr_name, val)
         return assign
 
     def _resolve_GetItem(self, assignable):
@@ -293,7 +673,6 @@ class ExecutionEnvironment(object):
 
         def assign(val):
             obj = self.evaluate_expression(assignable.expr)
-            method = self._evaluate_attr_on_type(obj, '__setitem__')
             key = self.evaluate_expression(assignable.key)
-            self._evaluate_function(method, key, val)
+            self._call_method(obj, '__setitem__', key, val)
         return assign
@@ -1,15 +1,30 @@
+import os
+import tempfile
+import time
 import unittest
-from appy_ast import Value
+from appy_ast import PrimitiveValue
 
-from interpreter import ExecutionEnvironment, Interpreter
+from interpreter import ExecutionEnvironment, Interpreter, RecursionError
+from limits import ExecutionLimits, ResourceLimitExceeded
+from profiler import Profiler
 
 class InterpreterTest(unittest.TestCase):
+    # Subclasses override this to run the same tests on another engine.
+    engine = 'tree'
+
     def setUp(self):
         self.stdout_builder = []
         stdout_handler = lambda s: self.stdout_builder.append(s + '\n')
-        self.interpreter = Interpreter(stdout_handler)
+        self.interpreter = self.create_interpreter(stdout_handler)
         self.type_context = self.interpreter.type_context
 
+    def create_interpreter(self, stdout_handler, **kwargs):
+        """Creates an Interpreter on the engine under test. It doesn't
+        cache ASTs, so that the tests don't write to the user's cache.
+        """
+        return Interpreter(stdout_handler, engine=self.engine,
+                           ast_cache_size=0, **kwargs)
+
     def test_basic_interpreter(self):
         self.assert_evaluate('5 + 3', self.int_value(8))
 
@@ -33,9 +48,47 @@ class InterpreterTest(unittest.TestCase):
     def test_string_multiply_left(self):
         self.assert_evaluate('2 * "hello"', self.string_value('hellohello'))
 
+    def test_mismatched_operand_types(self):
+        self.assert_error(TypeError, '1 + "hello"')
+        self.assert_error(TypeError, '"hello" + 1')
+        self.assert_error(TypeError, '1 < True')
+        self.assert_error(TypeError, 'None + None')
+
     def test_boolean_operators(self):
         self.assert_evaluate('True or False and True', self.bool_value(True))
 
+    def test_short_circuit_skips_right_side(self):
+        self.assert_execute(
+            '''
+def check(name, result):
+    print name
+    if result:
+        return_value = 1
+t = True
+f = False
+x = f and check('and', True)
+y = t or check('or', True)
+z = t and check('evaluated', True)
+print z is None
+''',
+            'evaluated\nTrue\n')
+
+    def test_and_or_return_operands(self):
+        self.assert_evaluate('0 or "default"', self.string_value('default'))
+        self.assert_evaluate('"set" or "default"', self.string_value('set'))
+        self.assert_evaluate('0 and 1 / 0', self.int_value(0))
+        self.assert_evaluate('1 and 2', self.int_value(2))
+        self.assert_execute('zero = 0\nprint zero and 1 / 0', '0\n')
+        self.assert_execute(
+            '''
+def first_true(a, b):
+    print a or b
+first_true(0, 5)
+first_true(3, 5)
+empty = ''
+print empty and undefined_name''',
+            '5\n3\n\n')
+
     def test_comparisons(self):
         self.assert_evaluate('5 == 5 and 3 < 5 and 1 != 2',
                              self.bool_value(True))
@@ -98,6 +151,68 @@ foo1()
 foo2()''',
             '5\n')
 
+    def test_return(self):
+        self.assert_execute(
+            '''
+def add(x, y):
+    return x + y
+def nothing():
+    pass
+print add(1, add(2, 3))
+print nothing()''',
+            '6\nNone\n')
+
+    def test_bare_return(self):
+        self.assert_execute(
+            '''
+def foo(x):
+    if x:
+        print 'before'
+        return
+    print 'after'
+print foo(True)
+print foo(False)''',
+            'before\nNone\nafter\nNone\n')
+
+    def test_return_from_loop(self):
+        self.assert_execute(
+            '''
+def first_multiple(n, limit):
+    i = 1
+    while True:
+        if i * n > limit:
+            return i * n
+        i = i + 1
+    print 'unreachable'
+print first_multiple(7, 30)''',
+            '35\n')
+
+    def test_recursive_return(self):
+        self.assert_execute(
+            '''
+def fib(n):
+    if n < 2:
+        return n
+    return fib(n - 1) + fib(n - 2)
+print fib(15)''',
+            '610\n')
+
+    def test_return_method_result(self):
+        self.assert_execute(
+            '''
+class Counter(object):
+    def next(self):
+        self.count = self.count + 1
+        return self.count
+counter = Counter()
+counter.count = 0
+counter.next()
+print counter.next()''',
+            '2\n')
+
+    def test_return_outside_function(self):
+        self.assert_error(SyntaxError, 'return 1')
+
     def test_closure(self):
         self.assert_execute(
             '''
@@ -130,6 +245,68 @@ def bar():
 
 bar()''')
 
+    def test_enclosing_function_local(self):
+        self.assert_execute(
+            '''
+def outer(x):
+    y = x + 1
+    def inner(z):
+        print x + y + z
+    inner(10)
+    y = 100
+    inner(10)
+outer(1)''',
+            '13\n111\n')
+
+    def test_local_referenced_before_assignment(self):
+        self.assert_error(UnboundLocalError, '''
+x = 1
+def foo():
+    print x
+    x = 2
+foo()''')
+
+    def test_locals_reset_between_calls(self):
+        self.assert_error(UnboundLocalError, '''
+def foo(first):
+    if first:
+        x = 1
+    print x
+foo(True)
+foo(False)''')
+
+    def test_recursion_within_max_call_depth(self):
+        self.interpreter.max_call_depth = 50
+        self.assert_execute(
+            '''
+def count_down(n):
+    if n == 0:
+        print 'Done'
+    if n > 0:
+        count_down(n - 1)
+count_down(40)''',
+            'Done\n')
+
+    def test_max_call_depth_exceeded(self):
+        self.interpreter.max_call_depth = 50
+        self.assert_error(RecursionError, '''
+def count_down(n):
+    if n > 0:
+        count_down(n - 1)
+count_down(60)''')
+
+    def test_unbounded_recursion(self):
+        self.assert_error(RecursionError, '''
+def recurse():
+    recurse()
+recurse()''')
+
+    def test_wrong_argument_count(self):
+        self.assert_error(TypeError, '''
+def foo(a, b):
+    pass
+foo(1)''')
+
     def test_class_attributes(self):
         self.assert_execute(
             '''
@@ -141,6 +318,20 @@ x.bar = 5
 print x.bar''',
             '5\n')
 
+    def test_instance_attribute_dict_created_on_store(self):
+        executor = self.interpreter.create_executor()
+        executor.execute_statement(self.interpreter.parse('''
+class Foo(object):
+    def bar(self):
+        return 1
+x = Foo()
+x.bar()
+y = Foo()
+y.baz = 2'''))
+        self.assertIsNone(executor.scope_chain.resolve_name('x')._attributes)
+        self.assertEqual({'baz': self.int_value(2)},
+                         executor.scope_chain.resolve_name('y').attributes)
+
     def test_class_method(self):
         self.assert_execute(
             '''
@@ -166,6 +357,40 @@ instance.reset_x()
 print instance.x''',
             '5\n0\n')
 
+    def test_replace_method(self):
+        self.assert_execute(
+            '''
+class Foo(object):
+    def greet(self):
+        print 'Hello'
+
+def other_greet(self):
+    print 'Bye'
+
+x = Foo()
+i = 0
+while i < 2:
+    x.greet()
+    Foo.greet = other_greet
+    i = i + 1''',
+            'Hello\nBye\n')
+
+    def test_instance_attribute_shadows_method(self):
+        self.assert_execute(
+            '''
+class Foo(object):
+    def greet(self):
+        print 'Hello'
+
+def other_greet():
+    print 'Bye'
+
+x = Foo()
+x.greet()
+x.greet = other_greet
+x.greet()''',
+            'Hello\nBye\n')
+
     def test_list_literal(self):
         self.assert_execute(
             '''
@@ -182,6 +407,287 @@ my_list[0] = 12
 print my_list[0]''',
             '5\n12\n')
 
+    def test_for(self):
+        self.assert_execute(
+            '''
+total = 0
+for x in [1, 2, 3]:
+    total = total + x
+print total
+print x''',
+            '6\n3\n')
+
+    def test_for_in_function(self):
+        self.assert_execute(
+            '''
+def pairs(xs, ys):
+    for x in xs:
+        for y in ys:
+            print x + y
+pairs([10, 20], [1, 2])''',
+            '11\n12\n21\n22\n')
+
+    def test_for_item_target(self):
+        self.assert_execute(
+            '''
+last = [0]
+for last[0] in [4, 5]:
+    pass
+print last[0]''',
+            '5\n')
+
+    def test_return_from_for(self):
+        self.assert_execute(
+            '''
+def find(xs, target):
+    for x in xs:
+        if x == target:
+            return True
+    return False
+print find([1, 2, 3], 2)
+print find([1, 2, 3], 4)''',
+            'True\nFalse\n')
+
+    def test_list_iterator(self):
+        self.assert_execute(
+            '''
+xs = [1, 2]
+iterator = xs.__iter__()
+print iterator.next()
+for x in iterator:
+    print x''',
+            '1\n2\n')
+        self.assert_error(StopIteration, '[].__iter__().next()')
+
+    def test_for_iteration_protocol(self):
+        self.assert_execute(
+            '''
+class Bag(object):
+    def __iter__(self):
+        return self.items.__iter__()
+bag = Bag()
+bag.items = [7, 8]
+for x in bag:
+    print x''',
+            '7\n8\n')
+
+    def test_for_not_iterable(self):
+        self.assert_error(TypeError, '''
+x = 5
+for y in x:
+    pass''')
+
+    def test_for_steps(self):
+        error = self.assert_limit_exceeded(
+            'max_steps', ExecutionLimits(max_steps=3), '''
+xs = [1, 2, 3, 4, 5]
+for x in xs:
+    pass''')
+        self.assertEqual(4, error.stats.steps)
+
+    def test_range(self):
+        self.assert_execute(
+            '''
+def show(xs):
+    total = 0
+    for x in xs:
+        total = total * 10 + x
+    print total
+show(range(4))
+show(range(2, 5))
+show(xrange(9, 0, 0 - 3))
+show(range(0))''',
+            '123\n234\n963\n0\n')
+
+    def test_range_is_lazy(self):
+        self.assert_execute(
+            '''
+def first_over(xs, limit):
+    for x in xs:
+        if x > limit:
+            return x
+big = range(1000000000000)
+print len(big)
+print big[999999999999]
+print first_over(big, 2)''',
+            '1000000000000\n999999999999\n3\n')
+
+    def test_range_does_not_allocate_lists(self):
+        self.interpreter.limits = ExecutionLimits(max_list_elements=0)
+        self.assert_execute(
+            '''
+total = 0
+for i in range(100):
+    total = total + i
+print total''',
+            '4950\n')
+
+    def test_range_iterator(self):
+        self.assert_execute(
+            '''
+iterator = range(5, 7).__iter__()
+print iterator.next()
+print iterator.next()''',
+            '5\n6\n')
+
+    def test_range_errors(self):
+        self.assert_error(TypeError, 'range()')
+        self.assert_error(TypeError, 'range(1, 2, 3, 4)')
+        self.assert_error(TypeError, 'range("3")')
+        self.assert_error(ValueError, 'range(1, 2, 0)')
+        self.assert_error(IndexError, 'range(3)[3]')
+
+    def test_len(self):
+        self.assert_execute(
+            '''
+print len([1, 2, 3])
+print len('abcd')
+print len(range(3, 10))''',
+            '3\n4\n7\n')
+        self.assert_error(TypeError, 'len(5)')
+
+    def test_builtins_can_be_shadowed(self):
+        self.assert_execute(
+            '''
+def count(xs):
+    len = 0
+    for x in xs:
+        len = len + 1
+    return len
+print count([1, 2])
+len = 5
+print len
+print range(3)[2]''',
+            '2\n5\n2\n')
+        # Each program gets its own globals.
+        self.assert_evaluate('len([])', self.int_value(0))
+
+    def test_int_list_storage(self):
+        self.assert_execute(
+            '''
+xs = [1, 2, 1000]
+xs[0] = 5000
+print xs
+xs[1] = 'two'
+print xs[1]
+last = xs[2]
+print xs[0] + last
+print len(xs)''',
+            '[PrimitiveValue(int, 5000), PrimitiveValue(int, 2), '
+            'PrimitiveValue(int, 1000)]\ntwo\n6000\n3\n')
+
+    def test_store_while_iterating_int_list(self):
+        self.assert_execute(
+            '''
+xs = [1, 2, 3]
+for x in xs:
+    print x
+    xs[2] = 'three'
+''',
+            '1\n2\nthree\n')
+
+    def test_int_list_identity(self):
+        # Int lists only keep the value of each int, so only small ints,
+        # which are canonical, keep their identity.
+        self.assert_execute(
+            '''
+small = 5
+big = 1000
+xs = [small, big]
+first = xs[0]
+second = xs[1]
+print first is small
+print second is big
+print second == big''',
+            'True\nFalse\nTrue\n')
+
+    def test_big_ints_in_list(self):
+        self.assert_execute(
+            '''
+big = 4611686018427387904
+xs = [1, big]
+xs[0] = big * 4
+second = xs[1]
+print xs[0] / big
+print second == big''',
+            '4\nTrue\n')
+
+    def test_list_methods(self):
+        self.assert_execute(
+            '''
+xs = [1]
+xs.append(2)
+xs.extend([3, 4])
+xs.extend(range(5, 7))
+print xs.pop()
+print xs.pop(0)
+print xs
+xs.append('five')
+xs.extend(xs)
+print len(xs)
+print xs.pop(0 - 6)''',
+            '6\n1\n[PrimitiveValue(int, 2), PrimitiveValue(int, 3), '
+            'PrimitiveValue(int, 4), PrimitiveValue(int, 5)]\n10\nfive\n')
+
+    def test_list_method_errors(self):
+        self.assert_error(IndexError, '[].pop()')
+        self.assert_error(IndexError, '[1].pop(1)')
+        self.assert_error(TypeError, '[1].pop(None)')
+        self.assert_error(TypeError, '[1].extend(5)')
+        self.assert_error(TypeError, '[1].append()')
+
+    def test_slice(self):
+        self.assert_execute(
+            '''
+xs = [0, 1, 2, 3, 4]
+print xs[1:3]
+print xs[3:]
+print xs[:0 - 4]
+print len(xs[:])
+print len(xs[4:1])
+print len(xs[10:20])''',
+            '[PrimitiveValue(int, 1), PrimitiveValue(int, 2)]\n'
+            '[PrimitiveValue(int, 3), PrimitiveValue(int, 4)]\n'
+            '[PrimitiveValue(int, 0)]\n5\n0\n0\n')
+        self.assert_error(TypeError, '[1][None:"a"]')
+        self.assert_error(TypeError, 'range(3)[1:2]')
+
+    def test_slices_are_copies(self):
+        # Long enough that the slices are views of the list.
+        self.assert_execute(
+            '''
+xs = []
+for i in range(100):
+    xs.append(i)
+ys = xs[10:90]
+zs = ys[10:]
+xs[10] = 'changed'
+ys[11] = 'changed'
+xs.pop()
+first = ys[0]
+second = zs[1]
+print first + len(ys)
+print second + len(zs)
+print xs[10]
+print ys[11]''',
+            '90\n91\nchanged\nchanged\n')
+
+    def test_slice_views_while_iterating(self):
+        self.assert_execute(
+            '''
+xs = []
+xs.extend(range(100))
+total = 0
+for x in xs:
+    if x == 0:
+        ys = xs[:]
+        xs[99] = 1000
+    total = total + x
+last = ys[99]
+print total
+print last''',
+            '5851\n99\n')
+
     def test_none(self):
         self.assert_execute(
             '''
@@ -202,6 +708,244 @@ print_if_true(True is (True and True))
 print_if_true((True is True) is True)''',
             '!\n!\n!\n!\n')
 
+    def test_shared_primitive_values(self):
+        self.assert_execute(
+            '''
+def print_if_true(b):
+    if b:
+        print '!'
+x = 'hello'
+print_if_true(x is 'hello')
+print_if_true((2 + 3) is 5)
+print_if_true((0 - 5) is (2 - 7))''',
+            '!\n!\n!\n')
+
+    def test_function_attributes(self):
+        self.assert_execute(
+            '''
+def foo():
+    pass
+foo.x = 5
+print foo.x''',
+            '5\n')
+
+    def test_primitive_attributes_are_read_only(self):
+        self.assert_error(AttributeError, '''
+x = 5
+x.foo = 3''')
+
+    def test_builtin_attributes_are_read_only(self):
+        # Builtins are shared by every program, as in Python.
+        self.assert_error(AttributeError, 'len.foo = 3')
+        self.assert_error(AttributeError, 'xrange.foo = 3')
+
+    def test_folded_errors_still_raised(self):
+        self.assert_error(TypeError, 'print "a" - "b"')
+        self.assert_error(ZeroDivisionError, 'print 1 / 0')
+
+    def test_dead_branches(self):
+        self.assert_execute(
+            '''
+if 1 > 2:
+    print 'unreachable'
+while False:
+    print 'unreachable'
+if 2 * 3 == 6:
+    print 'reachable'
+''',
+            'reachable\n')
+
+    def test_assignment_in_dead_branch_is_local(self):
+        self.assert_error(UnboundLocalError, '''
+x = 1
+def foo():
+    if False:
+        x = 2
+    print x
+foo()''')
+
+    def test_unoptimized(self):
+        stdout = []
+        interpreter = self.create_interpreter(stdout.append, optimize=False)
+        interpreter.execute_program('''
+if 1 > 2:
+    print 'unreachable'
+print 2 * 3''')
+        self.assertEqual(['6'], stdout)
+
+    def test_profile(self):
+        profiler = Profiler()
+        interpreter = self.create_interpreter(lambda s: None,
+                                              profiler=profiler)
+        interpreter.execute_program('''
+def fib(n):
+    if n < 2:
+        pass
+    if n > 1:
+        fib(n - 1)
+        fib(n - 2)
+fib(5)''')
+        self.assertEqual({2: 1, 3: 15, 4: 8, 5: 15, 6: 7, 7: 7, 8: 1},
+                         dict((lineno, stats.count) for lineno, stats
+                              in profiler.line_stats().items()))
+        self.assertEqual({'<module>': 1, 'fib:2': 15},
+                         dict((name, stats.calls) for name, stats
+                              in profiler.function_stats().items()))
+        self.assertEqual(
+            ['<module>'] + ['<module>' + ';fib:2' * depth
+                            for depth in range(1, 6)],
+            [line.split()[0]
+             for line in profiler.collapsed_stacks().splitlines()])
+
+    def test_profile_exits_calls_interrupted_by_exception(self):
+        profiler = Profiler()
+        interpreter = self.create_interpreter(lambda s: None,
+                                              profiler=profiler)
+        interpreter.execute_program('''
+def work(xs):
+    return xs.__iter__().next()
+class Empty(object):
+    def __iter__(self):
+        return self
+    def next(self):
+        return work([])
+for x in Empty():
+    pass
+def after():
+    pass
+after()''')
+        self.assertEqual(
+            ['<module>', '<module>;__iter__:5', '<module>;after:11',
+             '<module>;next:7', '<module>;next:7;work:2'],
+            sorted(line.split()[0]
+                   for line in profiler.collapsed_stacks().splitlines()))
+
+    def test_max_steps(self):
+        error = self.assert_limit_exceeded(
+            'max_steps', ExecutionLimits(max_steps=100), '''
+i = 0
+while True:
+    i = i + 1''')
+        self.assertEqual(101, error.stats.steps)
+
+    def test_calls_are_steps(self):
+        self.assert_limit_exceeded(
+            'max_steps', ExecutionLimits(max_steps=100), '''
+def foo():
+    pass
+foo()
+''' + 'foo()\n' * 100)
+
+    def test_timeout(self):
+        error = self.assert_limit_exceeded(
+            'timeout', ExecutionLimits(timeout=0.05), '''
+while True:
+    pass''')
+        self.assertGreaterEqual(error.stats.seconds, 0.05)
+
+    def test_max_list_elements(self):
+        error = self.assert_limit_exceeded(
+            'max_list_elements', ExecutionLimits(max_list_elements=20), '''
+i = 0
+while i < 10:
+    x = [i, i, i]
+    i = i + 1''')
+        self.assertEqual(21, error.stats.list_elements)
+
+    def test_list_growth_is_limited(self):
+        error = self.assert_limit_exceeded(
+            'max_list_elements', ExecutionLimits(max_list_elements=20), '''
+xs = [1, 2]
+while True:
+    xs.extend(xs)''')
+        self.assertEqual(32, error.stats.list_elements)
+        self.assert_limit_exceeded(
+            'max_list_elements', ExecutionLimits(max_list_elements=20), '''
+xs = [1, 2, 3, 4, 5, 6, 7, 8]
+while True:
+    xs = xs[1:]
+    xs.append(1)''')
+
+    def test_within_limits(self):
+        self.interpreter.limits = ExecutionLimits(
+            max_steps=11, timeout=10, max_list_elements=3)
+        self.assert_execute(
+            '''
+def add(x, y):
+    print x + y
+i = 0
+while i < 10:
+    i = i + 1
+add(i, 1)
+print [i, i, i][0]''',
+            '11\n10\n')
+
+    def test_extend_charges_before_allocating(self):
+        # These would take gigabytes if the elements were stored before
+        # being charged.
+        for program in ['[].extend(range(1000000000))',
+                        '[].extend(range(1000000000).__iter__())']:
+            start = time.time()
+            self.assert_limit_exceeded(
+                'max_list_elements', ExecutionLimits(max_list_elements=1000),
+                program)
+            self.assertLess(time.time() - start, 1)
+
+    def test_list_growth_charges_its_own_execution(self):
+        ast = self.interpreter.parse('''
+xs = []
+for i in range(100):
+    xs.append(i)
+    ys = xs[0:]''')
+        limited = self.interpreter.create_executor(
+            ExecutionLimits(max_list_elements=5))
+        unlimited = self.interpreter.create_executor()
+        self.assertRaises(ResourceLimitExceeded, limited.execute_statement,
+                          ast)
+        unlimited.execute_statement(ast)
+
+    def test_expression_limits(self):
+        self.assertRaises(
+            ResourceLimitExceeded, self.interpreter.evaluate_expression,
+            '[1, 2, 3]', ExecutionLimits(max_list_elements=2))
+        # The limits only applied to that evaluation.
+        self.assert_evaluate('[1, 2, 3][2]', self.int_value(3))
+
+    def assert_limit_exceeded(self, limit, limits, program):
+        with self.assertRaises(ResourceLimitExceeded) as context:
+            self.interpreter.execute_program(program, limits)
+        self.assertEqual(limit, context.exception.limit)
+        return context.exception
+
+    def test_execute_file(self):
+        fd, path = tempfile.mkstemp(suffix='.py')
+        try:
+            with os.fdopen(fd, 'w') as program_file:
+                program_file.write('x = 5\nif x > 3:\n    print x\n')
+            self.assertEqual('5\n', self.capture_stdout(
+                lambda: self.interpreter.execute_file(path)))
+        finally:
+            os.remove(path)
+
+    def test_expression_cache(self):
+        self.assert_evaluate('5 + 3', self.int_value(8))
+        self.assert_evaluate('5 + 3', self.int_value(8))
+        self.assert_evaluate('5 - 3', self.int_value(2))
+        stats = self.interpreter.expression_cache_stats()
+        self.assertEqual((1, 2, 2), (stats.hits, stats.misses, stats.size))
+
+    def test_expression_cache_disabled(self):
+        interpreter = self.create_interpreter(lambda s: None,
+                                              expression_cache_size=0)
+        interpreter.evaluate_expression('5 + 3')
+        self.assertEqual(8, interpreter.evaluate_expression('5 + 3').data)
+        self.assertEqual(0, interpreter.expression_cache_stats().hits)
+
+    def test_long_program(self):
+        self.assert_execute(
+            'x = 0\n' + 'x = x + 1\n' * 100000 + 'print x',
+            '100000\n')
+
     def assert_evaluate(self, program, expected_value):
         # TODO: I'm pretty sure this is doing deep equality on the
         # type, which it probably shouldn't do.
@@ -228,13 +972,13 @@ print_if_true((True is True) is True)''',
             lambda: self.interpreter.execute_program(program))
 
     def int_value(self, int_val):
-        return Value(self.type_context.int_type, int_val, {})
+        return PrimitiveValue(self.type_context.int_type, int_val)
 
     def string_value(self, string_val):
-        return Value(self.type_context.str_type, string_val, {})
+        return PrimitiveValue(self.type_context.str_type, string_val)
 
     def bool_value(self, bool_val):
-        return Value(self.type_context.bool_type, bool_val, {})
+        return PrimitiveValue(self.type_context.bool_type, bool_val)
 
 
 if __name__ == '__main__':
@@ -1,5 +1,7 @@
+from array import array
 from file_lexer import FileLexer
 from line_lexer import LineLexer
+from scanner import Scanner
 
 
 class PlyLexerAdapter:
@@ -8,15 +10,25 @@ class PlyLexerAdapter:
     the next token. Since this interface is kind of hard to work with,
     we have a tokenize(str) method that returns a generator, and build
     a PLY-style lexer from that.
+
+    The input can also be a file object or other iterable of chunks of
+    the program, which is tokenized as the parser asks for tokens.
+
+    line_starts holds the offset of the start of each line read so far,
+    indexed by line number - 1, so that the column of a token can be
+    found from its lineno and lexpos.
     '''
 
     def __init__(self, delegate_lexer):
         self.string = None
         self.delegate_lexer = delegate_lexer
         self.generator = None
+        self.line_starts = None
 
     def input(self, string):
-        self.generator = self.delegate_lexer.tokenize(string)
+        self.line_starts = array('l')
+        self.generator = self.delegate_lexer.tokenize(string,
+                                                      self.line_starts)
 
     def token(self):
         try:
@@ -25,7 +37,24 @@ class PlyLexerAdapter:
             return None
 
 
-def create_lexer():
-    return PlyLexerAdapter(FileLexer())
+def create_lexer(file_lexer=None, tokenizer='ply'):
+    """
+    @type file_lexer: FileLexer
+    @param file_lexer: An existing FileLexer to wrap, so that callers
+    parsing many programs can avoid rebuilding the lexer tables.
+    @type tokenizer: str
+    @param tokenizer: Which tokenizer to create if file_lexer is not
+    given:
+      -'ply' lexes each logical line with PLY (FileLexer and LineLexer).
+      -'scanner' uses the hand-written single-pass Scanner.
+    """
+    if file_lexer is None:
+        if tokenizer == 'ply':
+            file_lexer = FileLexer()
+        elif tokenizer == 'scanner':
+            file_lexer = Scanner()
+        else:
+            raise ValueError('Unknown tokenizer: ' + str(tokenizer))
+    return PlyLexerAdapter(file_lexer)
 
 tokens = FileLexer.tokens + LineLexer.tokens
@@ -1,5 +1,10 @@
+import mmap
+import os
+import tempfile
 import unittest
-from file_lexer import FileLexer
+from contextlib import contextmanager
+from StringIO import StringIO
+from file_lexer import FileLexer, split_lines, mapped_lines
 from lexer import create_lexer
 
 
@@ -22,6 +27,8 @@ def string(s):
     return ('STRING', s)
 if_token = ('IF', 'if')
 while_token = ('WHILE', 'while')
+for_token = ('FOR', 'for')
+in_token = ('IN', 'in')
 none = ('NONE', 'None')
 is_token = ('IS', 'is')
 colon = ('COLON', ':')
@@ -31,10 +38,49 @@ indent = ('INDENT', '')
 dedent = ('DEDENT', '')
 pass_token = ('PASS', 'pass')
 print_token = ('PRINT', 'print')
+return_token = ('RETURN', 'return')
 def_token = ('DEF', 'def')
 class_token = ('CLASS', 'class')
 
+@contextmanager
+def temporary_file(contents):
+    """Context manager giving a file on disk with the given contents,
+    opened for reading."""
+    fd, path = tempfile.mkstemp()
+    try:
+        with os.fdopen(fd, 'w') as temp_file:
+            temp_file.write(contents)
+        with open(path) as temp_file:
+            yield temp_file
+    finally:
+        os.remove(path)
+
+
+class SplitLinesTest(unittest.TestCase):
+    def test_matches_split(self):
+        for text in ['', '\n', 'a', 'ab\ncd\n\nef', 'ab\n']:
+            for chunk_size in [1, 2, 3]:
+                chunks = [text[i:i + chunk_size]
+                          for i in range(0, len(text), chunk_size)]
+                self.assertEqual(text.split('\n'), list(split_lines(chunks)))
+
+    def test_mapped_lines_match_split(self):
+        window_size = mmap.ALLOCATIONGRANULARITY
+        # Lines that cross the edges of windows, a line longer than a
+        # window, and a newline right at the end of a window.
+        text = ''.join('line %d\n' % i for i in range(2000))
+        text += 'x' * (window_size * 2) + '\n'
+        text += 'y' * (window_size * 3 - len(text) % window_size - 1) + '\n'
+        text += 'last'
+        with temporary_file(text) as source_file:
+            self.assertEqual(text.split('\n'),
+                             list(mapped_lines(source_file, window_size)))
+
+
 class LexerTest(unittest.TestCase):
+    # Subclasses override this to run the same tests on another tokenizer.
+    tokenizer = 'ply'
+
     def test_simple_tokens(self):
         self.assert_tokens(
             '5 + 3',
@@ -99,6 +145,14 @@ class LexerTest(unittest.TestCase):
             '1\n \t\n2',
             [num(1), newline, num(2), newline])
 
+    def test_tab_indentation(self):
+        self.assert_tokens(
+            'if x:\n'
+            '\tprint 1\n'
+            '        print 2',
+            [if_token, ident('x'), colon, newline, indent, print_token,
+             num(1), newline, print_token, num(2), newline, dedent])
+
     def test_if(self):
         self.assert_tokens(
             'if 1 + 1:\n'
@@ -113,6 +167,13 @@ class LexerTest(unittest.TestCase):
             [while_token, ident('x'), equals, num(5), colon, newline, indent,
              print_token, ident('x'), newline, dedent])
 
+    def test_for(self):
+        self.assert_tokens(
+            'for x in xs:\n'
+            '    print x',
+            [for_token, ident('x'), in_token, ident('xs'), colon, newline,
+             indent, print_token, ident('x'), newline, dedent])
+
     def test_identifier(self):
         self.assert_tokens('x + 5', [ident('x'), plus, num(5), newline])
 
@@ -144,6 +205,16 @@ def blah():
             [pass_token, newline, def_token, ident('blah'), lparen, rparen,
              colon, newline, indent, pass_token, newline, dedent])
 
+    def test_return(self):
+        self.assert_tokens(
+            '''
+def blah(x):
+    return x
+    return''',
+            [def_token, ident('blah'), lparen, ident('x'), rparen, colon,
+             newline, indent, return_token, ident('x'), newline,
+             return_token, newline, dedent])
+
     def test_class(self):
         self.assert_tokens(
             '''
@@ -187,6 +258,66 @@ if x is None:
             [ident('x'), assign, none, newline, if_token, ident('x'), is_token,
              none, colon, newline, indent, pass_token, newline, dedent])
 
+    def test_token_positions(self):
+        self.assert_positions(
+            'x = (1,\n  2)\ny',
+            [(ident('x'), 1, 0), (assign, 1, 2), (lparen, 1, 4),
+             (num(1), 1, 5), (comma, 1, 6), (num(2), 2, 10), (rparen, 2, 11),
+             (newline, 2, 12), (ident('y'), 3, 13), (newline, 3, 14)])
+
+    def test_indentation_and_continuation_positions(self):
+        self.assert_positions(
+            'if x:\n'
+            '    y = 1 + \\\n'
+            '  2\n'
+            '\n'
+            'z',
+            [(if_token, 1, 0), (ident('x'), 1, 3), (colon, 1, 4),
+             (newline, 1, 5), (indent, 2, 10), (ident('y'), 2, 10),
+             (assign, 2, 12), (num(1), 2, 14), (plus, 2, 16), (num(2), 3, 22),
+             (newline, 3, 23), (dedent, 5, 25), (ident('z'), 5, 25),
+             (newline, 5, 26)])
+
+    def test_chunked_input(self):
+        program = ('class Foo(object):\n'
+                   '    x = [1,\n'
+                   '\t2]\n'
+                   '\n'
+                   'y = "a" + \\\n'
+                   '  "b"\n')
+        expected_tokens = self.get_positions(program)
+        for chunk_size in [1, 2, 5, 64]:
+            chunks = [program[i:i + chunk_size]
+                      for i in range(0, len(program), chunk_size)]
+            self.assertEqual(expected_tokens, self.get_positions(chunks))
+
+    def test_file_input(self):
+        program = 'if x:\n    print 1\nprint 2'
+        self.assertEqual(self.get_positions(program),
+                         self.get_positions(StringIO(program)))
+
+    def test_mapped_file_input(self):
+        program = 'class Foo(object):\n    x = [1,\n  2]\nprint "a"\n'
+        with temporary_file(program) as program_file:
+            self.assertEqual(self.get_positions(program),
+                             self.get_positions(program_file))
+        with temporary_file('') as program_file:
+            self.assertEqual([], self.get_tokens(program_file))
+
+    def test_empty_input(self):
+        self.assertEqual([], self.get_tokens([]))
+        self.assertEqual([], self.get_tokens(['', '\n  \n']))
+
+    def assert_positions(self, program, expected_tokens):
+        """
+        @param expected_tokens: A list of (token, lineno, lexpos) tuples.
+        """
+        self.assertEqual(expected_tokens, self.get_positions(program))
+
+    def get_positions(self, program):
+        return [((tok.type, tok.value), tok.lineno, tok.lexpos)
+                for tok in self.get_tokens(program)]
+
     def assert_tokens(self, program, expected_tokens):
         tokens = self.get_tokens(program)
         self.assertEqual(expected_tokens,
@@ -196,7 +327,7 @@ if x is None:
         self.assertRaises(SyntaxError, self.get_tokens, program)
 
     def get_tokens(self, input):
-        lexer = create_lexer()
+        lexer = create_lexer(tokenizer=self.tokenizer)
         lexer.input(input)
         result = []
         while True:
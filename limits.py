@@ -0,0 +1,108 @@
+from collections import namedtuple
+from timeit import default_timer
+
+
+class ExecutionLimits(namedtuple('ExecutionLimits',
+                                 ['max_steps', 'timeout',
+                                  'max_list_elements'])):
+    """
+    The resources a single execution may use. Any of them can be None
+    for no limit.
+    * max_steps is the most loop iterations and user-defined function
+      calls that may run, which bounds the work of any program since
+      everything else runs in time proportional to the program's size.
+    * timeout is the most wall-clock seconds the execution may take.
+    * max_list_elements is the most list elements that may be
+      allocated in total.
+    """
+    def __new__(cls, max_steps=None, timeout=None, max_list_elements=None):
+        return super(ExecutionLimits, cls).__new__(
+            cls, max_steps, timeout, max_list_elements)
+
+
+ExecutionStats = namedtuple('ExecutionStats',
+                            ['steps', 'list_elements', 'seconds'])
+
+
+class ResourceLimitExceeded(RuntimeError):
+    """Raised when an execution uses more than its ExecutionLimits allow.
+    limit is the name of the ExecutionLimits field that was exceeded,
+    and stats is the ExecutionStats of the execution up to that point.
+    """
+
+    def __init__(self, limit, stats):
+        RuntimeError.__init__(self, 'execution exceeded its %s (%s)' %
+                              (limit, _format_stats(stats)))
+        self.limit = limit
+        self.stats = stats
+
+
+class Budget(object):
+    """Tracks the resources used by one execution against its limits.
+
+    Engines call tick for every loop iteration and function call, and
+    allocate_lists for every list they build. Reading the clock costs
+    far more than counting, so the deadline is only checked every
+    CHECK_INTERVAL steps.
+    """
+
+    CHECK_INTERVAL = 256
+
+    def __init__(self, limits, clock=default_timer):
+        """
+        @type limits: ExecutionLimits
+        @param clock: A function returning the current time in seconds.
+        """
+        self.limits = limits
+        self.clock = clock
+        self.start = clock()
+        if limits.timeout is None:
+            self.deadline = None
+        else:
+            self.deadline = self.start + limits.timeout
+        self.steps = 0
+        self.list_elements = 0
+        # The step count at which the limits are next checked.
+        self.next_check = 0
+        self._check()
+
+    def tick(self):
+        """Counts one step, raising ResourceLimitExceeded if the step or
+        time limit has been exceeded.
+        """
+        self.steps += 1
+        if self.steps >= self.next_check:
+            self._check()
+
+    def allocate_lists(self, element_count):
+        """Counts the elements of newly built lists, raising
+        ResourceLimitExceeded if there are too many in total.
+        """
+        self.list_elements += element_count
+        max_list_elements = self.limits.max_list_elements
+        if (max_list_elements is not None and
+                self.list_elements > max_list_elements):
+            raise ResourceLimitExceeded('max_list_elements', self.stats())
+
+    def stats(self):
+        """
+        @return: The resources used so far.
+        @rtype: ExecutionStats
+        """
+        return ExecutionStats(self.steps, self.list_elements,
+                              self.clock() - self.start)
+
+    def _check(self):
+        max_steps = self.limits.max_steps
+        if max_steps is not None and self.steps > max_steps:
+            raise ResourceLimitExceeded('max_steps', self.stats())
+        if self.deadline is not None and self.clock() > self.deadline:
+            raise ResourceLimitExceeded('timeout', self.stats())
+        next_check = self.steps + self.CHECK_INTERVAL
+        if max_steps is not None:
+            next_check = min(next_check, max_steps + 1)
+        self.next_check = next_check
+
+
+def _format_stats(stats):
+    return '%d steps, %d list elements, %.3f seconds' % stats
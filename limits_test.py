@@ -0,0 +1,50 @@
+import unittest
+
+from limits import (Budget, ExecutionLimits, ExecutionStats,
+                    ResourceLimitExceeded)
+
+
+class BudgetTest(unittest.TestCase):
+    def test_no_limits(self):
+        budget = Budget(ExecutionLimits(), clock=lambda: 0)
+        for _ in range(1000):
+            budget.tick()
+        budget.allocate_lists(1000000)
+        self.assertEqual(ExecutionStats(1000, 1000000, 0), budget.stats())
+
+    def test_max_steps(self):
+        budget = Budget(ExecutionLimits(max_steps=300), clock=lambda: 0)
+        for _ in range(300):
+            budget.tick()
+        with self.assertRaises(ResourceLimitExceeded) as context:
+            budget.tick()
+        self.assertEqual('max_steps', context.exception.limit)
+        self.assertEqual(301, context.exception.stats.steps)
+
+    def test_timeout_checked_every_interval(self):
+        times = [0.0]
+        budget = Budget(ExecutionLimits(timeout=1.0), clock=lambda: times[0])
+        times[0] = 2.0
+        for _ in range(Budget.CHECK_INTERVAL - 1):
+            budget.tick()
+        with self.assertRaises(ResourceLimitExceeded) as context:
+            budget.tick()
+        self.assertEqual('timeout', context.exception.limit)
+        self.assertEqual(
+            ExecutionStats(Budget.CHECK_INTERVAL, 0, 2.0),
+            context.exception.stats)
+
+    def test_max_list_elements(self):
+        budget = Budget(ExecutionLimits(max_list_elements=10),
+                        clock=lambda: 0)
+        budget.allocate_lists(6)
+        budget.allocate_lists(4)
+        with self.assertRaises(ResourceLimitExceeded) as context:
+            budget.allocate_lists(1)
+        self.assertEqual('max_list_elements', context.exception.limit)
+        self.assertEqual(11, context.exception.stats.list_elements)
+        self.assertIn('11 list elements', str(context.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,12 +4,19 @@ from ply.lex import TOKEN, Lexer
 
 
 class LineLexer(object):
-    def __init__(self):
-        self.lexer = lex.lex(module=self)
+    def __init__(self, **lex_options):
+        """
+        @param lex_options: Extra keyword arguments passed through to
+        lex.lex, e.g. to build the lexer from a precomputed lextab.
+        """
+        self.lexer = lex.lex(module=self, **lex_options)
 
-    def tokenize(self, string):
-        lexer = lex.lex(module=self)
+    def tokenize(self, string, lineno=1):
+        """
+        @param lineno: The line number given to the tokens.
+        """
         self.lexer.input(string)
+        self.lexer.lineno = lineno
         while True:
             token = self.lexer.token()
             if token:
@@ -20,6 +27,8 @@ class LineLexer(object):
     reserved_words = {
         'if': 'IF',
         'while': 'WHILE',
+        'for': 'FOR',
+        'in': 'IN',
         'True': 'TRUE',
         'False': 'FALSE',
         'None': 'NONE',
@@ -29,6 +38,7 @@ class LineLexer(object):
         'is': 'IS',
         'pass': 'PASS',
         'print': 'PRINT',
+        'return': 'RETURN',
         'def': 'DEF',
         'class': 'CLASS'
     }
@@ -82,16 +92,23 @@ class LineLexer(object):
 
     @TOKEN(string_regex("'") + '|' + string_regex('"'))
     def t_STRING(self, t):
-        code_string = t.value
+        t.value = self.string_literal_value(t.value)
+        return t
+
+    @staticmethod
+    def string_literal_value(code_string):
+        """
+        Returns the contents of a string literal, given the literal as
+        written in the source including its prefix and quotes.
+        """
         delimiter = code_string[-1]
         delim_start = code_string.find(delimiter)
         string_contents = code_string[delim_start + 1:-1]
         prefix = code_string[0:delim_start]
         # TODO: Unicode, bytes
         if not match('[rR]', prefix):
-            string_contents = self.escape_string(string_contents)
-        t.value = string_contents
-        return t
+            string_contents = LineLexer.escape_string(string_contents)
+        return string_contents
 
     # Taken from example at http://www.dabeaz.com/ply/ply.html#ply_nn6
     def t_ID(self, t):
@@ -132,7 +149,8 @@ class LineLexer(object):
         ('v', '\v'),
     ]
 
-    def escape_string(self, string):
+    @staticmethod
+    def escape_string(string):
         for (key, value) in LineLexer.ESCAPE_MAPPINGS:
             string = string.replace('\\' + key, value)
         return string
@@ -0,0 +1,64 @@
+import threading
+from collections import namedtuple, OrderedDict
+
+
+CacheStats = namedtuple('CacheStats', ['hits', 'misses', 'size', 'capacity'])
+
+
+class LruCache(object):
+    """Bounded map that evicts its least recently used entry once it is
+    full, and counts how many lookups hit and missed.
+
+    All access goes through a lock, so a cache can be shared between
+    threads.
+    """
+
+    def __init__(self, capacity):
+        """
+        @type capacity: int
+        @param capacity: The most entries to keep. 0 disables caching.
+        """
+        self.capacity = capacity
+        # Ordered from least to most recently used.
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        @return: The value cached for key, or None if there is none.
+        """
+        with self.lock:
+            try:
+                value = self.entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self.entries[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            if self.capacity <= 0:
+                return
+            self.entries.pop(key, None)
+            self.entries[key] = value
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        """
+        @rtype: CacheStats
+        """
+        with self.lock:
+            return CacheStats(self.hits, self.misses, len(self.entries),
+                              self.capacity)
+
+    def clear(self):
+        """Removes every entry and resets the counters."""
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
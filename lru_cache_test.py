@@ -0,0 +1,68 @@
+import threading
+import unittest
+
+from lru_cache import CacheStats, LruCache
+
+
+class LruCacheTest(unittest.TestCase):
+    def test_get_and_put(self):
+        cache = LruCache(2)
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', 1)
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(CacheStats(hits=1, misses=1, size=1, capacity=2),
+                         cache.stats())
+
+    def test_evicts_least_recently_used(self):
+        cache = LruCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertEqual(1, cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(3, cache.get('c'))
+
+    def test_put_replaces(self):
+        cache = LruCache(2)
+        cache.put('a', 1)
+        cache.put('a', 2)
+        self.assertEqual(2, cache.get('a'))
+        self.assertEqual(1, cache.stats().size)
+
+    def test_zero_capacity(self):
+        cache = LruCache(0)
+        cache.put('a', 1)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(0, cache.stats().size)
+
+    def test_clear(self):
+        cache = LruCache(2)
+        cache.put('a', 1)
+        cache.get('a')
+        cache.clear()
+        self.assertEqual(CacheStats(hits=0, misses=0, size=0, capacity=2),
+                         cache.stats())
+
+    def test_thread_safety(self):
+        cache = LruCache(8)
+
+        def use_cache(n):
+            for i in range(1000):
+                key = (n + i) % 16
+                if cache.get(key) is None:
+                    cache.put(key, key)
+        threads = [threading.Thread(target=use_cache, args=(n,))
+                   for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = cache.stats()
+        self.assertEqual(4000, stats.hits + stats.misses)
+        self.assertEqual(8, stats.size)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,198 @@
+from appy_ast import (Block, Assignment, ExpressionStatement, PrintStatement,
+                      ReturnStatement, PassStatement, IfStatement,
+                      WhileStatement, ForStatement, DefStatement,
+                      ClassStatement, BinaryOperator, Literal, ListLiteral,
+                      FunctionCall, AttributeAccess, GetItem, Slice)
+from interpreter import ExecutionEnvironment
+
+
+# Folding a string repetition would otherwise let a tiny program build
+# an arbitrarily large string before it starts running.
+MAX_FOLDED_STR_LENGTH = 4096
+
+
+def optimize(ast, type_context):
+    """
+    Returns a copy of the resolved AST with constant expressions folded
+    and unreachable branches removed.
+    @type type_context: TypeContext
+    """
+    return Optimizer(type_context).optimize(ast)
+
+
+class Optimizer(object):
+    """Constant folding and dead-branch elimination pass over a resolved
+    AST.
+
+    An and/or whose left side is a Literal is replaced by the operand
+    that it evaluates to. Any other BinaryOperator on two Literals is
+    replaced by a Literal of its result when the operand types have a
+    primitive operator in the TypeContext, so folding computes exactly
+    what running it would. Anything that would raise at runtime, such
+    as "a" - "b" or 1 / 0, is left as is so that the error still
+    happens when it runs.
+
+    An if statement with a literal condition is replaced by its body or
+    removed, and a while loop with a false literal condition is removed,
+    as are statements following a return in the same block.
+    This runs after resolution, so names that are only assigned in a
+    removed branch are still locals of their function, as in Python.
+    """
+
+    BINARY_OPERATORS = ExecutionEnvironment.BINARY_OPERATORS
+
+    def __init__(self, type_context):
+        """
+        @type type_context: TypeContext
+        """
+        self.type_context = type_context
+
+    def optimize(self, node):
+        try:
+            method = getattr(self, '_optimize_' + node.__class__.__name__)
+        except AttributeError:
+            raise NotImplementedError(
+                'Missing optimizer for node ' + str(node))
+        return method(node)
+
+    def _optimize_Block(self, statement):
+        statements = []
+        for sub_statement in statement.statements:
+            sub_statement = self.optimize(sub_statement)
+            if isinstance(sub_statement, Block):
+                statements.extend(sub_statement.statements)
+            elif not isinstance(sub_statement, PassStatement):
+                statements.append(sub_statement)
+            if statements and isinstance(statements[-1], ReturnStatement):
+                # Nothing after a return in the same block can run.
+                break
+        # The parser only builds Blocks of more than one statement.
+        if not statements:
+            return PassStatement(statement.position)
+        elif len(statements) == 1:
+            return statements[0]
+        return Block(tuple(statements), statement.position)
+
+    def _optimize_Assignment(self, statement):
+        return Assignment(self.optimize(statement.left),
+                          self.optimize(statement.right), statement.position)
+
+    def _optimize_ExpressionStatement(self, statement):
+        return ExpressionStatement(self.optimize(statement.expr),
+                                   statement.position)
+
+    def _optimize_PassStatement(self, statement):
+        return statement
+
+    def _optimize_PrintStatement(self, statement):
+        return PrintStatement(self.optimize(statement.expr),
+                              statement.position)
+
+    def _optimize_ReturnStatement(self, statement):
+        return ReturnStatement(self.optimize(statement.expr),
+                               statement.position)
+
+    def _optimize_IfStatement(self, statement):
+        condition = self.optimize(statement.condition)
+        if isinstance(condition, Literal):
+            if condition.value.data:
+                return self.optimize(statement.statement)
+            return PassStatement(statement.position)
+        return IfStatement(condition, self.optimize(statement.statement),
+                           statement.position)
+
+    def _optimize_WhileStatement(self, statement):
+        condition = self.optimize(statement.condition)
+        if isinstance(condition, Literal) and not condition.value.data:
+            return PassStatement(statement.position)
+        return WhileStatement(condition, self.optimize(statement.statement),
+                              statement.position)
+
+    def _optimize_ForStatement(self, statement):
+        return ForStatement(self.optimize(statement.target),
+                            self.optimize(statement.iterable),
+                            self.optimize(statement.statement),
+                            statement.position)
+
+    def _optimize_DefStatement(self, statement):
+        return DefStatement(statement.name, statement.param_names,
+                            self.optimize(statement.body),
+                            statement.local_names, statement.captures_scope,
+                            statement.position)
+
+    def _optimize_ClassStatement(self, statement):
+        return ClassStatement(statement.name,
+                              self.optimize(statement.superclass),
+                              self.optimize(statement.body),
+                              statement.position)
+
+    def _optimize_BinaryOperator(self, expression):
+        left = self.optimize(expression.left)
+        right = self.optimize(expression.right)
+        if (expression.operator in ('and', 'or') and
+                isinstance(left, Literal)):
+            # The literal decides whether the right side is the result.
+            if bool(left.value.data) == (expression.operator == 'and'):
+                return right
+            return left
+        if isinstance(left, Literal) and isinstance(right, Literal):
+            value = self._fold(expression.operator, left.value, right.value)
+            if value is not None:
+                return Literal(value, expression.position)
+        return BinaryOperator(expression.operator, left, right,
+                              expression.position)
+
+    def _fold(self, operator, left, right):
+        """
+        @type left: Value
+        @type right: Value
+        @return: The Value of left operator right, or None if it can't
+        be computed safely before running the program.
+        """
+        if operator == 'is':
+            return self.type_context.bool_value(left is right)
+        primitive_operator = self.type_context.primitive_operators.get(
+            (self.BINARY_OPERATORS[operator], id(left.type),
+             id(right.type)))
+        if primitive_operator is None:
+            return None
+        if (operator == '*' and left.type is self.type_context.str_type and
+                len(left.data) * right.data > MAX_FOLDED_STR_LENGTH):
+            return None
+        try:
+            return primitive_operator(left.data, right.data)
+        except ArithmeticError:
+            return None
+
+    def _optimize_Literal(self, expression):
+        return expression
+
+    def _optimize_ListLiteral(self, expression):
+        return ListLiteral([self.optimize(expr)
+                            for expr in expression.expressions],
+                           expression.position)
+
+    def _optimize_Variable(self, expression):
+        return expression
+
+    def _optimize_LocalVariable(self, expression):
+        return expression
+
+    def _optimize_FunctionCall(self, expression):
+        return FunctionCall(self.optimize(expression.function_expr),
+                            [self.optimize(arg) for arg in expression.args],
+                            expression.position)
+
+    def _optimize_AttributeAccess(self, expression):
+        return AttributeAccess(self.optimize(expression.expr),
+                               expression.attr_name, expression.position)
+
+    def _optimize_GetItem(self, expression):
+        return GetItem(self.optimize(expression.expr),
+                       self.optimize(expression.key), expression.position)
+
+    def _optimize_Slice(self, expression):
+        # Slices aren't folded, since a Literal's Value must be one that
+        # the AST cache can store.
+        return Slice(self.optimize(expression.start),
+                     self.optimize(expression.stop), expression.position)
@@ -0,0 +1,155 @@
+import unittest
+
+from appy_ast import (Assignment, Variable, LocalVariable, DefStatement,
+                      PrintStatement, Block, BinaryOperator, Literal,
+                      ExpressionStatement, PassStatement, WhileStatement,
+                      ReturnStatement, PrimitiveValue)
+from builtin_types import TypeContext
+from lexer import create_lexer
+from optimizer import optimize
+from parser import Parser
+from resolver import resolve
+
+
+class OptimizerTest(unittest.TestCase):
+    def setUp(self):
+        self.type_context = TypeContext()
+
+    def test_fold_int_arithmetic(self):
+        self.assert_optimized('1 + 2 * 3 - 8 / 2',
+                              ExpressionStatement(self.int_literal(3)))
+
+    def test_fold_strings(self):
+        self.assert_optimized('"ab" + "c" * 2',
+                              ExpressionStatement(self.str_literal('abcc')))
+
+    def test_fold_comparisons_and_booleans(self):
+        self.assert_optimized('1 < 2 and (3 == 4 or True)',
+                              ExpressionStatement(self.bool_literal(True)))
+
+    def test_folded_values_are_canonical(self):
+        folded = self.optimize('(2 + 3) is 5')
+        self.assertIs(self.type_context.true_value, folded.expr.value)
+
+    def test_partial_fold(self):
+        self.assert_optimized(
+            'x + (2 * 3)',
+            ExpressionStatement(BinaryOperator('+', Variable('x'),
+                                               self.int_literal(6))))
+
+    def test_fold_short_circuit(self):
+        self.assert_optimized('True and x', ExpressionStatement(Variable('x')))
+        self.assert_optimized('0 and x',
+                              ExpressionStatement(self.int_literal(0)))
+        self.assert_optimized('"" or x', ExpressionStatement(Variable('x')))
+        self.assert_optimized('1 or x',
+                              ExpressionStatement(self.int_literal(1)))
+        self.assert_optimized(
+            'x and True',
+            ExpressionStatement(BinaryOperator('and', Variable('x'),
+                                               self.bool_literal(True))))
+
+    def test_runtime_errors_not_folded(self):
+        for program in ['"a" - "b"', '1 + "a"', '1 / 0', 'None + None',
+                        '1 < True']:
+            self.assertEqual(self.resolve(program), self.optimize(program))
+
+    def test_large_string_not_folded(self):
+        program = '"abc" * 100000'
+        self.assertEqual(self.resolve(program), self.optimize(program))
+
+    def test_dead_if_removed(self):
+        self.assert_optimized(
+            '''
+print 1
+if 1 > 2:
+    print 2
+print 3''',
+            Block((PrintStatement(self.int_literal(1)),
+                   PrintStatement(self.int_literal(3)))))
+
+    def test_live_if_inlined(self):
+        self.assert_optimized(
+            '''
+print 1
+if True:
+    print 2
+    print 3''',
+            Block((PrintStatement(self.int_literal(1)),
+                   PrintStatement(self.int_literal(2)),
+                   PrintStatement(self.int_literal(3)))))
+
+    def test_dead_while_removed(self):
+        self.assert_optimized(
+            '''
+while False:
+    print 2''',
+            PassStatement())
+
+    def test_live_while_kept(self):
+        self.assert_optimized(
+            '''
+while x:
+    print 2 + 2''',
+            WhileStatement(Variable('x'),
+                           PrintStatement(self.int_literal(4))))
+
+    def test_removed_assignment_stays_local(self):
+        self.assert_optimized(
+            '''
+def foo():
+    if False:
+        x = 1
+    print x''',
+            DefStatement('foo', [], PrintStatement(LocalVariable('x', 0, 0)),
+                         ('x',), False))
+
+    def test_code_after_return_removed(self):
+        self.assert_optimized(
+            '''
+def foo():
+    print 1
+    if True:
+        return 2 + 3
+        print 2
+    print 3''',
+            DefStatement('foo', [], Block((
+                PrintStatement(self.int_literal(1)),
+                ReturnStatement(self.int_literal(5)))), (), False))
+
+    def test_empty_function_body(self):
+        self.assert_optimized(
+            '''
+def foo():
+    if False:
+        print 1''',
+            DefStatement('foo', [], PassStatement(), (), False))
+
+    def test_positions_kept(self):
+        folded = self.optimize('x = 1 + 2')
+        self.assertEqual(self.resolve('x = 1 + 2').right.position,
+                         folded.right.position)
+
+    def assert_optimized(self, program, expected_ast):
+        self.assertEqual(expected_ast, self.optimize(program))
+
+    def optimize(self, program):
+        return optimize(self.resolve(program), self.type_context)
+
+    def resolve(self, program):
+        parser = Parser(self.type_context)
+        return resolve(parser.parse(program, create_lexer()))
+
+    def int_literal(self, int_value):
+        return Literal(PrimitiveValue(self.type_context.int_type, int_value))
+
+    def str_literal(self, str_value):
+        return Literal(PrimitiveValue(self.type_context.str_type, str_value))
+
+    def bool_literal(self, bool_value):
+        return Literal(
+            PrimitiveValue(self.type_context.bool_type, bool_value))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,23 +1,48 @@
 from ply import yacc
-from appy_ast import (BinaryOperator, Literal, Value, Assignment, Variable,
-                      Seq, ExpressionStatement, PrintStatement, IfStatement,
+from appy_ast import (BinaryOperator, Literal, Assignment, Variable,
+                      Block, ExpressionStatement, PrintStatement, IfStatement,
                       WhileStatement, DefStatement, FunctionCall,
                       ClassStatement, PassStatement, AttributeAccess,
-                      ListLiteral, GetItem)
+                      ListLiteral, GetItem, Slice, ReturnStatement,
+                      ForStatement, COLUMN_BITS)
 import lexer
 
 
 class Parser(object):
 
-    def __init__(self, type_context):
+    def __init__(self, type_context, **yacc_options):
         """
         @type type_context: TypeContext
+        @param yacc_options: Extra keyword arguments passed through to
+        yacc.yacc, e.g. to control where the parse tables are cached.
         """
-        self.yacc_parser = yacc.yacc(module=self)
+        self.yacc_parser = yacc.yacc(module=self, **yacc_options)
         self.type_context = type_context
 
-    def parse(self, program, lexer):
-        return self.yacc_parser.parse(program, lexer)
+    def parse(self, program, lexer, **parse_options):
+        """
+        @param program: The text of the program, or an iterable of chunks
+        of it such as a file object.
+        @type lexer: PlyLexerAdapter
+        @param parse_options: Extra keyword arguments passed through to
+        the yacc parser's parse method, e.g. tracking=True.
+        """
+        return self.yacc_parser.parse(program, lexer, **parse_options)
+
+    def _token_position(self, p, n):
+        """
+        Gets the packed source position (see appy_ast.pack_position) of
+        the n-th symbol of the production, which must be a token. Every
+        node has the position of its first token, which for nodes that
+        start with another node is that node's position.
+
+        Tokens only have their line number and offset, so the column is
+        found from the start of the token's line, as recorded by the
+        lexer.
+        """
+        token = p.slice[n]
+        return (token.lineno << COLUMN_BITS |
+                token.lexpos - p.lexer.line_starts[token.lineno - 1])
 
     tokens = lexer.tokens
 
@@ -34,45 +59,79 @@ class Parser(object):
         ('left', 'DOT', 'LPAREN'),
     )
 
-    def p_seq(self, p):
-        """statement : statement statement"""
-        p[0] = Seq(p[1], p[2])
+    # A block is a sequence of statements at the same indentation level.
+    # Blocks of a single statement are represented by that statement.
+    def p_block(self, p):
+        """block : statement_list"""
+        if len(p[1]) == 1:
+            p[0] = p[1][0]
+        else:
+            p[0] = Block(tuple(p[1]), p[1][0].position)
+
+    # This is left-recursive so that long programs build a flat list
+    # rather than a deeply nested tree.
+    def p_statement_list(self, p):
+        """statement_list : statement_list statement
+                          | statement
+        """
+        if len(p) == 2:
+            p[0] = [p[1]]
+        else:
+            p[1].append(p[2])
+            p[0] = p[1]
 
     def p_expression_statement(self, p):
         """statement : expression NEWLINE"""
-        p[0] = ExpressionStatement(p[1])
+        p[0] = ExpressionStatement(p[1], p[1].position)
 
     def p_assignment_statement(self, p):
         """statement : expression ASSIGN expression NEWLINE"""
-        p[0] = Assignment(p[1], p[3])
+        p[0] = Assignment(p[1], p[3], p[1].position)
 
     def p_pass_statement(self, p):
         """statement : PASS NEWLINE"""
-        p[0] = PassStatement()
+        p[0] = PassStatement(self._token_position(p, 1))
 
     def p_print_statement(self, p):
         """statement : PRINT expression NEWLINE"""
-        p[0] = PrintStatement(p[2])
+        p[0] = PrintStatement(p[2], self._token_position(p, 1))
+
+    def p_return_statement(self, p):
+        """statement : RETURN expression NEWLINE
+                     | RETURN NEWLINE
+        """
+        position = self._token_position(p, 1)
+        if len(p) == 4:
+            p[0] = ReturnStatement(p[2], position)
+        else:
+            p[0] = ReturnStatement(
+                Literal(self.type_context.none_value, position), position)
 
     def p_if_statement(self, p):
-        """statement : IF expression COLON NEWLINE INDENT statement DEDENT"""
-        p[0] = IfStatement(p[2], p[6])
+        """statement : IF expression COLON NEWLINE INDENT block DEDENT"""
+        p[0] = IfStatement(p[2], p[6], self._token_position(p, 1))
 
     def p_while_statement(self, p):
         """statement : WHILE expression COLON NEWLINE \
-                       INDENT statement DEDENT"""
-        p[0] = WhileStatement(p[2], p[6])
+                       INDENT block DEDENT"""
+        p[0] = WhileStatement(p[2], p[6], self._token_position(p, 1))
+
+    def p_for_statement(self, p):
+        """statement : FOR expression IN expression COLON NEWLINE \
+                       INDENT block DEDENT"""
+        p[0] = ForStatement(p[2], p[4], p[8], self._token_position(p, 1))
 
     def p_def_statement(self, p):
         """statement : DEF ID LPAREN paramlist RPAREN COLON NEWLINE \
-                       INDENT statement DEDENT """
-        p[0] = DefStatement(p[2], p[4], p[9])
+                       INDENT block DEDENT """
+        p[0] = DefStatement(p[2], p[4], p[9],
+                            position=self._token_position(p, 1))
 
     # TODO: Multiple superclasses
     def p_class_statement(self, p):
         """statement : CLASS ID LPAREN expression RPAREN COLON NEWLINE \
-                       INDENT statement DEDENT """
-        p[0] = ClassStatement(p[2], p[4], p[9])
+                       INDENT block DEDENT """
+        p[0] = ClassStatement(p[2], p[4], p[9], self._token_position(p, 1))
 
     # Note the technical distinction between "parameter" and "argument"
     # here: parameters are identifiers declared as part of a function,
@@ -104,7 +163,7 @@ class Parser(object):
                       | expression AND expression
                       | expression OR expression
         """
-        p[0] = BinaryOperator(p[2], p[1], p[3])
+        p[0] = BinaryOperator(p[2], p[1], p[3], p[1].position)
 
     def p_expression_parens(self, p):
         """expression : LPAREN expression RPAREN"""
@@ -112,41 +171,60 @@ class Parser(object):
 
     def p_attribute_access(self, p):
         """expression : expression DOT ID"""
-        p[0] = AttributeAccess(p[1], p[3])
+        p[0] = AttributeAccess(p[1], p[3], p[1].position)
 
     def p_getitem(self, p):
         """expression : expression LBRACKET expression RBRACKET"""
-        p[0] = GetItem(p[1], p[3])
+        p[0] = GetItem(p[1], p[3], p[1].position)
+
+    def p_slice(self, p):
+        """expression : expression LBRACKET slice_bound COLON slice_bound \
+                        RBRACKET"""
+        position = self._token_position(p, 2)
+        start, stop = [
+            Literal(self.type_context.none_value, position)
+            if bound is None else bound for bound in (p[3], p[5])]
+        p[0] = GetItem(p[1], Slice(start, stop, position), p[1].position)
+
+    def p_slice_bound(self, p):
+        """slice_bound : expression
+                       |
+        """
+        p[0] = p[1] if len(p) == 2 else None
 
     def p_int_literal(self, p):
         """expression : NUMBER"""
-        p[0] = Literal(Value(self.type_context.int_type, p[1], {}))
+        p[0] = Literal(self.type_context.int_value(p[1]),
+                       self._token_position(p, 1))
 
     def p_bool_literal(self, p):
         """expression : TRUE
                       | FALSE
         """
-        p[0] = Literal(self.type_context.bool_value(p[1]))
+        p[0] = Literal(self.type_context.bool_value(p[1]),
+                       self._token_position(p, 1))
 
     def p_none_literal(self, p):
         """expression : NONE"""
-        p[0] = Literal(self.type_context.none_value)
+        p[0] = Literal(self.type_context.none_value,
+                       self._token_position(p, 1))
 
     def p_string_literal(self, p):
         """expression : STRING"""
-        p[0] = Literal(Value(self.type_context.str_type, p[1], {}))
+        p[0] = Literal(self.type_context.interned_str_value(p[1]),
+                       self._token_position(p, 1))
 
     def p_list_literal(self, p):
         """expression : LBRACKET exprlist RBRACKET"""
-        p[0] = ListLiteral(p[2])
+        p[0] = ListLiteral(p[2], self._token_position(p, 1))
 
     def p_variable(self, p):
         """expression : ID"""
-        p[0] = Variable(p[1])
+        p[0] = Variable(p[1], self._token_position(p, 1))
 
     def p_function_call(self, p):
         """expression : expression LPAREN exprlist RPAREN"""
-        p[0] = FunctionCall(p[1], p[3])
+        p[0] = FunctionCall(p[1], p[3], p[1].position)
 
     # List of comma-separated expressions
     def p_exprlist(self, p):
@@ -1,10 +1,12 @@
 import unittest
 
-from appy_ast import (BinaryOperator, Literal, Value, ExpressionStatement,
-                      PrintStatement, IfStatement, Assignment, Variable,
-                      WhileStatement, DefStatement, FunctionCall, Seq,
-                      ClassStatement, PassStatement, AttributeAccess,
-                      ListLiteral, GetItem)
+from appy_ast import (BinaryOperator, Literal, PrimitiveValue,
+                      ExpressionStatement, PrintStatement, IfStatement,
+                      Assignment, Variable, WhileStatement, DefStatement,
+                      FunctionCall, Block, ClassStatement, PassStatement,
+                      AttributeAccess, ListLiteral, GetItem, Slice,
+                      ReturnStatement, ForStatement, position_lineno,
+                      position_column)
 from builtin_types import TypeContext
 from lexer import create_lexer
 from parser import Parser
@@ -99,6 +101,16 @@ while False:
                 self.bool_literal(False),
                 PrintStatement(self.string_literal('Banana'))))
 
+    def test_for(self):
+        self.assert_ast(
+            '''
+for x in [1, 2]:
+    print x''',
+            ForStatement(
+                Variable('x'),
+                ListLiteral([self.int_literal(1), self.int_literal(2)]),
+                PrintStatement(Variable('x'))))
+
     def test_simple_function(self):
         self.assert_ast(
             '''
@@ -120,10 +132,23 @@ pass
 def foo():
     pass
     print 5''',
-            Seq(PassStatement(),
-                DefStatement('foo', [],
-                             Seq(PassStatement(),
-                                 PrintStatement(self.int_literal(5))))))
+            Block((PassStatement(),
+                   DefStatement('foo', [],
+                                Block((PassStatement(),
+                                       PrintStatement(self.int_literal(5))))))))
+
+    def test_return(self):
+        self.assert_ast(
+            '''
+def foo(x):
+    if x:
+        return
+    return x + 1''',
+            DefStatement('foo', ['x'], Block((
+                IfStatement(Variable('x'),
+                            ReturnStatement(self.none_literal())),
+                ReturnStatement(BinaryOperator('+', Variable('x'),
+                                               self.int_literal(1)))))))
 
     def test_function_call(self):
         self.assert_ast(
@@ -140,10 +165,11 @@ def foo():
 class Blah(object):
     x = 5
 foo = Blah()''',
-            Seq(ClassStatement('Blah', Variable('object'),
-                               Assignment(Variable('x'), self.int_literal(5))),
-                Assignment(Variable('foo'), FunctionCall(Variable('Blah'), []))
-                )
+            Block((ClassStatement('Blah', Variable('object'),
+                                  Assignment(Variable('x'),
+                                             self.int_literal(5))),
+                   Assignment(Variable('foo'),
+                              FunctionCall(Variable('Blah'), []))))
         )
 
     def test_attribute_access(self):
@@ -152,20 +178,19 @@ foo = Blah()''',
 print a.b()
 print 'hello' + 'world'.capitalize()
 print ('foo' + 'bar').capitalize()''',
-            Seq(
+            Block((
                 PrintStatement(
                     FunctionCall(AttributeAccess(Variable('a'), 'b'), [])),
-                Seq(
-                    PrintStatement(BinaryOperator(
-                        '+',
-                        self.string_literal('hello'),
-                        FunctionCall(AttributeAccess(
-                            self.string_literal('world'), 'capitalize'), []))),
-                    PrintStatement(FunctionCall(AttributeAccess(
-                        BinaryOperator(
-                            '+', self.string_literal('foo'),
-                            self.string_literal('bar')), 'capitalize'),
-                        [])))))
+                PrintStatement(BinaryOperator(
+                    '+',
+                    self.string_literal('hello'),
+                    FunctionCall(AttributeAccess(
+                        self.string_literal('world'), 'capitalize'), []))),
+                PrintStatement(FunctionCall(AttributeAccess(
+                    BinaryOperator(
+                        '+', self.string_literal('foo'),
+                        self.string_literal('bar')), 'capitalize'),
+                    [])))))
 
     def test_list_literal(self):
         self.assert_ast(
@@ -184,6 +209,20 @@ print ('foo' + 'bar').capitalize()''',
                                        FunctionCall(Variable('foo'), []),
                                        self.int_literal(3)))))
 
+    def test_slice(self):
+        self.assert_ast_expression(
+            'xs[1:n]',
+            GetItem(Variable('xs'), Slice(self.int_literal(1),
+                                          Variable('n'))))
+        self.assert_ast_expression(
+            'xs[:2]',
+            GetItem(Variable('xs'), Slice(self.none_literal(),
+                                          self.int_literal(2))))
+        self.assert_ast_expression(
+            'xs[:]',
+            GetItem(Variable('xs'), Slice(self.none_literal(),
+                                          self.none_literal())))
+
     def test_list_assignment(self):
         self.assert_ast(
             'arr[3] = 5',
@@ -198,11 +237,59 @@ print ('foo' + 'bar').capitalize()''',
 x = None
 if x is None:
     pass''',
-            Seq(
+            Block((
                 Assignment(Variable('x'), self.none_literal()),
                 IfStatement(
                     BinaryOperator('is', Variable('x'), self.none_literal()),
-                    PassStatement())))
+                    PassStatement()))))
+
+    def test_block_is_flat(self):
+        ast = self.get_ast('''
+x = 1
+y = 2
+print x + y''')
+        self.assertEqual(
+            Block((
+                Assignment(Variable('x'), self.int_literal(1)),
+                Assignment(Variable('y'), self.int_literal(2)),
+                PrintStatement(BinaryOperator(
+                    '+', Variable('x'), Variable('y'))))),
+            ast)
+        self.assertEqual('x = 1\ny = 2\nprint (x + y)', ast.pretty_print())
+
+    def test_node_positions(self):
+        ast = self.get_ast('''
+x = 1
+while x < 10:
+    print foo(x,
+              [x + 2])''')
+        loop = ast.statements[1]
+        print_statement = loop.statement
+        call = print_statement.expr
+        list_literal = call.args[1]
+        self.assertEqual((2, 0), self.line_and_column(ast))
+        self.assertEqual((2, 4), self.line_and_column(ast.statements[0].right))
+        self.assertEqual((3, 0), self.line_and_column(loop))
+        self.assertEqual((3, 6), self.line_and_column(loop.condition))
+        self.assertEqual((4, 4), self.line_and_column(print_statement))
+        self.assertEqual((4, 10), self.line_and_column(call))
+        self.assertEqual((5, 14), self.line_and_column(list_literal))
+        self.assertEqual((5, 15),
+                         self.line_and_column(list_literal.expressions[0]))
+
+    def test_node_positions_from_chunks(self):
+        ast = self.get_ast(['x = 1\nif x', ':\n    print', ' x\n'])
+        print_statement = ast.statements[1].statement
+        self.assertEqual((3, 4), self.line_and_column(print_statement))
+        self.assertEqual((3, 10), self.line_and_column(print_statement.expr))
+
+    def test_positions_ignored_in_comparisons(self):
+        self.assertEqual(Variable('x', 5), Variable('x'))
+        self.assertNotEqual(Variable('x', 5), Variable('y', 5))
+        self.assertEqual(hash(Variable('x', 5)), hash(Variable('x')))
+
+    def line_and_column(self, node):
+        return position_lineno(node.position), position_column(node.position)
 
     def assert_ast(self, program, expected_ast):
         actual_ast = self.get_ast(program)
@@ -219,13 +306,15 @@ if x is None:
         return parser.parse(program, lexer)
 
     def int_literal(self, int_value):
-        return Literal(Value(self.type_context.int_type, int_value, {}))
+        return Literal(
+            PrimitiveValue(self.type_context.int_type, int_value))
 
     def none_literal(self):
         return Literal(self.type_context.none_value)
 
     def string_literal(self, string_value):
-        return Literal(Value(self.type_context.str_type, string_value, {}))
+        return Literal(
+            PrimitiveValue(self.type_context.str_type, string_value))
 
     def bool_literal(self, bool_value):
         return Literal(self.type_context.bool_value(bool_value))
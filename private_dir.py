@@ -0,0 +1,27 @@
+import os
+import stat
+
+
+def ensure_private_dir(path):
+    """
+    Creates the directory, and any missing parents, with access for the
+    current user only if it does not exist.
+    @type path: str
+    @return: Whether the directory can be trusted to hold files that are
+    loaded as code: it is a real directory, owned by the current user,
+    that no other user can write to. Anything found in a directory that
+    fails this check could have been planted by another user.
+    @rtype: bool
+    """
+    try:
+        os.makedirs(path, 0o700)
+    except OSError:
+        if not os.path.isdir(path):
+            return False
+    # lstat, so that a symlink to someone else's directory is refused.
+    status = os.lstat(path)
+    if not stat.S_ISDIR(status.st_mode):
+        return False
+    if hasattr(os, 'getuid') and status.st_uid != os.getuid():
+        return False
+    return not status.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
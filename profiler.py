@@ -0,0 +1,185 @@
+from collections import namedtuple
+from timeit import default_timer
+from appy_ast import position_lineno
+
+
+MODULE_NAME = '<module>'
+
+LineStats = namedtuple('LineStats', ['count', 'seconds'])
+
+FunctionStats = namedtuple('FunctionStats',
+                           ['calls', 'inclusive', 'exclusive'])
+
+
+class Profiler(object):
+    """Records where an APPy program spends its time.
+
+    The execution engines report every statement that starts running and
+    every call of a user-defined function, but only if they were given a
+    profiler, so that programs that aren't being profiled pay nothing
+    for it.
+
+    Each line gets the number of statements that started on it and the
+    time from each of those statements starting until the next statement
+    in the same function starts, which includes the time spent in any
+    calls the statement makes. Each function gets its number of calls,
+    its inclusive time (counting recursive calls once) and its exclusive
+    time, which leaves out the functions it calls. The exclusive time is
+    also recorded for each distinct call stack, for flame graphs.
+    """
+
+    def __init__(self, clock=default_timer):
+        """
+        @param clock: A function returning the current time in seconds.
+        """
+        self.clock = clock
+        # Maps each line number to [count, seconds].
+        self.lines = {}
+        # Maps each function name to [calls, inclusive, exclusive].
+        self.functions = {}
+        # Maps each call stack, as the names of its functions joined by
+        # ';', outermost first, to the exclusive time spent in it.
+        self.stacks = {}
+        # The functions that are running, outermost first. See _Frame.
+        self.frames = []
+        # How many calls of each function are running.
+        self.active_calls = {}
+
+    def line(self, lineno):
+        """Called when a statement on the given line starts running."""
+        now = self.clock()
+        if not self.frames:
+            self._push_frame(MODULE_NAME, now)
+        frame = self.frames[-1]
+        self._finish_line(frame, now)
+        frame.lineno = lineno
+        frame.line_start = now
+        stats = self.lines.get(lineno)
+        if stats is None:
+            stats = self.lines[lineno] = [0, 0.0]
+        stats[0] += 1
+
+    def enter_function(self, name):
+        """Called when a user-defined function starts running."""
+        now = self.clock()
+        if not self.frames:
+            self._push_frame(MODULE_NAME, now)
+        self._push_frame(name, now)
+
+    def exit_function(self):
+        """Called when the innermost running function returns."""
+        self._pop_frame(self.clock())
+
+    def stop(self):
+        """Ends every running function, including the module, e.g. once a
+        program finishes or fails. Later events start a new module.
+        """
+        now = self.clock()
+        while self.frames:
+            self._pop_frame(now)
+
+    def line_stats(self):
+        """
+        @return: A LineStats for each line that ran, by line number.
+        @rtype: dict
+        """
+        return dict((lineno, LineStats(*stats))
+                    for lineno, stats in self.lines.items())
+
+    def function_stats(self):
+        """
+        @return: A FunctionStats for each function that returned, by
+        name, including the module.
+        @rtype: dict
+        """
+        return dict((name, FunctionStats(*stats))
+                    for name, stats in self.functions.items())
+
+    def report(self):
+        """
+        @return: A human-readable table of the function and line stats,
+        with the slowest functions first.
+        @rtype: str
+        """
+        lines = ['%-30s %8s %12s %12s' % ('function', 'calls', 'inclusive',
+                                          'exclusive')]
+        functions = sorted(self.function_stats().items(),
+                           key=lambda item: -item[1].inclusive)
+        for name, stats in functions:
+            lines.append('%-30s %8d %12.6f %12.6f' % (
+                name, stats.calls, stats.inclusive, stats.exclusive))
+        lines.append('')
+        lines.append('%-30s %8s %12s' % ('line', 'count', 'seconds'))
+        for lineno, stats in sorted(self.line_stats().items()):
+            lines.append('%-30d %8d %12.6f' % (lineno, stats.count,
+                                               stats.seconds))
+        return '\n'.join(lines) + '\n'
+
+    def collapsed_stacks(self):
+        """
+        @return: Each call stack and its exclusive time in microseconds,
+        one per line, in the collapsed format read by flamegraph.pl.
+        @rtype: str
+        """
+        return ''.join('%s %d\n' % (stack, round(seconds * 1000000))
+                       for stack, seconds in sorted(self.stacks.items()))
+
+    def _push_frame(self, name, now):
+        if self.frames:
+            stack = self.frames[-1].stack + ';' + name
+        else:
+            stack = name
+        self.frames.append(_Frame(name, stack, now))
+        self.active_calls[name] = self.active_calls.get(name, 0) + 1
+
+    def _pop_frame(self, now):
+        frame = self.frames.pop()
+        self._finish_line(frame, now)
+        inclusive = now - frame.start
+        exclusive = inclusive - frame.child_time
+        active_calls = self.active_calls[frame.name] - 1
+        self.active_calls[frame.name] = active_calls
+
+        stats = self.functions.get(frame.name)
+        if stats is None:
+            stats = self.functions[frame.name] = [0, 0.0, 0.0]
+        stats[0] += 1
+        if not active_calls:
+            # Recursive calls are already part of the outermost one.
+            stats[1] += inclusive
+        stats[2] += exclusive
+        self.stacks[frame.stack] = (self.stacks.get(frame.stack, 0.0) +
+                                    exclusive)
+        if self.frames:
+            self.frames[-1].child_time += inclusive
+
+    def _finish_line(self, frame, now):
+        if frame.lineno is not None:
+            self.lines[frame.lineno][1] += now - frame.line_start
+
+
+class _Frame(object):
+    """A running function, and the line that it is running."""
+    __slots__ = ['name', 'stack', 'start', 'child_time', 'lineno',
+                 'line_start']
+
+    def __init__(self, name, stack, start):
+        self.name = name
+        self.stack = stack
+        self.start = start
+        # The inclusive time of the calls that have returned to it.
+        self.child_time = 0.0
+        self.lineno = None
+        self.line_start = None
+
+
+def function_label(data):
+    """
+    @type data: FunctionData
+    @return: The name of the function in profiles, which includes the
+    line it was defined on to tell apart functions with the same name.
+    @rtype: str
+    """
+    if data.position is None:
+        return data.name
+    return '%s:%d' % (data.name, position_lineno(data.position))
@@ -0,0 +1,72 @@
+import unittest
+
+from profiler import Profiler, LineStats, FunctionStats
+
+
+class ProfilerTest(unittest.TestCase):
+    def test_lines_and_functions(self):
+        profiler = self.create_profiler([0, 1, 2, 4, 5, 10])
+        profiler.line(1)
+        profiler.enter_function('f')
+        profiler.line(5)
+        profiler.exit_function()
+        profiler.line(2)
+        profiler.stop()
+
+        self.assertEqual({1: LineStats(1, 5.0), 5: LineStats(1, 2.0),
+                          2: LineStats(1, 5.0)},
+                         profiler.line_stats())
+        self.assertEqual({'<module>': FunctionStats(1, 10.0, 7.0),
+                          'f': FunctionStats(1, 3.0, 3.0)},
+                         profiler.function_stats())
+        self.assertEqual('<module> 7000000\n<module>;f 3000000\n',
+                         profiler.collapsed_stacks())
+
+    def test_recursion_counted_once(self):
+        profiler = self.create_profiler([0, 1, 2, 3, 3])
+        profiler.enter_function('f')
+        profiler.enter_function('f')
+        profiler.exit_function()
+        profiler.exit_function()
+        profiler.stop()
+
+        self.assertEqual(FunctionStats(2, 3.0, 3.0),
+                         profiler.function_stats()['f'])
+        self.assertEqual('<module> 0\n<module>;f 2000000\n'
+                         '<module>;f;f 1000000\n',
+                         profiler.collapsed_stacks())
+
+    def test_stop_ends_running_functions(self):
+        profiler = self.create_profiler([0, 1, 3, 4])
+        profiler.enter_function('f')
+        profiler.line(2)
+        profiler.stop()
+        profiler.line(2)
+
+        self.assertEqual(FunctionStats(1, 3.0, 3.0),
+                         profiler.function_stats()['f'])
+        self.assertEqual(LineStats(2, 2.0), profiler.line_stats()[2])
+
+    def test_report(self):
+        profiler = self.create_profiler([0, 1, 2, 4])
+        profiler.line(1)
+        profiler.enter_function('f')
+        profiler.exit_function()
+        profiler.stop()
+
+        report = profiler.report().splitlines()
+        self.assertEqual(['function', 'calls', 'inclusive', 'exclusive'],
+                         report[0].split())
+        self.assertEqual(['<module>', '1', '4.000000', '3.000000'],
+                         report[1].split())
+        self.assertEqual(['f', '1', '1.000000', '1.000000'],
+                         report[2].split())
+        self.assertEqual(['line', 'count', 'seconds'], report[4].split())
+        self.assertEqual(['1', '1', '4.000000'], report[5].split())
+
+    def create_profiler(self, times):
+        return Profiler(clock=iter(times).next)
+
+
+if __name__ == '__main__':
+    unittest.main()
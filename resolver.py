@@ -0,0 +1,228 @@
+from appy_ast import (Block, Assignment, ExpressionStatement, PrintStatement,
+                      ReturnStatement, IfStatement, WhileStatement,
+                      ForStatement, DefStatement, ClassStatement,
+                      BinaryOperator, ListLiteral, Variable, LocalVariable,
+                      FunctionCall, AttributeAccess, GetItem, Slice)
+
+
+def resolve(ast):
+    """
+    Returns a copy of the AST where every variable that refers to a
+    function local is replaced by a LocalVariable with its slot address,
+    and every DefStatement lists its local names and whether it captures
+    its scope.
+    """
+    return Resolver().resolve(ast)
+
+
+class Resolver(object):
+    """Static resolution pass over the AST.
+
+    As in Python, a variable is local to a function if it is a parameter
+    or is assigned anywhere in the function's body. Variables in a
+    function body that refer to a local of the function or of an
+    enclosing function are resolved to a (depth, index) address.
+    Anything else (globals, class attributes, builtins) is left as a
+    Variable and looked up by name at runtime.
+
+    Class bodies are dict-based scopes, so resolution doesn't look past
+    them; names used within a class body are always looked up by name.
+
+    A return statement outside of a function body is a SyntaxError.
+    """
+
+    def __init__(self):
+        # The enclosing scopes, innermost last. Each one is the tuple of
+        # local names for a function scope, or None for a class scope.
+        self.scopes = []
+
+    def resolve(self, node):
+        try:
+            method = getattr(self, '_resolve_' + node.__class__.__name__)
+        except AttributeError:
+            raise NotImplementedError(
+                'Missing resolver for node ' + str(node))
+        return method(node)
+
+    def _resolve_assignable(self, assignable):
+        if isinstance(assignable, Variable):
+            if self.scopes and self.scopes[-1] is not None:
+                return LocalVariable(assignable.name, 0,
+                                     self.scopes[-1].index(assignable.name),
+                                     assignable.position)
+            return assignable
+        return self.resolve(assignable)
+
+    def _resolve_Block(self, statement):
+        return Block(tuple(self.resolve(sub_statement)
+                           for sub_statement in statement.statements),
+                     statement.position)
+
+    def _resolve_Assignment(self, statement):
+        return Assignment(self._resolve_assignable(statement.left),
+                          self.resolve(statement.right), statement.position)
+
+    def _resolve_ExpressionStatement(self, statement):
+        return ExpressionStatement(self.resolve(statement.expr),
+                                   statement.position)
+
+    def _resolve_PassStatement(self, statement):
+        return statement
+
+    def _resolve_PrintStatement(self, statement):
+        return PrintStatement(self.resolve(statement.expr),
+                              statement.position)
+
+    def _resolve_ReturnStatement(self, statement):
+        if not self.scopes or self.scopes[-1] is None:
+            raise SyntaxError("'return' outside function")
+        return ReturnStatement(self.resolve(statement.expr),
+                               statement.position)
+
+    def _resolve_IfStatement(self, statement):
+        return IfStatement(self.resolve(statement.condition),
+                           self.resolve(statement.statement),
+                           statement.position)
+
+    def _resolve_WhileStatement(self, statement):
+        return WhileStatement(self.resolve(statement.condition),
+                              self.resolve(statement.statement),
+                              statement.position)
+
+    def _resolve_ForStatement(self, statement):
+        return ForStatement(self._resolve_assignable(statement.target),
+                            self.resolve(statement.iterable),
+                            self.resolve(statement.statement),
+                            statement.position)
+
+    def _resolve_DefStatement(self, statement):
+        local_names = list(statement.param_names)
+        for name in assigned_names(statement.body):
+            if name not in local_names:
+                local_names.append(name)
+        local_names = tuple(local_names)
+
+        self.scopes.append(local_names)
+        try:
+            body = self.resolve(statement.body)
+        finally:
+            self.scopes.pop()
+        return DefStatement(statement.name, statement.param_names, body,
+                            local_names, defines_scope(statement.body),
+                            statement.position)
+
+    def _resolve_ClassStatement(self, statement):
+        superclass = self.resolve(statement.superclass)
+        self.scopes.append(None)
+        try:
+            body = self.resolve(statement.body)
+        finally:
+            self.scopes.pop()
+        return ClassStatement(statement.name, superclass, body,
+                              statement.position)
+
+    def _resolve_BinaryOperator(self, expression):
+        return BinaryOperator(expression.operator,
+                              self.resolve(expression.left),
+                              self.resolve(expression.right),
+                              expression.position)
+
+    def _resolve_Literal(self, expression):
+        return expression
+
+    def _resolve_ListLiteral(self, expression):
+        return ListLiteral([self.resolve(expr)
+                            for expr in expression.expressions],
+                           expression.position)
+
+    def _resolve_Variable(self, expression):
+        depth = 0
+        for local_names in reversed(self.scopes):
+            if local_names is None:
+                break
+            if expression.name in local_names:
+                return LocalVariable(expression.name, depth,
+                                     local_names.index(expression.name),
+                                     expression.position)
+            depth += 1
+        return expression
+
+    def _resolve_FunctionCall(self, expression):
+        return FunctionCall(self.resolve(expression.function_expr),
+                            [self.resolve(arg) for arg in expression.args],
+                            expression.position)
+
+    def _resolve_AttributeAccess(self, expression):
+        return AttributeAccess(self.resolve(expression.expr),
+                               expression.attr_name, expression.position)
+
+    def _resolve_GetItem(self, expression):
+        return GetItem(self.resolve(expression.expr),
+                       self.resolve(expression.key), expression.position)
+
+    def _resolve_Slice(self, expression):
+        return Slice(self.resolve(expression.start),
+                     self.resolve(expression.stop), expression.position)
+
+
+def defines_scope(statement):
+    """
+    Returns whether the statement defines any functions or classes in
+    the scope it runs in.
+    """
+    pending = [statement]
+    while pending:
+        statement = pending.pop()
+        if isinstance(statement, Block):
+            pending.extend(statement.statements)
+        elif isinstance(statement,
+                        (IfStatement, WhileStatement, ForStatement)):
+            pending.append(statement.statement)
+        elif isinstance(statement, (DefStatement, ClassStatement)):
+            return True
+    return False
+
+
+def may_return(statement):
+    """
+    Returns whether running the statement can end the function call it
+    runs in. Nested function bodies return from their own calls, so
+    they are not included.
+    """
+    pending = [statement]
+    while pending:
+        statement = pending.pop()
+        if isinstance(statement, Block):
+            pending.extend(statement.statements)
+        elif isinstance(statement,
+                        (IfStatement, WhileStatement, ForStatement)):
+            pending.append(statement.statement)
+        elif isinstance(statement, ReturnStatement):
+            return True
+    return False
+
+
+def assigned_names(statement):
+    """
+    Returns the names bound by the statement in the scope it runs in, in
+    order of first appearance. Nested function and class bodies are
+    separate scopes, so they are not included.
+    """
+    names = []
+    pending = [statement]
+    while pending:
+        statement = pending.pop()
+        if isinstance(statement, Block):
+            pending.extend(reversed(statement.statements))
+        elif isinstance(statement, (IfStatement, WhileStatement)):
+            pending.append(statement.statement)
+        elif isinstance(statement, ForStatement):
+            if isinstance(statement.target, Variable):
+                names.append(statement.target.name)
+            pending.append(statement.statement)
+        elif isinstance(statement, Assignment):
+            if isinstance(statement.left, Variable):
+                names.append(statement.left.name)
+        elif isinstance(statement, (DefStatement, ClassStatement)):
+            names.append(statement.name)
+    return names
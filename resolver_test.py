@@ -0,0 +1,118 @@
+import unittest
+
+from appy_ast import (Assignment, Variable, LocalVariable, DefStatement,
+                      PrintStatement, Block, ClassStatement, BinaryOperator,
+                      ReturnStatement, ForStatement)
+from builtin_types import TypeContext
+from lexer import create_lexer
+from parser import Parser
+from resolver import resolve
+
+
+class ResolverTest(unittest.TestCase):
+    def setUp(self):
+        self.type_context = TypeContext()
+
+    def test_globals_unchanged(self):
+        self.assert_resolved(
+            '''
+x = y
+print x''',
+            Block((Assignment(Variable('x'), Variable('y')),
+                   PrintStatement(Variable('x')))))
+
+    def test_params_and_locals(self):
+        self.assert_resolved(
+            '''
+def foo(a, b):
+    c = a
+    print b + c + d''',
+            DefStatement('foo', ['a', 'b'], Block((
+                Assignment(LocalVariable('c', 0, 2), LocalVariable('a', 0, 0)),
+                PrintStatement(BinaryOperator(
+                    '+',
+                    BinaryOperator('+', LocalVariable('b', 0, 1),
+                                   LocalVariable('c', 0, 2)),
+                    Variable('d'))))),
+                ('a', 'b', 'c'), False))
+
+    def test_enclosing_function_local(self):
+        self.assert_resolved(
+            '''
+def outer(x):
+    def inner():
+        print x''',
+            DefStatement('outer', ['x'], DefStatement(
+                'inner', [], PrintStatement(LocalVariable('x', 1, 0)), (),
+                False),
+                ('x', 'inner'), True))
+
+    def test_class_scope_not_resolved(self):
+        self.assert_resolved(
+            '''
+def outer(x):
+    class Foo(object):
+        y = x
+        def bar(self):
+            print x''',
+            DefStatement('outer', ['x'], ClassStatement(
+                'Foo', Variable('object'), Block((
+                    Assignment(Variable('y'), Variable('x')),
+                    DefStatement('bar', ['self'],
+                                 PrintStatement(Variable('x')),
+                                 ('self',), False)))),
+                ('x', 'Foo'), True))
+
+    def test_return(self):
+        self.assert_resolved(
+            '''
+def foo(a):
+    return a''',
+            DefStatement('foo', ['a'],
+                         ReturnStatement(LocalVariable('a', 0, 0)),
+                         ('a',), False))
+
+    def test_for_target_is_local(self):
+        self.assert_resolved(
+            '''
+def foo(xs):
+    for x in xs:
+        print x''',
+            DefStatement('foo', ['xs'], ForStatement(
+                LocalVariable('x', 0, 1), LocalVariable('xs', 0, 0),
+                PrintStatement(LocalVariable('x', 0, 1))),
+                ('xs', 'x'), False))
+
+    def test_return_outside_function(self):
+        for program in ['return 1', '''
+def foo():
+    class Foo(object):
+        return 1''']:
+            parser = Parser(self.type_context)
+            self.assertRaises(SyntaxError, resolve,
+                              parser.parse(program, create_lexer()))
+
+    def test_positions_preserved(self):
+        program = '''
+def foo(a):
+    b = a
+    print b'''
+        parser = Parser(self.type_context)
+        ast = parser.parse(program, create_lexer())
+        resolved = resolve(ast)
+        self.assertEqual(ast.position, resolved.position)
+        self.assertEqual(ast.body.statements[0].left.position,
+                         resolved.body.statements[0].left.position)
+        self.assertEqual(ast.body.statements[1].expr.position,
+                         resolved.body.statements[1].expr.position)
+        self.assertIsNotNone(resolved.body.statements[1].expr.position)
+        self.assertIsInstance(resolved.body.statements[1].expr, LocalVariable)
+
+    def assert_resolved(self, program, expected_ast):
+        parser = Parser(self.type_context)
+        actual_ast = resolve(parser.parse(program, create_lexer()))
+        self.assertEqual(expected_ast, actual_ast)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,215 @@
+import mmap
+import re
+from ply.lex import LexToken
+from file_lexer import is_mappable
+from line_lexer import LineLexer
+
+
+# Matches a single token, along with any whitespace before it. The group
+# that matched determines how it is handled. A NEWLINE includes the
+# indentation of the following line.
+TOKEN_PATTERN = re.compile(r'''
+  [ \t]*
+  (?:
+    (?P<NEWLINE>\n[ \t]*)
+  | (?P<CONTINUATION>\\\n)
+  | (?P<STRING>[uUbB]?[Rr]?
+        (?:'(?:[^'\\\n]|\\(?:.|\n))*'
+         | "(?:[^"\\\n]|\\(?:.|\n))*"))
+  | (?P<ID>[a-zA-Z_][a-zA-Z_0-9]*)
+  | (?P<NUMBER>\d+)
+  | (?P<OPERATOR>==|!=|<=|>=|[-+*/<>()\[\].=:,])
+  | (?P<ERROR>.)
+  )
+''', re.VERBOSE)
+
+INDENTATION_PATTERN = re.compile(r'[ \t]*')
+
+OPERATORS = {
+    '+': 'PLUS',
+    '-': 'MINUS',
+    '*': 'TIMES',
+    '/': 'DIVIDEDBY',
+    '==': 'EQUALS',
+    '!=': 'NOTEQUAL',
+    '<': 'LESSTHAN',
+    '>': 'GREATERTHAN',
+    '<=': 'LESSTHANOREQUAL',
+    '>=': 'GREATERTHANOREQUAL',
+    '(': 'LPAREN',
+    ')': 'RPAREN',
+    '[': 'LBRACKET',
+    ']': 'RBRACKET',
+    '.': 'DOT',
+    '=': 'ASSIGN',
+    ':': 'COLON',
+    ',': 'COMMA',
+}
+
+BRACKET_DEPTH_CHANGES = {'(': 1, '[': 1, ')': -1, ']': -1}
+
+
+class Scanner(object):
+    """Hand-written tokenizer that produces the same tokens as a
+    FileLexer wrapping a LineLexer, in a single pass over the program.
+
+    Rather than splitting the program into logical lines and lexing each
+    one with PLY, the scanner matches one token after another through
+    the program, tracking the bracket depth and indentation as it goes.
+    A newline only ends the logical line outside of brackets, and a
+    backslash at the end of a line continues it.
+
+    Tokens have their line number and their offset in the program as
+    lineno and lexpos.
+    """
+
+    def tokenize(self, program, line_starts=None):
+        """
+        @param program: The text of the program, or an iterable of
+        chunks of it. Tokens are matched across the whole program, so
+        chunks are joined up front, except that a file on disk is
+        scanned through a memory map of the whole file.
+        @param line_starts: If given, a list or array that the offset of
+        each physical line is appended to as the line is reached.
+        """
+        if isinstance(program, basestring):
+            return self._tokenize(program, line_starts)
+        elif is_mappable(program):
+            return self._tokenize_mapped_file(program, line_starts)
+        else:
+            return self._tokenize(''.join(program), line_starts)
+
+    def _tokenize_mapped_file(self, program_file, line_starts):
+        mapped = mmap.mmap(program_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for token in self._tokenize(mapped, line_starts):
+                yield token
+        finally:
+            mapped.close()
+
+    def _tokenize(self, program, line_starts):
+        """
+        @param program: A string, or a buffer such as an mmap.
+        """
+        if line_starts is None:
+            # Collect them anyway rather than checking on every line.
+            line_starts = []
+        line_starts.append(0)
+        reserved_words = LineLexer.reserved_words
+        string_literal_value = LineLexer.string_literal_value
+        indentation_levels = [0]
+        bracket_depth = 0
+        lineno = 1
+        # The indentation of the current line, until its first token has
+        # been seen.
+        indentation = INDENTATION_PATTERN.match(program).group()
+        # Whether the last thing seen was a line continuation.
+        continued = False
+
+        for match in TOKEN_PATTERN.finditer(program, len(indentation)):
+            kind = match.lastgroup
+            text = match.group(kind)
+            if kind == 'NEWLINE':
+                if bracket_depth <= 0:
+                    if indentation is None:
+                        yield self._create_token('NEWLINE', '', lineno,
+                                                 match.start(kind))
+                    # Otherwise the line was blank, so it is ignored.
+                    indentation = text[1:]
+                    continued = False
+                lineno += 1
+                line_starts.append(match.start(kind) + 1)
+                continue
+            elif kind == 'CONTINUATION':
+                lineno += 1
+                line_starts.append(match.end())
+                continued = True
+                continue
+            elif kind == 'ERROR':
+                raise SyntaxError('Unexpected character %r on line %d' %
+                                  (text, lineno))
+            lexpos = match.end() - len(text)
+
+            if indentation is not None:
+                for token in self._change_indentation(
+                        indentation, indentation_levels, lineno, lexpos):
+                    yield token
+                indentation = None
+
+            token = LexToken()
+            if kind == 'ID':
+                token.type = reserved_words.get(text, 'ID')
+                if text == 'True' or text == 'False':
+                    token.value = (text == 'True')
+                else:
+                    token.value = text
+            elif kind == 'OPERATOR':
+                token.type = OPERATORS[text]
+                token.value = text
+                bracket_depth += BRACKET_DEPTH_CHANGES.get(text, 0)
+            elif kind == 'NUMBER':
+                token.type = 'NUMBER'
+                token.value = int(text)
+            else:
+                token.type = 'STRING'
+                token.value = string_literal_value(text)
+            token.lineno = lineno
+            token.lexpos = lexpos
+            yield token
+            if kind == 'STRING' and '\n' in text:
+                lineno += text.count('\n')
+                newline = text.find('\n')
+                while newline != -1:
+                    line_starts.append(lexpos + newline + 1)
+                    newline = text.find('\n', newline + 1)
+            continued = False
+
+        if bracket_depth != 0 or continued:
+            raise SyntaxError('Unexpected end of file.')
+        if indentation is None:
+            yield self._create_token('NEWLINE', '', lineno, len(program))
+        while indentation_levels[-1] > 0:
+            yield self._create_token('DEDENT', '', lineno, len(program))
+            indentation_levels.pop()
+
+    def _change_indentation(self, indentation, indentation_levels, lineno,
+                            lexpos):
+        """
+        Generates the INDENT or DEDENT tokens for the start of a logical
+        line with the given indentation, updating indentation_levels.
+        """
+        if '\t' in indentation:
+            indentation_level = self._get_indentation_level(indentation)
+        else:
+            indentation_level = len(indentation)
+        if indentation_level > indentation_levels[-1]:
+            yield self._create_token('INDENT', '', lineno, lexpos)
+            indentation_levels.append(indentation_level)
+        elif indentation_level < indentation_levels[-1]:
+            while indentation_level < indentation_levels[-1]:
+                yield self._create_token('DEDENT', '', lineno, lexpos)
+                indentation_levels.pop()
+            if indentation_level != indentation_levels[-1]:
+                raise SyntaxError(
+                    'Cannot dedent to a level not previously given.')
+
+    def _get_indentation_level(self, indentation):
+        """
+        Gets the number of "spaces" in the given indentation, where tabs
+        advance to the next multiple of 8.
+        """
+        current_level = 0
+        for char in indentation:
+            if char == ' ':
+                current_level += 1
+            else:
+                current_level += 8 - current_level % 8
+        return current_level
+
+    def _create_token(self, type, value, lineno, lexpos):
+        token = LexToken()
+        token.type = type
+        token.value = value
+        token.lineno = lineno
+        token.lexpos = lexpos
+        return token
@@ -0,0 +1,77 @@
+import unittest
+
+import lexer_test
+from lexer import create_lexer
+from lexer_test import (num, ident, string, colon, newline, indent, dedent,
+                        print_token, if_token)
+
+
+class ScannerTest(lexer_test.LexerTest):
+    """Runs the full lexer test suite on the hand-written Scanner."""
+    tokenizer = 'scanner'
+
+    def test_brackets_in_string(self):
+        self.assert_tokens(
+            '''
+print '(['
+print 5''',
+            [print_token, string('(['), newline, print_token, num(5),
+             newline])
+
+    def test_nested_dedent(self):
+        self.assert_tokens(
+            '''
+if x:
+    if y:
+        print 1
+print 2''',
+            [if_token, ident('x'), colon, newline, indent, if_token,
+             ident('y'), colon, newline, indent, print_token, num(1),
+             newline, dedent, dedent, print_token, num(2), newline])
+
+    def test_inconsistent_dedent(self):
+        self.assert_lex_failure(
+            'if x:\n'
+            '    print 1\n'
+            '  print 2')
+
+    def test_unclosed_bracket(self):
+        self.assert_lex_failure('x = (1 +\n2')
+
+    def test_continuation_at_end_of_file(self):
+        self.assert_lex_failure('x = 1 + \\\n')
+
+    def test_unexpected_character(self):
+        self.assert_lex_failure('x = 1 $ 2')
+
+    def test_matches_ply_lexer(self):
+        program = r'''
+class Counter(object):
+    def increment(self, amount):
+        self.count = self.count + amount * 2 - 1 / 1
+def check(a, b):
+    if a == b and a != None or not a is b:
+        print "equal\t" + r'raw\n'
+    while a <= b and b >= a and a < b or b > a:
+        a = [a, b,
+             True, False][0]
+x = 1 + \
+    2
+pass
+'''
+        scanned = [(tok.type, tok.value, tok.lineno, tok.lexpos)
+                   for tok in self.get_tokens(program)]
+        lexer = create_lexer(tokenizer='ply')
+        lexer.input(program)
+        lexed = []
+        while True:
+            token = lexer.token()
+            if not token:
+                break
+            lexed.append((token.type, token.value, token.lineno,
+                          token.lexpos))
+        self.assertEqual(lexed, scanned)
+
+
+if __name__ == '__main__':
+    unittest.main()
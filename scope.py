@@ -30,3 +30,92 @@ class ScopeChain(object):
 
     def assign_name(self, name, value):
         self.mappings[name] = value
+
+    def load_local(self, depth, index):
+        """Reads slot index of the SlotScope depth levels up the chain."""
+        scope = self
+        while depth:
+            scope = scope.parent
+            depth -= 1
+        return scope.load_slot(index)
+
+
+class SlotScope(ScopeChain):
+    """
+    The scope of a single function call. Rather than a mapping, locals
+    are stored in a fixed-size list of slots, so that code that has been
+    resolved ahead of time can access them by index. Unassigned slots
+    hold None.
+
+    Name-based access still works, for code such as class bodies that is
+    not statically resolved.
+    """
+    def __init__(self, parent, local_names, slots):
+        """
+        @type parent: ScopeChain
+        @type local_names: tuple
+        @param local_names: The name of the variable in each slot.
+        @type slots: list
+        """
+        self.parent = parent
+        self.local_names = local_names
+        self.slots = slots
+
+    def resolve_name(self, name):
+        try:
+            index = self.local_names.index(name)
+        except ValueError:
+            return self.parent.resolve_name(name)
+        return self.load_slot(index)
+
+    def assign_name(self, name, value):
+        self.slots[self.local_names.index(name)] = value
+
+    def load_slot(self, index):
+        value = self.slots[index]
+        if value is None:
+            raise UnboundLocalError(
+                "local variable '" + self.local_names[index] +
+                "' referenced before assignment")
+        return value
+
+
+class FramePool(object):
+    """
+    Free SlotScopes for the calls of a single function, so that calls
+    reuse a scope rather than allocating a new one. This is only safe for
+    functions whose scope can't outlive the call, i.e. functions that
+    don't define any functions or classes.
+    """
+    def __init__(self, parent, local_names, param_count):
+        """
+        @type parent: ScopeChain
+        @type local_names: tuple
+        @type param_count: int
+        """
+        self.parent = parent
+        self.local_names = local_names
+        self.param_count = param_count
+        self.free_scopes = []
+        self.unbound_locals = (None,) * (len(local_names) - param_count)
+
+    def acquire(self, args):
+        """
+        @return: A SlotScope with the parameters set to args and every
+        other local unassigned.
+        @rtype: SlotScope
+        """
+        free_scopes = self.free_scopes
+        if free_scopes:
+            scope = free_scopes.pop()
+            slots = scope.slots
+            slots[:self.param_count] = args
+            slots[self.param_count:] = self.unbound_locals
+            return scope
+        slots = list(args)
+        slots.extend(self.unbound_locals)
+        return SlotScope(self.parent, self.local_names, slots)
+
+    def release(self, scope):
+        """Returns a scope from acquire() once its call has finished."""
+        self.free_scopes.append(scope)
@@ -0,0 +1,294 @@
+from appy_ast import TypeValue, FunctionData
+from bytecode import (BytecodeCompiler, LOAD_CONST, LOAD_NAME, STORE_NAME,
+                      LOAD_ATTR, STORE_ATTR, GET_ITEM, SET_ITEM, BINARY_OP,
+                      IS, BUILD_LIST, CALL, MAKE_FUNCTION, ENTER_CLASS,
+                      BUILD_TYPE, PRINT, POP, JUMP, JUMP_IF_FALSE,
+                      RETURN_VALUE, LOAD_FAST, STORE_FAST, LOAD_DEREF,
+                      LOAD_METHOD, CALL_METHOD, JUMP_IF_FALSE_OR_POP,
+                      JUMP_IF_TRUE_OR_POP, LINE, GET_ITER, FOR_ITER,
+                      BUILD_SLICE)
+from builtin_types import BudgetedBuiltin, lookup_type_attribute
+from interpreter import ExecutionEnvironment
+
+
+class Frame(object):
+    """The execution state of a single Code object."""
+
+    def __init__(self, code, scope_chain, function_data=None):
+        """
+        @type code: Code
+        @type scope_chain: ScopeChain
+        @type function_data: FunctionData
+        @param function_data: The function being called, if this is the
+        frame of a user-defined function call.
+        """
+        self.code = code
+        self.scope_chain = scope_chain
+        self.function_data = function_data
+        self.stack = []
+        self.pc = 0
+
+
+class BytecodeEnvironment(ExecutionEnvironment):
+    """Execution engine that compiles the AST to bytecode and runs it on
+    a stack-based virtual machine.
+
+    Calls to user-defined functions from bytecode push a new Frame
+    rather than recursing in the host, so deeply recursive APPy code
+    does not use up the Python stack and is only limited by
+    max_call_depth. Calls that come from builtins (e.g. bound methods)
+    start a nested run of the VM.
+    """
+
+    def __init__(self, stdout_handler, type_context, scope_chain=None,
+                 **kwargs):
+        ExecutionEnvironment.__init__(
+            self, stdout_handler, type_context, scope_chain, **kwargs)
+        self.compiler = BytecodeCompiler(
+            type_context, trace_lines=self.profiler is not None)
+
+    def execute_statement(self, statement):
+        code = self.compiler.compile_statement(statement)
+        self.run(Frame(code, self.scope_chain))
+
+    def evaluate_expression(self, expression):
+        '''
+        @rtype: Value
+        '''
+        code = self.compiler.compile_expression(expression)
+        return self.run(Frame(code, self.scope_chain))
+
+    def _call_function_data(self, data, args):
+        return self.run(self._create_function_frame(data, args))
+
+    def _create_function_frame(self, data, args):
+        """
+        Enters the call, which is exited when the frame returns.
+        @type data: FunctionData
+        """
+        return Frame(self.compiler.get_function_code(data.body),
+                     self._enter_call(data, args), data)
+
+    def run(self, frame):
+        """Runs the frame until it returns, including any user-defined
+        functions that it calls.
+        @type frame: Frame
+        @return: The Value returned by the frame.
+        """
+        frames = [frame]
+        try:
+            return self._run(frames)
+        finally:
+            # Frames still live when the run ends were interrupted by an
+            # exception, and their calls are exited as the tree engine's
+            # would be, innermost first.
+            while frames:
+                frame = frames.pop()
+                if frame.function_data is not None:
+                    self._exit_call(frame.function_data, frame.scope_chain)
+
+    def _run(self, frames):
+        """
+        @param frames: The live frames of the run, innermost last. Only
+        the innermost one is running.
+        """
+        type_context = self.type_context
+        function_type = type_context.function_type
+        type_type = type_context.type_type
+        list_value = type_context.list_value
+        bool_value = type_context.bool_value
+        evaluate_attr = self._evaluate_attr
+        evaluate_attr_on_type = self._evaluate_attr_on_type
+        call_type_attribute = self._call_type_attribute
+        iterate = self._iterate
+        create_function = self._create_function
+        exit_call = self._exit_call
+        get_primitive_operator = type_context.primitive_operators.get
+        stdout_handler = self.stdout_handler
+        profiler = self.profiler
+        budget = self.budget
+
+        frame = frames[-1]
+        instructions = frame.code.instructions
+        constants = frame.code.constants
+        names = frame.code.names
+        stack = frame.stack
+        scope = frame.scope_chain
+        pc = frame.pc
+
+        while True:
+            opcode = instructions[pc]
+            arg = instructions[pc + 1]
+            pc += 2
+
+            if opcode == LOAD_FAST:
+                value = scope.slots[arg]
+                if value is None:
+                    value = scope.load_slot(arg)
+                stack.append(value)
+            elif opcode == STORE_FAST:
+                scope.slots[arg] = stack.pop()
+            elif opcode == LOAD_CONST:
+                stack.append(constants[arg])
+            elif opcode == LOAD_NAME:
+                stack.append(scope.resolve_name(names[arg]))
+            elif opcode == STORE_NAME:
+                scope.assign_name(names[arg], stack.pop())
+            elif opcode == BINARY_OP:
+                right = stack.pop()
+                left = stack.pop()
+                op_name = names[arg]
+                primitive_operator = get_primitive_operator(
+                    (op_name, id(left.type), id(right.type)))
+                if primitive_operator is not None:
+                    stack.append(primitive_operator(left.data, right.data))
+                else:
+                    method = lookup_type_attribute(left.type, op_name)
+                    stack.append(call_type_attribute(left, method, right))
+            elif opcode == JUMP_IF_FALSE:
+                if not stack.pop().data:
+                    pc = arg
+            elif opcode == JUMP:
+                # Only loops jump, so every jump is a loop iteration.
+                pc = arg
+                if budget is not None:
+                    budget.tick()
+            elif opcode == FOR_ITER:
+                # Values are never None, so None means it is exhausted.
+                value = next(stack[-1], None)
+                if value is None:
+                    stack.pop()
+                    pc = arg
+                else:
+                    stack.append(value)
+            elif opcode == GET_ITER:
+                stack.append(iter(iterate(stack.pop())))
+            elif opcode == JUMP_IF_FALSE_OR_POP:
+                if stack[-1].data:
+                    stack.pop()
+                else:
+                    pc = arg
+            elif opcode == JUMP_IF_TRUE_OR_POP:
+                if stack[-1].data:
+                    pc = arg
+                else:
+                    stack.pop()
+            elif opcode == CALL or opcode == CALL_METHOD:
+                if arg:
+                    args = stack[-arg:]
+                    del stack[-arg:]
+                else:
+                    args = []
+                if opcode == CALL_METHOD:
+                    self_value = stack.pop()
+                    if self_value is not None:
+                        args.insert(0, self_value)
+                func = stack.pop()
+                while func.type is not function_type:
+                    try:
+                        func = evaluate_attr_on_type(func, '__call__')
+                    except TypeError:
+                        raise TypeError("'%s' object is not callable" %
+                                        str(func.type.data))
+                data = func.data
+                if isinstance(data, FunctionData):
+                    frame.pc = pc
+                    frame = self._create_function_frame(data, args)
+                    frames.append(frame)
+                    instructions = frame.code.instructions
+                    constants = frame.code.constants
+                    names = frame.code.names
+                    stack = frame.stack
+                    scope = frame.scope_chain
+                    pc = frame.pc
+                elif type(data) is BudgetedBuiltin:
+                    stack.append(data.func(budget, *args))
+                else:
+                    stack.append(data(*args))
+            elif opcode == POP:
+                stack.pop()
+            elif opcode == GET_ITEM:
+                key = stack.pop()
+                obj = stack.pop()
+                stack.append(call_type_attribute(
+                    obj, lookup_type_attribute(obj.type, '__getitem__'), key))
+            elif opcode == SET_ITEM:
+                key = stack.pop()
+                obj = stack.pop()
+                call_type_attribute(
+                    obj, lookup_type_attribute(obj.type, '__setitem__'), key,
+                    stack.pop())
+            elif opcode == LOAD_METHOD:
+                obj = stack.pop()
+                method_name = names[arg]
+                attributes = obj.attributes
+                if method_name in attributes:
+                    stack.append(attributes[method_name])
+                    stack.append(None)
+                else:
+                    method = lookup_type_attribute(obj.type, method_name)
+                    stack.append(method)
+                    if method.type is function_type:
+                        stack.append(obj)
+                    else:
+                        stack.append(None)
+            elif opcode == LOAD_ATTR:
+                stack.append(evaluate_attr(stack.pop(), names[arg]))
+            elif opcode == STORE_ATTR:
+                obj = stack.pop()
+                obj.set_attribute(names[arg], stack.pop())
+            elif opcode == IS:
+                right = stack.pop()
+                stack.append(bool_value(stack.pop() is right))
+            elif opcode == BUILD_LIST:
+                if budget is not None:
+                    budget.allocate_lists(arg)
+                if arg:
+                    elements = stack[-arg:]
+                    del stack[-arg:]
+                else:
+                    elements = []
+                stack.append(list_value(elements))
+            elif opcode == BUILD_SLICE:
+                stop = stack.pop()
+                stack.append(type_context.slice_value(stack.pop(), stop))
+            elif opcode == PRINT:
+                stdout_handler(str(stack.pop().data))
+            elif opcode == RETURN_VALUE:
+                result = stack.pop()
+                frames.pop()
+                if frame.function_data is not None:
+                    exit_call(frame.function_data, scope)
+                if not frames:
+                    return result
+                frame = frames[-1]
+                instructions = frame.code.instructions
+                constants = frame.code.constants
+                names = frame.code.names
+                stack = frame.stack
+                scope = frame.scope_chain
+                pc = frame.pc
+                stack.append(result)
+            elif opcode == LOAD_DEREF:
+                depth, index = constants[arg]
+                stack.append(scope.load_local(depth, index))
+            elif opcode == MAKE_FUNCTION:
+                stack.append(create_function(constants[arg], scope))
+            elif opcode == ENTER_CLASS:
+                frame.pc = pc
+                frame = Frame(constants[arg],
+                              scope.with_pushed_mappings({}))
+                frames.append(frame)
+                instructions = frame.code.instructions
+                constants = frame.code.constants
+                names = frame.code.names
+                stack = frame.stack
+                scope = frame.scope_chain
+                pc = frame.pc
+            elif opcode == BUILD_TYPE:
+                stack.append(
+                    TypeValue(type_type, names[arg], scope.mappings))
+            elif opcode == LINE:
+                profiler.line(arg)
+            else:
+                raise NotImplementedError('Unknown opcode ' + str(opcode))
@@ -0,0 +1,83 @@
+import unittest
+
+import interpreter_test
+from appy_ast import (Block, Assignment, PrintStatement, Variable, Literal,
+                      PrimitiveValue, BinaryOperator)
+from builtin_types import TypeContext
+from bytecode import (BytecodeCompiler, LOAD_CONST, STORE_NAME, LOAD_NAME,
+                      PRINT, RETURN_VALUE)
+
+
+class BytecodeEngineTest(interpreter_test.InterpreterTest):
+    """Runs the full interpreter test suite on the bytecode VM."""
+    engine = 'bytecode'
+
+    def test_deep_recursion(self):
+        self.interpreter.max_call_depth = 10000
+        self.assert_execute(
+            '''
+def count_down(n):
+    if n == 0:
+        print 'Done'
+    if n > 0:
+        count_down(n - 1)
+count_down(5000)''',
+            'Done\n')
+
+    def test_method_call_from_function(self):
+        self.assert_execute(
+            '''
+class Counter(object):
+    def increment(self):
+        self.count = self.count + 1
+
+def increment_twice(counter):
+    counter.increment()
+    counter.increment()
+
+c = Counter()
+c.count = 0
+increment_twice(c)
+print c.count''',
+            '2\n')
+
+
+class BytecodeCompilerTest(unittest.TestCase):
+    def setUp(self):
+        self.type_context = TypeContext()
+        self.compiler = BytecodeCompiler(self.type_context)
+
+    def test_compile_statement(self):
+        five = Literal(self.int_value(5))
+        code = self.compiler.compile_statement(Block((
+            Assignment(Variable('x'), five),
+            PrintStatement(Variable('x')))))
+        self.assertEqual(
+            [LOAD_CONST, 0, STORE_NAME, 0, LOAD_NAME, 0, PRINT, 0,
+             LOAD_CONST, 1, RETURN_VALUE, 0],
+            code.instructions)
+        self.assertEqual([five.value, self.type_context.none_value],
+                         code.constants)
+        self.assertEqual(['x'], code.names)
+
+    def test_disassemble(self):
+        code = self.compiler.compile_expression(Variable('x'))
+        self.assertEqual('   0 LOAD_NAME       0\n'
+                         '   2 RETURN_VALUE    0',
+                         code.disassemble())
+
+    def test_short_circuit(self):
+        code = self.compiler.compile_expression(
+            BinaryOperator('and', Variable('x'), Variable('y')))
+        self.assertEqual('   0 LOAD_NAME       0\n'
+                         '   2 JUMP_IF_FALSE_OR_POP 6\n'
+                         '   4 LOAD_NAME       1\n'
+                         '   6 RETURN_VALUE    0',
+                         code.disassemble())
+
+    def int_value(self, int_val):
+        return PrimitiveValue(self.type_context.int_type, int_val)
+
+
+if __name__ == '__main__':
+    unittest.main()